@@ -1 +1,7 @@
-from .main import app
+import os
+import sys
+
+# модули из lib импортируются как пакет верхнего уровня (так же, как при запуске app.py напрямую)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from .app import app  # noqa: E402
@@ -1,127 +1,552 @@
+import base64
+import calendar
+import functools
+import hmac
 import io
+import json
 import os
+import re
 import sqlite3
 import tempfile
-
-import pandas as pd
-from flask import Flask, jsonify, abort, request, send_file
-
-from lib.metadata_extractor import get_metadict
-from lib.classifier import get_parts
+import threading
+import time
+from urllib.parse import quote
+
+from flask import Flask, Response, g, jsonify, abort, make_response, request, send_file, stream_with_context
+
+from lib.classifier import get_registry, PREDICT_BATCH_SIZE
+from lib.db_pool import ConnectionPool
+from lib.export import (DOCUMENT_MIMETYPE, FORMATS, document_filename, iter_csv, iter_ndjson, iter_rows,
+                        write_document_xlsx, write_export, write_xlsx)
+from lib.export_jobs import ExportJobs
+from lib.http_cache import MIN_COMPRESS_SIZE, accepted_encoding, compress, make_etag, matching_etag
+from lib.ingest import ingest, is_prepared, make_record
+from lib.metadata_extractor import names_fallback_stats
+from lib.metrics import REGISTRY, render, server_timing, start_profile, stop_profile, timer
+from lib.parse_cache import ParseCache, pipeline_version
+from lib.schema import (FACETS, TERM_END, TERM_KINDS, has_facets, has_term_suffixes, has_terms, metadata_terms,
+                        read_generation, suffix_kind)
+from lib.pipeline import parse_row, parse_rows, parse_parts_many, readiness, warm_up
+from lib.search_index import FTS_TABLE, has_index, to_match_query
+from lib.ttl_cache import TTLCache
 
 app = Flask(__name__)
 app.config['JSON_AS_ASCII'] = False
+app.config['MODEL_WARM_UP'] = os.environ.get('MODEL_WARM_UP', '1') == '1'
+app.config['MAX_BATCH_DOCUMENTS'] = int(os.environ.get('MAX_BATCH_DOCUMENTS', 500))
+# больше документов в одном вызове predict не классифицируем, какой бы ?batch_size= ни пришел
+app.config['MAX_PREDICT_BATCH_SIZE'] = int(os.environ.get('MAX_PREDICT_BATCH_SIZE', 256))
+app.config['EXPORT_MAX_ROWS'] = int(os.environ.get('EXPORT_MAX_ROWS', 100000))
+app.config['MAX_FACET_VALUES'] = int(os.environ.get('MAX_FACET_VALUES', 1000))
+# POST /ingest выключен, пока не задан токен
+app.config['INGEST_TOKEN'] = os.environ.get('INGEST_TOKEN')
+# профилирование запросов (в обход кэшей) выключено, пока не задан токен
+app.config['PROFILE_TOKEN'] = os.environ.get('PROFILE_TOKEN')
+
+if app.config['MODEL_WARM_UP']:
+    # классификатор и natasha грузятся в фоне: процесс сразу отвечает на /livez, а трафик на него пускают по /readyz
+    warm_up()
+
+DB_PATH = os.environ.get('SUDACT_DB', 'sudact.sqlite')
+
+# каждый поток берет свое соединение только для чтения на время запроса
+DB_POOL = ConnectionPool(DB_PATH, size=int(os.environ.get('SUDACT_DB_POOL_SIZE', 8)))
+
+# решения суда не меняются, поэтому результаты разбора храним между запросами и перезапусками
+PARSE_CACHE = ParseCache(os.environ.get('PARSE_CACHE_DB', 'parse_cache.sqlite'),
+                         maxsize=int(os.environ.get('PARSE_CACHE_SIZE', 1024)))
+
+# число документов под фильтром нужно на каждой странице выдачи, а меняется только при загрузке новых решений
+COUNT_CACHE = TTLCache(maxsize=1024, ttl=int(os.environ.get('COUNT_CACHE_TTL', 300)))
+
+# загрузки этого процесса пишут в базу по одной; повторы между процессами отсекает lib.ingest.write_documents
+INGEST_LOCK = threading.Lock()
+
+# фоновые выгрузки и кэш готовых файлов
+EXPORT_JOBS = ExportJobs(os.environ.get('EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'judgment_exports')),
+                         max_bytes=int(os.environ.get('EXPORT_CACHE_BYTES', 1024 ** 3)),
+                         workers=int(os.environ.get('EXPORT_WORKERS', 2)))
+
+# готовые (сжатые) тела ответов; ключ содержит ETag, поэтому после перезагрузки базы записи просто не находятся
+RESPONSE_CACHE = TTLCache(maxsize=int(os.environ.get('RESPONSE_CACHE_SIZE', 256)), ttl=24 * 3600)
+
+# готовые xlsx отдельных документов, ключ -- (id, поколение базы, версия конвейера разбора)
+DOCUMENT_FILES = TTLCache(maxsize=int(os.environ.get('DOCUMENT_FILES_CACHE_SIZE', 128)), ttl=24 * 3600)
+
+
+def profile_requested():
+    """
+    ?profile=<токен> или заголовок X-Profile: <токен> -- в ответе Server-Timing с разбивкой по стадиям,
+    кэши не используются; без PROFILE_TOKEN или с чужим токеном запрос обслуживается как обычно
+    """
+    token = app.config['PROFILE_TOKEN']
+    if not token:
+        return False
+    value = request.headers.get('X-Profile') or request.args.get('profile') or ''
+    # compare_digest не принимает строки с не-ascii символами
+    return hmac.compare_digest(value.encode('utf-8'), token.encode('utf-8'))
+
+
+@app.before_request
+def start_request():
+    g.request_start = time.perf_counter()
+    if profile_requested():
+        g.profile = start_profile()
+
+
+@app.after_request
+def finish_request(response):
+    elapsed = time.perf_counter() - g.request_start
+    REGISTRY.observe_request(request.endpoint, response.status_code, elapsed)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        # для потоковых ответов (/documents/batch) -- только то, что сделано до начала отправки тела
+        response.headers['Server-Timing'] = server_timing(profile, elapsed)
+    return response
+
+
+@app.teardown_request
+def clear_profile(exc):
+    stop_profile()
+
+
+def db_state(db=None):
+    """
+    (поколение базы, время последней записи в секундах): счетчик из таблицы db_generation,
+    который увеличивает каждая запись через lib.ingest и lib.schema, поэтому две записи в один тик mtime
+    или checkpoint без смены mtime не оставляют старые ETag в силе
+    """
+    if db is None:
+        with DB_POOL.connection() as db:
+            return db_state(db)
+    state = read_generation(db)
+    if state is not None:
+        return tuple(state)
+    # база без lib.schema -- по mtime файлов; в режиме WAL запись сначала попадает в -wal
+    # и только при checkpoint -- в сам файл базы; пустой -wal создается при открытии соединения
+    stamps = []
+    for path in (DB_PATH, DB_PATH + '-wal'):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if stat.st_size or path == DB_PATH:
+            stamps.append(stat.st_mtime_ns)
+    return (max(stamps), max(stamps) / 10 ** 9) if stamps else (None, None)
+
+
+def db_generation(db=None):
+    """меняется при любой записи в базу: выгрузки и ETag, сделанные до нее, больше не годятся"""
+    return db_state(db)[0]
+
+
+def conditional(max_age, versioned=False):
+    """
+    условный GET для ответов, которые меняются только с базой:
+    ETag и Last-Modified по поколению базы, 304 без разбора и запросов к данным, сжатие gzip/br
+    предусловия проверяются, только когда ресурс существует: тело уже в RESPONSE_CACHE или view ответил 200
+    (If-None-Match: * на несуществующий документ -- 404, а не 304)
+    :param versioned: ответ зависит и от конвейера разбора (ETag включает его версию); Last-Modified
+        такому ответу не отдается и If-Modified-Since не проверяется -- время записи в базу не меняется
+        при смене модели, экстракторов или парсера
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if profile_requested():
+                return view(*args, **kwargs)
+            generation, modified = db_state()
+            etag = make_etag(request.full_path, generation, pipeline_version() if versioned else None)
+            encoding = accepted_encoding(request.headers.get('Accept-Encoding'))
+            if versioned:
+                modified = None
+            elif modified is not None and int(modified) >= int(time.time()):
+                # запись в эту же секунду: Last-Modified еще не отличит ее от следующей, обходимся ETag
+                modified = None
+            elif modified is not None:
+                modified = int(modified)
+
+            key = (etag, encoding)
+            cached = RESPONSE_CACHE.get(key)
+            if cached is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body, used = response.get_data(), None
+                if encoding is not None and len(body) >= MIN_COMPRESS_SIZE:
+                    body, used = compress(body, encoding), encoding
+                cached = (body, used, response.mimetype)
+                RESPONSE_CACHE.set(key, cached)
+
+            if request.if_none_match:
+                tag = matching_etag(request.headers.get('If-None-Match'), etag)
+            else:
+                since = request.if_modified_since
+                fresh = modified is not None and since is not None and calendar.timegm(since.utctimetuple()) >= modified
+                tag = etag if fresh else None
+
+            if tag is not None:
+                response = Response(status=304)
+            else:
+                body, used, mimetype = cached
+                response = Response(body, mimetype=mimetype)
+                if used is not None:
+                    response.headers['Content-Encoding'] = used
+                tag = etag if used is None else f'{etag}-{used}'
+
+            response.set_etag(tag)
+            if modified is not None:
+                response.last_modified = modified
+            response.headers['Cache-Control'] = f'public, max-age={max_age}'
+            response.vary.add('Accept-Encoding')
+            return response
+        return wrapper
+    return decorator
 
-db = sqlite3.connect('sudact.sqlite', check_same_thread=False)
 
 def get_law_data(db_id: int):
     sql = '''select id, name, url from uk_sections
     where level=3 and id=?'''
 
-    cursor = db.cursor()
-    cursor.execute(sql, (db_id,))
-    res = cursor.fetchone()
-    cursor.close()
+    with DB_POOL.connection() as db:
+        cursor = db.cursor()
+        cursor.execute(sql, (db_id,))
+        res = cursor.fetchone()
+        cursor.close()
     return res
 
 
 def parse_document(doc_id):
+    cached = PARSE_CACHE.get(doc_id) if not profile_requested() else None
+    if cached is not None:
+        return cached
+
     sql = '''select id, header, url, data
     from documents
     where id=?'''
-    cursor = db.cursor()
-    cursor.execute(sql, (doc_id,))
-    data = cursor.fetchone()
-    cursor.close()
+    with DB_POOL.connection() as db, timer('sql.document'):
+        cursor = db.cursor()
+        cursor.execute(sql, (doc_id,))
+        data = cursor.fetchone()
+        cursor.close()
     if data is None:
         abort(404)
-    db_id, header, url, html = data
-    try:
-        parsed = get_parts(html)
-    except ValueError:
-        parsed = "NON_STANDARD_DOCUMENT"
-    return {
-        'db_id': db_id,
-        'header': header,
-        'url': url,
-        'metadata': get_metadict(html),
-        'parsed': parsed,
-        # 'raw_html': html
+    result = parse_row(*data)
+    PARSE_CACHE.put(doc_id, result)
+    return result
+
+
+@app.route('/livez', methods=['GET'])
+def livez():
+    """процесс жив и обслуживает запросы (моделей и базы не касается)"""
+    return jsonify({'alive': True})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """503, пока прогрев не закончен: на холодный процесс трафик не направляют"""
+    res = readiness()
+    return jsonify(res), 200 if res['ready'] else 503
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    model = get_registry().status()
+    res = {
+        'application': 'Application Judgment',
+        'ready': model['ready'],
+        'warm_up': readiness(),
+        'model': model,
+        'parse_cache': PARSE_CACHE.stats(),
+        'count_cache': COUNT_CACHE.stats(),
+        'export_jobs': EXPORT_JOBS.stats(),
+        'names_fallback': names_fallback_stats(),
+        'db_pool': DB_POOL.stats()
+    }
+    return jsonify(res), 200 if model['ready'] else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """время стадий разбора и SQL, время ответов и статистика кэшей в текстовом формате Prometheus"""
+    gauges = {
+        'model': {'ready': get_registry().ready},
+        'parse_cache': PARSE_CACHE.stats(),
+        'count_cache': COUNT_CACHE.stats(),
+        'response_cache': RESPONSE_CACHE.stats(),
+        'export_jobs': EXPORT_JOBS.stats(),
+        'names_fallback': names_fallback_stats(),
+        'db_pool': DB_POOL.stats(),
     }
+    return Response(render(gauges), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/laws/', methods=['GET'])
+@conditional(max_age=300)
 def list_laws():
     sql = '''select id, name, url
     from uk_sections
     where level=3'''
 
-    cursor = db.cursor()
-    cursor.execute(sql)
-    data = [{
-        'db_id': db_id,
-        'name': name,
-        'url': url
-    } for db_id, name, url in cursor]
-    cursor.close()
+    with DB_POOL.connection() as db:
+        cursor = db.cursor()
+        cursor.execute(sql)
+        data = [{
+            'db_id': db_id,
+            'name': name,
+            'url': url
+        } for db_id, name, url in cursor]
+        cursor.close()
     return jsonify(data)
 
 
 @app.route('/regions/', methods=['GET'])
+@conditional(max_age=300)
 def list_regions():
-    cursor = db.cursor()
-    cursor.execute('select distinct(region) from metadata order by 1')
-    regions = [item for item, in cursor]
-    cursor.close()
+    with DB_POOL.connection() as db:
+        cursor = db.cursor()
+        if has_facets(db):
+            cursor.execute("select value from facet_counts where facet='region' order by 1")
+        else:
+            cursor.execute('select distinct(region) from metadata order by 1')
+        regions = [item for item, in cursor]
+        cursor.close()
     return jsonify(regions)
 
 
-def get_params():
+@app.route('/facets', methods=['GET'])
+@conditional(max_age=300)
+def list_facets():
+    """
+    число документов по регионам, годам, статьям и судьям под текущими фильтрами /documents/
+    ?facet=region&facet=year -- только эти фасеты, ?limit= -- сколько самых частых значений отдавать
+    """
+    _, _, params = get_params()
+    facets = request.args.getlist('facet') or list(FACETS)
+    if not set(facets) <= set(FACETS):
+        abort(400)
+    try:
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        abort(400)
+    limit = max(1, min(limit, app.config['MAX_FACET_VALUES']))
+
+    res = {}
+    with DB_POOL.connection() as db, timer('sql.facets'):
+        cursor = db.cursor()
+        for facet in facets:
+            cursor.execute(*facet_sql(db, facet, params, limit))
+            res[facet] = [{'value': value, 'count': count} for value, count in cursor]
+        cursor.close()
+    return jsonify(res)
+
+
+def encode_cursor(last_id):
+    """непрозрачный курсор для следующей страницы"""
+    return base64.urlsafe_b64encode(json.dumps({'id': last_id}).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """id, после которого начинается страница; пустой курсор -- первая страница"""
+    if not cursor:
+        return 0
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))['id'])
+    except (ValueError, KeyError, TypeError):
+        abort(400)
 
-    page_size = int(request.args.get('page_size', 50))
-    page_num = int(request.args.get('page_num', 1))
+
+def get_filter(args, name):
+    """значение фильтра из запроса; пустое значение и '%' -- фильтр не задан"""
+    value = args.get(name, '').strip()
+    return None if value in ('', '%') else value
+
+
+def get_params(args=None):
+    args = request.args if args is None else args
+
+    page_size = int(args.get('page_size', 50))
+    page_num = int(args.get('page_num', 1))
 
     params = {
         'limit': page_size,
         'offset': (page_num - 1) * page_size,
-        'year': request.args.get('year', '%'),
-        'region': request.args.get('region', '%'),
-        'article': f'%{request.args.get("article", "")}%',
-        'judge': f'%{request.args.get("judge", "")}%'
+        'year': get_filter(args, 'year'),
+        'region': get_filter(args, 'region'),
+        'article': get_filter(args, 'article'),
+        'judge': get_filter(args, 'judge'),
+        'q': to_match_query(args.get('q', '')),
+        # с параметром cursor страницы листаются по d.id, без offset
+        'after_id': decode_cursor(args['cursor']) if 'cursor' in args else None
     }
+    if params['year'] is not None and not re.fullmatch(r'[0-9]{4}', params['year']):
+        abort(400)
 
     return page_size, page_num, params
 
 
-def query_sql(params, batches=True):
-
-    sql = '''select {selector}
+FILTER_KEYS = ('year', 'region', 'article', 'judge', 'q')
+
+DOCUMENT_COLUMNS = ''' d.id id, d.header header, d.url url, m.date date, m.number number, m.court court,
+    m.region region, m.judge judge, m.article article, m.accused accused, m.fabula fabula, m.witness witness,
+    m.prove prove, m.meditation meditation
+    '''
+
+
+def filter_sql(db, params):
+    """
+    условия where для заданных фильтров и параметры к ним
+    незаданные фильтры в запрос не попадают, остальные -- равенство или диапазон по индексу;
+    судья и статья -- кандидаты из суффиксов слов в metadata_terms (префикс суффикса -- подстрока слова,
+    поэтому находится и 'узнецов'), а прежний like '%...%' проверяет только их
+    (в термах нет инициалов: без like 'Кузнецов А.В.' находил бы и Кузнецова И.И.)
+    """
+    conditions, args = [], {}
+    if params.get('year'):
+        conditions.append('m.date >= :date_from and m.date < :date_to')
+        args['date_from'] = f"{params['year']}-01-01"
+        args['date_to'] = f"{int(params['year']) + 1}-01-01"
+    if params.get('region'):
+        conditions.append('m.region = :region')
+        args['region'] = params['region']
+
+    terms_indexed = has_term_suffixes(db)
+    for kind in TERM_KINDS:
+        if not params.get(kind):
+            continue
+        conditions.append(f'm.{kind} like :{kind}')
+        args[kind] = f'%{params[kind]}%'
+        if not terms_indexed:
+            # база без lib.schema (или со схемой до суффиксов) -- только поиск по подстроке
+            continue
+        for i, term in enumerate(metadata_terms(kind, params[kind])):
+            conditions.append(f'''m.document_id in (select document_id from metadata_terms
+                where kind='{suffix_kind(kind)}' and term >= :{kind}_{i} and term < :{kind}_{i}_end)''')
+            args[f'{kind}_{i}'] = term
+            args[f'{kind}_{i}_end'] = term + TERM_END
+
+    if params.get('q'):
+        if not has_index(db):
+            abort(503)
+        conditions.append(f'{FTS_TABLE} match :q')
+        args['q'] = params['q']
+    return conditions, args
+
+
+def documents_sql(db, params, selector=None, page=None):
+    """
+    запрос к документам под фильтрами params
+    :param selector: выбираемые колонки; None -- только count(*)
+    :param page: None -- без ограничений, 'offset' -- страница по номеру, 'keyset' -- страница после :after_id
+    """
+    conditions, args = filter_sql(db, params)
+    join, order = '', 'd.id'
+    if params.get('q'):
+        # полнотекстовый поиск: сначала самые релевантные (кроме постраничного обхода по курсору)
+        join = f'join {FTS_TABLE} on {FTS_TABLE}.rowid=d.id'
+        order = 'd.id' if page == 'keyset' else f'{FTS_TABLE}.rank, d.id'
+    if page == 'keyset':
+        conditions.append('d.id > :after_id')
+        args['after_id'] = params['after_id']
+
+    sql = f'''select {selector or 'count(*) as count'}
         from documents d
         join metadata m on m.document_id=d.id
-        where substr(m.date, 1, 4) like :year
-         and m.region like :region
-         and m.article like :article
-         and judge like :judge
-        order by d.id
-        '''
-
-    selector = ''' d.id id, d.header header, d.url url, m.date date, m.number number, m.court court, m.region region,
-        m.judge judge, m.article article, m.accused accused, m.fabula fabula, m.witness witness, m.prove prove, 
-        m.meditation meditation
+        {join}
+        {'where ' + ' and '.join(conditions) if conditions else ''}
         '''
+    if selector is not None:
+        sql += f' order by {order}'
+    if page is not None:
+        sql += ' limit :limit'
+        args['limit'] = params['limit']
+    if page == 'offset':
+        sql += ' offset :offset'
+        args['offset'] = params['offset']
+    return sql, args
+
+
+def count_documents(db, params):
+    """
+    число документов под фильтром; одинаковые фильтры приходят на каждой странице, поэтому кэшируем
+    (в ключе поколение базы: после загрузки новых решений счетчики считаются заново)
+    """
+    key = (db_generation(db), *(params.get(name) for name in FILTER_KEYS))
+    size = COUNT_CACHE.get(key)
+    if size is None:
+        with timer('sql.count'):
+            cursor = db.cursor()
+            cursor.execute(*documents_sql(db, params))
+            size, = cursor.fetchone()
+            cursor.close()
+        COUNT_CACHE.set(key, size)
+    return size
+
+
+# значение фасета в запросе и условие, отбрасывающее пустые значения
+FACET_COLUMNS = {
+    'region': ('m.region', "m.region != ''"),
+    'year': ('substr(m.date, 1, 4)', "m.date glob '[0-9][0-9][0-9][0-9]*'"),
+    'article': ('m.article', "m.article != ''"),
+    'judge': ('m.judge', "m.judge != ''"),
+}
+
+
+def facet_sql(db, facet, params, limit):
+    """
+    один group by: число документов по значениям фасета под остальными фильтрами
+    собственный фильтр фасета не применяется, чтобы были видны и соседние значения;
+    без остальных фильтров счетчики берутся готовыми из facet_counts
+    """
+    conditions, args = filter_sql(db, dict(params, **{facet: None}))
+    args['facet_limit'] = limit
+    if not conditions and has_facets(db):
+        args['facet'] = facet
+        return '''select value, count from facet_counts
+            where facet=:facet
+            order by count desc, value
+            limit :facet_limit''', args
+
+    joins = []
+    if params.get('q'):
+        joins.append(f'join {FTS_TABLE} on {FTS_TABLE}.rowid=d.id')
+    value, condition = FACET_COLUMNS[facet]
+    if facet == 'article' and has_terms(db):
+        # статьи считаем по отдельным номерам, как в фильтре
+        joins.append("join metadata_terms t on t.document_id=m.document_id and t.kind='article'")
+        value, condition = 't.term', None
+    if condition is not None:
+        conditions.append(condition)
+    sql = f'''select {value} value, count(*) count
+        from documents d
+        join metadata m on m.document_id=d.id
+        {' '.join(joins)}
+        {'where ' + ' and '.join(conditions) if conditions else ''}
+        group by 1
+        order by 2 desc, 1
+        limit :facet_limit'''
+    return sql, args
 
-    cursor = db.cursor()
 
-    cursor.execute(sql.format(selector='count(*) as count'), params)
-    size, = cursor.fetchone()
+def query_sql(params, batches=True):
 
+    selector = DOCUMENT_COLUMNS
+    page = None
     if batches:
-        sql += ' limit :limit offset :offset'
-
-    cursor.execute(sql.format(selector=selector), params)
-    column_names = [desc[0] for desc in cursor.description]
-    # cursor.close()
-    return size, [dict(zip(column_names, item)) for item in cursor.fetchall()]
+        page = 'offset' if params.get('after_id') is None else 'keyset'
+        if params.get('q'):
+            # на страницах выдачи -- фрагмент текста с подсветкой найденного
+            selector += f", snippet({FTS_TABLE}, -1, '<b>', '</b>', '…', 24) snippet"
+
+    with DB_POOL.connection() as db:
+        size = count_documents(db, params)
+        with timer('sql.documents'):
+            cursor = db.cursor()
+            cursor.execute(*documents_sql(db, params, selector, page))
+            column_names = [desc[0] for desc in cursor.description]
+            data = [dict(zip(column_names, item)) for item in cursor.fetchall()]
+            cursor.close()
+    return size, data
 
 
 @app.route('/documents/', methods=['GET'])
@@ -135,11 +560,14 @@ def get_documents():
         'pages': (size-1) // page_size + 1,
         'documents': query
     }
+    if params['after_id'] is not None:
+        res['next_cursor'] = encode_cursor(query[-1]['id']) if len(query) == page_size else None
 
     return jsonify(res)
 
 
 @app.route('/laws/<int:law_id>', methods=['GET'])
+@conditional(max_age=300)
 def get_law(law_id: int):
     res = get_law_data(law_id)
     if res is None:
@@ -149,73 +577,243 @@ def get_law(law_id: int):
 
 
 @app.route('/documents/<int:doc_id>')
+@conditional(max_age=7 * 24 * 3600, versioned=True)
 def parse_doc(doc_id):
     return jsonify(parse_document(doc_id))
 
 
+def fetch_rows(doc_ids):
+    """строки documents (id, header, url, data) по id одним запросом: {id: строка}"""
+    if not doc_ids:
+        return {}
+    sql = '''select id, header, url, data
+    from documents
+    where id in ({})'''.format(', '.join('?' * len(doc_ids)))
+    with DB_POOL.connection() as db, timer('sql.documents_batch'):
+        return {row[0]: row for row in db.execute(sql, doc_ids)}
+
+
+@app.route('/ingest', methods=['POST'])
+def ingest_documents():
+    """
+    загрузка новых решений: {"documents": [{"html", "url", "header"}, ...]} -> сколько добавлено, повторов и ошибок
+    работает, только если задан INGEST_TOKEN; запрос несет заголовок Authorization: Bearer <токен>
+    база готовится заранее (python -m lib.ingest --prepare), иначе -- 503: backfill sha1 всех документов
+    в запросе не уложится в таймаут воркера
+    """
+    token = app.config['INGEST_TOKEN']
+    if not token:
+        abort(404)
+    # compare_digest не принимает строки с не-ascii символами
+    authorization = request.headers.get('Authorization', '').encode('utf-8')
+    if not hmac.compare_digest(authorization, f'Bearer {token}'.encode('utf-8')):
+        abort(401)
+    items = (request.get_json(silent=True) or {}).get('documents')
+    if not isinstance(items, list):
+        abort(400)
+    if len(items) > app.config['MAX_BATCH_DOCUMENTS']:
+        abort(413)
+    try:
+        records = [make_record(item, f'documents[{i}]') for i, item in enumerate(items)]
+    except ValueError:
+        abort(400)
+
+    with INGEST_LOCK:
+        db = sqlite3.connect(DB_PATH, timeout=30)
+        try:
+            if not is_prepared(db):
+                abort(503)
+            stats = ingest(db, records, cache=PARSE_CACHE)
+        finally:
+            db.close()
+    return jsonify(stats)
+
+
+def get_batch_size():
+    """?batch_size= для пакетной классификации: нечисло -- по умолчанию, меньше 1 -- 400, сверху ограничен"""
+    batch_size = request.args.get('batch_size', PREDICT_BATCH_SIZE, type=int)
+    if batch_size < 1:
+        abort(400)
+    return min(batch_size, app.config['MAX_PREDICT_BATCH_SIZE'])
+
+
+@app.route('/documents/batch', methods=['POST'])
+def parse_docs():
+    """
+    разбор нескольких документов: {"ids": [id, ...]} -> ndjson, по строке на каждый id в том же порядке;
+    для ненайденного или неразобранного документа -- строка {"db_id", "status", "error"}
+    """
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    # id вне integer sqlite не влезает в параметр запроса
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) and -2 ** 63 <= i < 2 ** 63
+                                            for i in ids):
+        abort(400)
+    if len(ids) > app.config['MAX_BATCH_DOCUMENTS']:
+        abort(413)
+    batch_size = get_batch_size()
+
+    unique = list(dict.fromkeys(ids))
+    results = PARSE_CACHE.get_many(unique)
+    missing = [doc_id for doc_id in unique if doc_id not in results]
+    rows = fetch_rows(missing)
+    errors = {doc_id: {'db_id': doc_id, 'status': 404, 'error': 'not found'}
+              for doc_id in missing if doc_id not in rows}
+    pending = [rows[doc_id] for doc_id in missing if doc_id in rows]
+
+    def parse_next():
+        # следующая пачка непрочитанных из кэша документов, с пакетной классификацией
+        chunk = pending[:batch_size]
+        del pending[:batch_size]
+        parsed = []
+        for doc_id, result, error in parse_rows(chunk, batch_size=batch_size):
+            if error is None:
+                results[doc_id] = result
+                parsed.append((doc_id, result))
+            else:
+                errors[doc_id] = {'db_id': doc_id, 'status': 500, 'error': repr(error)}
+        if parsed:
+            PARSE_CACHE.put_many(parsed)
+
+    def generate():
+        for doc_id in ids:
+            while doc_id not in results and doc_id not in errors:
+                parse_next()
+            yield json.dumps(results.get(doc_id) or errors[doc_id], ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/parts/', methods=['POST'])
+def split_parts():
+    """части для присланных html-документов: {"documents": [html, ...]} -> [части, ...]"""
+    htmls = (request.get_json(silent=True) or {}).get('documents')
+    if not isinstance(htmls, list) or not all(isinstance(html, str) for html in htmls):
+        abort(400)
+    if len(htmls) > app.config['MAX_BATCH_DOCUMENTS']:
+        abort(413)
+    return jsonify(parse_parts_many(htmls, get_batch_size()))
+
+
+def export_rows(params):
+    """
+    строки выгрузки под фильтрами params (не больше EXPORT_MAX_ROWS) и число подходящих документов
+    соединение из пула занято, пока строки не дочитаны или генератор не закрыт
+    """
+    with DB_POOL.connection() as db:
+        size = count_documents(db, params)
+        sql, args = documents_sql(db, params, DOCUMENT_COLUMNS)
+    sql += ' limit :max_rows'
+    args['max_rows'] = app.config['EXPORT_MAX_ROWS']
+
+    def rows():
+        with DB_POOL.connection() as db:
+            yield from iter_rows(db.execute(sql, args))
+
+    return rows(), size
+
+
+def get_export_format(args):
+    export_format = args.get('format', 'xlsx')
+    if export_format not in FORMATS:
+        abort(400)
+    return export_format
+
+
 @app.route('/documents/download')
 def download_files():
     params = get_params()[-1]
+    export_format = get_export_format(request.args)
+    filename, mimetype = FORMATS[export_format]
+
+    rows, size = export_rows(params)
+    max_rows = app.config['EXPORT_MAX_ROWS']
+
+    def progress(rows):
+        app.logger.info('export %s: %d of %d rows', filename, rows, min(size, max_rows))
+
+    headers = {'X-Total-Count': str(size), 'X-Export-Truncated': '1' if size > max_rows else '0'}
+    if export_format == 'xlsx':
+        # временный файл без имени: удаляется сам, когда send_file его закроет
+        output = tempfile.TemporaryFile()
+        write_xlsx(rows, output, progress)
+        output.seek(0)
+        response = send_file(output, mimetype=mimetype, attachment_filename=filename, as_attachment=True,
+                             cache_timeout=-1)
+        response.headers.extend(headers)
+        return response
+
+    chunks = iter_csv(rows, progress) if export_format == 'csv' else iter_ndjson(rows, progress)
+    headers['Content-Disposition'] = "attachment; filename*=UTF-8''" + quote(filename)
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+
+def export_job_response(job, status=200):
+    job['status_url'] = f"/exports/{job['id']}"
+    job['file_url'] = f"/exports/{job['id']}/file"
+    return jsonify(job), status
+
+
+@app.route('/exports', methods=['POST'])
+def create_export():
+    """ставим выгрузку в очередь; фильтры -- как у /documents/download, в json, форме или строке запроса"""
+    args = request.values.to_dict()
+    args.update({key: str(value) for key, value in (request.get_json(silent=True) or {}).items()})
+    params = get_params(args)[-1]
+    export_format = get_export_format(args)
+    key = {name: params[name] for name in FILTER_KEYS}
+    key.update(generation=db_generation(), max_rows=app.config['EXPORT_MAX_ROWS'])
+
+    def build(output, progress):
+        rows, size = export_rows(params)
+        total = min(size, app.config['EXPORT_MAX_ROWS'])
+        progress(0, total)
+        write_export(rows, export_format, output, lambda done: progress(done, total))
+
+    job = EXPORT_JOBS.submit(key, export_format, build)
+    response, status = export_job_response(job, 202)
+    response.headers['Location'] = job['status_url']
+    return response, status
+
+
+@app.route('/exports/<job_id>', methods=['GET'])
+def get_export(job_id):
+    job = EXPORT_JOBS.get(job_id)
+    if job is None:
+        abort(404)
+    return export_job_response(job)
+
 
-    columns = ['id', 'Заголовок', 'Ссылка', 'Дата', 'Номер дела', 'Суд', 'Регион',
-               'Судья', 'Статья', 'Обвиняемый', 'Фабула', 'Показания свидетелей',
-               'Описание доказательств', 'Размышления судьи']
-    res = pd.DataFrame(query_sql(params, batches=False)[1])
-    res.columns = columns
-    res = res.drop('id', axis=1)
-    tmp_dir = tempfile.mkdtemp()
-    base_name = 'судебная_практика.xlsx'
-    filename = os.path.join(tmp_dir, base_name)
-    res.to_excel(filename, index=False)
-    return send_file(filename, attachment_filename=base_name, as_attachment=True, cache_timeout=-1)
+@app.route('/exports/<job_id>/file', methods=['GET'])
+def get_export_file(job_id):
+    job = EXPORT_JOBS.get(job_id)
+    if job is None:
+        abort(404)
+    if job['status'] != 'done':
+        abort(409)
+    filename, mimetype = FORMATS[job['format']]
+    return send_file(EXPORT_JOBS.path(job), mimetype=mimetype, attachment_filename=filename, as_attachment=True)
 
 
 @app.route('/documents/<int:doc_id>/download')
 def download_file(doc_id):
-    filename, file_data = create_file(doc_id)
-    return send_file(file_data, attachment_filename=filename, as_attachment=True)
+    filename, data = create_file(doc_id)
+    return send_file(io.BytesIO(data), mimetype=DOCUMENT_MIMETYPE, attachment_filename=filename, as_attachment=True)
 
 
 def create_file(doc_id):
+    """имя и содержимое xlsx по документу; разбор берется из кэша, готовый файл запоминается"""
+    key = (doc_id, db_generation(), pipeline_version())
+    cached = DOCUMENT_FILES.get(key) if not profile_requested() else None
+    if cached is not None:
+        return cached
     result = parse_document(doc_id)
-    metadata = result['metadata']
-    parsed = result['parsed']
-    table = pd.DataFrame(index=['Информация о документе', '', 'Фабула', 'Показания свидетелей',
-                                'Доказательства', 'Размышления судьи'],
-                         columns=['Номер', 'Дата', 'Статьи',
-                                  'Суд', 'Регион', 'Судья',
-                                  'Подсудимый(ые)', 'url'])
-
-    row = [result['header'], metadata['date'], metadata['article'], metadata['court'],
-           metadata['region'], metadata['judge'], ' '.join(metadata['accused']), result['url']]
-
-    table['Номер'][''] = 'Части документа:'
-    table['Номер']['Фабула':'Размышления судьи'] = ['\n'.join(parsed.get(item, '')) for item in
-                                                    ['fabula', 'witness', 'prove', 'meditation']]
-    table.iloc[0] = row
-
-    court = metadata['court'].split()[0] + '_'
-    no = result['header'].split('от')[0].strip()
-    no = no.replace('№', '').replace(r'/', '_').replace(' ', '_')
-
-    name = court + no
-    name = name.lower() + '.xlsx'
-
     output = io.BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    table.to_excel(writer, sheet_name='Sheet1')
-    writer.save()
-    writer.close()
-    output.seek(0)
-
-    return name, output
+    write_document_xlsx(result, output)
+    cached = (document_filename(result), output.getvalue())
+    DOCUMENT_FILES.set(key, cached)
+    return cached
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=3000, debug=True, threaded=False)
-
-
-if __name__ == "__main__":
-    app.run(host='0.0.0.0', debug=True, port=80)
-
-
+    # сервер разработки; в контейнере API работает под gunicorn (gunicorn.conf.py)
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=os.environ.get('FLASK_DEBUG') == '1')
@@ -0,0 +1,8 @@
+"""
+замеры производительности API и конвейера разбора
+
+запуск из каталога hseling_api_judgment, например:
+    python -m benchmarks.parts_batch --db sudact.sqlite
+
+синтетическая база -- benchmarks.corpus, полный набор замеров с результатом в json -- benchmarks.suite
+"""
@@ -0,0 +1,278 @@
+"""
+синтетическая sudact.sqlite для воспроизводимых замеров
+
+таблицы documents, metadata и uk_sections в формате судакта; html решений устроен так, как его читают
+get_metadict и split_sentences: h1 с номером и датой, суд в <div class="b-justice">, судья в h3,
+статья в <div class="b-practice">, текст строками через <br/>, части между УСТАНОВИЛ и ПРИГОВОРИЛ.
+metadata заполняется тем, что извлекает get_metadict, а части -- предложениями, из которых собран текст
+
+одни и те же --documents и --seed дают одну и ту же базу; строки генерируются и пишутся пачками,
+так что размер ограничен только диском (около 10 КБ на решение)
+
+    python -m benchmarks.corpus --db synthetic.sqlite --documents 1000000 --seed 1 --schema
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+from lib.metadata_extractor import ALL_REGIONS, resolve_court
+
+MONTHS = ['января', 'февраля', 'марта', 'апреля', 'мая', 'июня', 'июля', 'августа', 'сентября', 'октября',
+          'ноября', 'декабря']
+YEARS = range(2012, 2021)
+
+# самые частые статьи в приговорах: номер, название, глава
+ARTICLES = [
+    ('158', 'Кража', 'Преступления против собственности'),
+    ('158.1', 'Мелкое хищение, совершенное лицом, подвергнутым административному наказанию',
+     'Преступления против собственности'),
+    ('159', 'Мошенничество', 'Преступления против собственности'),
+    ('160', 'Присвоение или растрата', 'Преступления против собственности'),
+    ('161', 'Грабеж', 'Преступления против собственности'),
+    ('162', 'Разбой', 'Преступления против собственности'),
+    ('166', 'Неправомерное завладение автомобилем или иным транспортным средством без цели хищения',
+     'Преступления против собственности'),
+    ('105', 'Убийство', 'Преступления против жизни и здоровья'),
+    ('111', 'Умышленное причинение тяжкого вреда здоровью', 'Преступления против жизни и здоровья'),
+    ('112', 'Умышленное причинение средней тяжести вреда здоровью', 'Преступления против жизни и здоровья'),
+    ('119', 'Угроза убийством или причинением тяжкого вреда здоровью', 'Преступления против жизни и здоровья'),
+    ('228', 'Незаконные приобретение, хранение, перевозка, изготовление, переработка наркотических средств',
+     'Преступления против здоровья населения и общественной нравственности'),
+    ('228.1', 'Незаконные производство, сбыт или пересылка наркотических средств',
+     'Преступления против здоровья населения и общественной нравственности'),
+    ('264', 'Нарушение правил дорожного движения и эксплуатации транспортных средств',
+     'Преступления против безопасности движения и эксплуатации транспорта'),
+    ('264.1', 'Нарушение правил дорожного движения лицом, подвергнутым административному наказанию',
+     'Преступления против безопасности движения и эксплуатации транспорта'),
+    ('318', 'Применение насилия в отношении представителя власти', 'Преступления против порядка управления'),
+    ('319', 'Оскорбление представителя власти', 'Преступления против порядка управления'),
+    ('322.3', 'Фиктивная постановка на учет иностранного гражданина', 'Преступления против порядка управления'),
+]
+# кражи, наркотики и пьяные водители -- большая часть практики
+ARTICLE_WEIGHTS = [30, 6, 6, 2, 8, 3, 3, 2, 4, 3, 4, 12, 4, 1, 6, 2, 2, 2]
+
+COURT_NAMES = ['Ленинский', 'Советский', 'Кировский', 'Октябрьский', 'Центральный', 'Железнодорожный',
+               'Заводской', 'Индустриальный', 'Первомайский', 'Фрунзенский', 'Калининский', 'Промышленный']
+CITIES = ['Кемерово', 'Томска', 'Новосибирска', 'Омска', 'Барнаула', 'Красноярска', 'Иркутска', 'Перми',
+          'Уфы', 'Самары', 'Саратова', 'Воронежа', 'Курска', 'Пензы', 'Твери', 'Рязани']
+COURT_TYPES = ['Уголовное', 'Уголовное', 'Уголовное', 'Административные правонарушения']
+
+SURNAMES = ['Кузнецов', 'Орлов', 'Смирнов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов', 'Новиков',
+            'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров', 'Павлов', 'Козлов',
+            'Степанов', 'Николаев', 'Захаров', 'Зайцев', 'Соловьев', 'Борисов', 'Яковлев', 'Григорьев',
+            'Романов', 'Воробьев', 'Сергеев', 'Кузьмин', 'Фролов', 'Александров', 'Дмитриев', 'Королев',
+            'Гусев', 'Киселев', 'Ильин', 'Максимов', 'Поляков', 'Сорокин', 'Виноградов', 'Ковалев', 'Белов']
+INITIALS = 'АБВГДЕИКЛМНОПРСТЮЯ'
+
+INTRO = [
+    'при секретаре {secretary},',
+    'с участием государственного обвинителя помощника прокурора {prosecutor},',
+    'защитника адвоката {lawyer}, представившего удостоверение и ордер,',
+    'подсудимого {accused},',
+]
+
+FABULA = [
+    '{accused} {date} года около {hour} часов, находясь в состоянии алкогольного опьянения в квартире по месту '
+    'жительства потерпевшего, действуя умышленно из корыстных побуждений, тайно похитил сотовый телефон.',
+    'Реализуя свой преступный умысел, {accused} убедился, что за его действиями никто не наблюдает, и взял '
+    'с тумбочки имущество стоимостью {amount} рублей.',
+    'С похищенным имуществом {accused} с места преступления скрылся и распорядился им по своему усмотрению, '
+    'причинив потерпевшему значительный материальный ущерб на сумму {amount} рублей.',
+    '{date} года в дневное время {accused}, имея умысел на незаконное приобретение наркотического средства '
+    'без цели сбыта, через тайник-закладку приобрел вещество массой {weight} грамма.',
+    'Приобретенное вещество {accused} незаконно хранил при себе до {hour} часов, когда был задержан '
+    'сотрудниками полиции у дома по улице Садовой.',
+    '{accused}, будучи подвергнутым административному наказанию за управление транспортным средством '
+    'в состоянии опьянения, вновь сел за руль автомобиля и начал движение.',
+]
+WITNESS = [
+    'Свидетель {witness} в судебном заседании показал, что {date} года находился дома, когда услышал шум '
+    'в подъезде.',
+    'Допрошенная в качестве свидетеля {witness} пояснила, что подсудимого знает давно, характеризует его '
+    'с удовлетворительной стороны.',
+    'Из оглашенных показаний свидетеля {witness} следует, что он работает оперуполномоченным и участвовал '
+    'в задержании подсудимого.',
+    'Потерпевший в судебном заседании показал, что обнаружил пропажу имущества утром и сразу обратился '
+    'в полицию.',
+    'Свидетель {witness} подтвердил, что видел подсудимого возле дома потерпевшего около {hour} часов.',
+]
+PROVE = [
+    'Вина подсудимого также подтверждается протоколом осмотра места происшествия от {date} года.',
+    'Согласно заключению эксперта № {amount} изъятое вещество является наркотическим средством.',
+    'Протоколом выемки у подсудимого изъят похищенный сотовый телефон, который осмотрен и признан '
+    'вещественным доказательством.',
+    'Справкой о стоимости подтверждается, что рыночная стоимость похищенного имущества составляет {amount} '
+    'рублей.',
+    'Актом освидетельствования на состояние алкогольного опьянения установлено наличие этилового спирта '
+    'в выдыхаемом воздухе.',
+]
+MEDITATION = [
+    'Суд квалифицирует действия подсудимого по ч. {part} ст. {article} УК РФ.',
+    'Оценив исследованные доказательства в их совокупности, суд находит вину подсудимого доказанной.',
+    'При назначении наказания суд учитывает характер и степень общественной опасности преступления, '
+    'личность виновного, влияние назначенного наказания на его исправление.',
+    'Обстоятельствами, смягчающими наказание, суд признает полное признание вины, раскаяние в содеянном '
+    'и активное способствование раскрытию преступления.',
+    'Обстоятельств, отягчающих наказание, судом не установлено.',
+    'Суд не находит оснований для применения положений ст. 64 и ст. 73 УК РФ.',
+]
+PARTS = [('fabula', FABULA, (2, 6)), ('witness', WITNESS, (1, 5)), ('prove', PROVE, (1, 4)),
+         ('meditation', MEDITATION, (2, 6))]
+
+DOCUMENT_HTML = '''<html><head><title>{kind} № {number}</title></head><body>
+<div class="b-justice"><a href="/regular/court/">{court_string}</a></div>
+<h1>{kind} № {number} от {date} г. по делу № {number}</h1>
+<h3>Судьи дела: {judge} (судья)</h3>
+<div class="b-practice"><a href="/regular/practice/">Судебная практика по применению норм ст. {article} УК РФ</a></div>
+<div id="content">{title}<br/>
+ИМЕНЕМ РОССИЙСКОЙ ФЕДЕРАЦИИ<br/>
+{date} года {court} в составе председательствующего судьи {judge},<br/>
+{intro}<br/>
+рассмотрев в открытом судебном заседании уголовное дело в отношении {accused}, {born} года рождения, \
+уроженца г. {city}, гражданина РФ, ранее не судимого,<br/>
+обвиняемого в совершении преступления, предусмотренного ч. {part} ст. {article} УК РФ,<br/>
+УСТАНОВИЛ:<br/>
+{body}<br/>
+На основании изложенного, руководствуясь ст. 307-309 УПК РФ, суд<br/>
+ПРИГОВОРИЛ:<br/>
+Признать {accused} виновным в совершении преступления, предусмотренного ч. {part} ст. {article} УК РФ, \
+и назначить ему наказание в виде {punishment}.<br/>
+Приговор может быть обжалован в апелляционном порядке в течение 10 суток со дня провозглашения.<br/>
+Судья {judge}</div>
+</body></html>'''
+
+PUNISHMENTS = ['обязательных работ на срок 200 часов', 'исправительных работ на срок 1 год',
+               'лишения свободы на срок 2 года условно с испытательным сроком 1 год', 'штрафа в размере 30000 рублей',
+               'лишения свободы на срок 3 года с отбыванием наказания в исправительной колонии общего режима']
+
+TABLES = '''
+create table documents (id integer primary key, header text, url text, data text);
+create table metadata (document_id integer, date text, number text, court text, region text, judge text,
+    article text, accused text, fabula text, witness text, prove text, meditation text);
+create table uk_sections (id integer primary key, name text, url text, level integer);
+'''
+
+# регионы, которые get_metadict находит по скобкам в названии суда
+REGIONS = [region for region in ALL_REGIONS if resolve_court(f'Районный суд ({region})')[1] == region]
+
+
+def person(rng):
+    return f'{rng.choice(SURNAMES)} {rng.choice(INITIALS)}.{rng.choice(INITIALS)}.'
+
+
+def make_courts(rng, count):
+    """суды: (строка со страницы, название, регион); в каждом регионе несколько судов и свои судьи"""
+    courts = []
+    for i in range(count):
+        region = REGIONS[i % len(REGIONS)]
+        name = f'{rng.choice(COURT_NAMES)} районный суд г. {rng.choice(CITIES)} ({region})'
+        judges = [person(rng) for _ in range(rng.randint(2, 6))]
+        courts.append((name, region, judges))
+    return courts
+
+
+def make_document(rng, doc_id, courts):
+    """html, заголовок, url и строка metadata одного решения"""
+    court, region, judges = rng.choice(courts)
+    judge = rng.choice(judges)
+    year = rng.choice(YEARS)
+    day, month = rng.randint(1, 28), rng.randint(1, 12)
+    date, iso_date = f'{day} {MONTHS[month - 1]} {year}', f'{year}-{month:02d}-{day:02d}'
+    number = f'1-{rng.randint(1, 999)}/{year}'
+    article = rng.choices(ARTICLES, ARTICLE_WEIGHTS)[0][0]
+    accused = person(rng)
+    values = {
+        'accused': accused, 'date': date, 'hour': rng.randint(1, 23), 'amount': rng.randint(1000, 90000),
+        'weight': f'{rng.randint(0, 9)},{rng.randint(10, 99)}', 'witness': person(rng),
+        'part': rng.randint(1, 3), 'article': article,
+    }
+
+    parts, lines = {}, []
+    for part, sentences, (low, high) in PARTS:
+        chosen = [sentence.format(**values) for sentence in rng.sample(sentences, rng.randint(low, high))]
+        parts[part] = ' '.join(chosen)
+        lines.append(' '.join(chosen))
+    intro = '<br/>\n'.join(line.format(secretary=person(rng), prosecutor=person(rng), lawyer=person(rng),
+                                       accused=accused) for line in INTRO)
+    kind = 'Приговор'
+    html = DOCUMENT_HTML.format(
+        kind=kind, title=kind.upper(), number=number, date=date, judge=judge, article=article, accused=accused,
+        court_string=f'{court} - {rng.choice(COURT_TYPES)}', court=court, intro=intro, city=rng.choice(CITIES),
+        born=year - rng.randint(18, 60), part=values['part'], body='<br/>\n'.join(lines),
+        punishment=rng.choice(PUNISHMENTS))
+    header = f'{kind} № {number} от {date} г.'
+    url = f'https://sudact.ru/regular/doc/{doc_id:x}{rng.getrandbits(32):08x}/'
+    metadata = (doc_id, iso_date, number, court, region, judge, f'{article} УК РФ', accused,
+                parts['fabula'], parts['witness'], parts['prove'], parts['meditation'])
+    return (doc_id, header, url, html), metadata
+
+
+def uk_sections():
+    """главы (уровень 2) и статьи (3) УК РФ"""
+    rows, chapters = [], {}
+    for number, name, chapter in ARTICLES:
+        if chapter not in chapters:
+            chapters[chapter] = len(rows) + 1
+            rows.append((chapters[chapter], f'Глава. {chapter}', f'https://sudact.ru/law/uk-rf/glava-{len(chapters)}/',
+                         2))
+    for number, name, _ in ARTICLES:
+        rows.append((len(rows) + 1, f'Статья {number}. {name}', f'https://sudact.ru/law/uk-rf/{number}/', 3))
+    return rows
+
+
+def generate(db_path, documents, seed=0, chunk_size=10000, out=None):
+    """пишем новую базу и возвращаем время генерации"""
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    courts = make_courts(rng, max(len(REGIONS), min(2000, documents // 50)))
+    db = sqlite3.connect(db_path)
+    db.execute('pragma journal_mode=off')
+    db.execute('pragma synchronous=off')
+    db.executescript(TABLES)
+    db.executemany('insert into uk_sections values (?, ?, ?, ?)', uk_sections())
+    for start in range(1, documents + 1, chunk_size):
+        rows = [make_document(rng, doc_id, courts) for doc_id in range(start, min(start + chunk_size, documents + 1))]
+        db.executemany('insert into documents values (?, ?, ?, ?)', [row for row, _ in rows])
+        db.executemany('insert into metadata values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                       [metadata for _, metadata in rows])
+        db.commit()
+        if out is not None:
+            print(f'generated {rows[-1][0][0]} of {documents} documents', file=out)
+    db.close()
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='synthetic.sqlite')
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--schema', action='store_true', help='сразу применить lib.schema (индексы и фасеты)')
+    parser.add_argument('--fts', action='store_true', help='сразу построить полнотекстовый индекс')
+    parser.add_argument('--force', action='store_true', help='перезаписать существующий файл')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        if not args.force:
+            parser.error(f'{args.db} exists, use --force to overwrite')
+        os.remove(args.db)
+    seconds = generate(args.db, args.documents, args.seed, out=sys.stderr)
+    print(f'{args.documents} documents in {seconds:.1f} s, {os.path.getsize(args.db) / 2 ** 20:.1f} MB',
+          file=sys.stderr)
+    if args.schema or args.fts:
+        from lib.schema import migrate
+        from lib.search_index import update_index
+        db = sqlite3.connect(args.db)
+        if args.schema:
+            migrate(db, out=sys.stderr)
+        if args.fts:
+            update_index(db, out=sys.stderr)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
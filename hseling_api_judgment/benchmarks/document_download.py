@@ -0,0 +1,131 @@
+"""
+/documents/<id>/download: xlsx одного документа при уже разобранном (закэшированном) документе
+
+- pandas -- как было: DataFrame со строковым индексом и pd.ExcelWriter
+- xlsxwriter -- write_document_xlsx, файл строится на каждый запрос
+- memoized -- второй запрос того же документа подряд, файл из DOCUMENT_FILES
+
+и память процесса API после импорта приложения с pandas и без него (linux)
+
+    python -m benchmarks.document_download --db sudact.sqlite --limit 200 --model models/finalized_parts_clf.sav
+"""
+
+import argparse
+import importlib
+import io
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from unittest import mock
+
+from lib.classifier import MODEL_PATH, get_parts_many
+from lib.document import ParsedDocument
+from lib.export import document_filename
+from lib.metadata_extractor import get_metadict
+from lib.pipeline import NON_STANDARD_DOCUMENT, make_document
+
+# пиковая память берется из VmHWM: ru_maxrss на linux переживает exec и показал бы память родителя
+RSS_SCRIPT = '''
+import importlib, sys, time
+start = time.perf_counter()
+if sys.argv[1] == 'pandas':
+    import pandas
+importlib.import_module('app')
+elapsed = time.perf_counter() - start
+with open('/proc/self/status') as f:
+    peak = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+print(peak / 1024, elapsed)
+'''
+
+
+def load_results(db_path, limit, model):
+    """ответы /documents/<id> для первых limit документов (разбор в замер не входит)"""
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    rows = db.execute('select id, header, url, data from documents order by id limit ?', (limit,)).fetchall()
+    db.close()
+    docs = [ParsedDocument(html) for _, _, _, html in rows]
+    parts = get_parts_many(docs, clf_filename=model)
+    return {db_id: make_document(db_id, header, url, get_metadict(doc), parsed or NON_STANDARD_DOCUMENT)
+            for (db_id, header, url, _), doc, parsed in zip(rows, docs, parts)}
+
+
+def pandas_file(result):
+    """прежний create_file (присваивания через .loc, чтобы работало и в новых версиях pandas)"""
+    import pandas as pd
+    metadata = result['metadata']
+    parsed = result['parsed'] if isinstance(result['parsed'], dict) else {}
+    table = pd.DataFrame(index=['Информация о документе', '', 'Фабула', 'Показания свидетелей',
+                                'Доказательства', 'Размышления судьи'],
+                         columns=['Номер', 'Дата', 'Статьи', 'Суд', 'Регион', 'Судья', 'Подсудимый(ые)', 'url'],
+                         dtype=object)
+    table.loc['', 'Номер'] = 'Части документа:'
+    table.loc['Фабула':'Размышления судьи', 'Номер'] = ['\n'.join(parsed.get(item, '')) for item in
+                                                        ['fabula', 'witness', 'prove', 'meditation']]
+    table.iloc[0] = [result['header'], metadata['date'], metadata['article'], metadata['court'],
+                     metadata['region'], metadata['judge'], ' '.join(metadata['accused']), result['url']]
+    output = io.BytesIO()
+    writer = pd.ExcelWriter(output, engine='xlsxwriter')
+    table.to_excel(writer, sheet_name='Sheet1')
+    writer.close()
+    return document_filename(result), output.getvalue()
+
+
+def measure_requests(app_module, results, variant):
+    """время ответа на каждый документ, мс"""
+    client = app_module.app.test_client()
+    patches = [mock.patch.object(app_module, 'parse_document', results.__getitem__)]
+    if variant == 'pandas':
+        patches.append(mock.patch.object(app_module, 'create_file', lambda doc_id: pandas_file(results[doc_id])))
+    for patch in patches:
+        patch.start()
+    try:
+        times = []
+        for doc_id in results:
+            app_module.DOCUMENT_FILES.clear()
+            if variant == 'memoized':
+                client.get(f'/documents/{doc_id}/download')
+            start = time.perf_counter()
+            response = client.get(f'/documents/{doc_id}/download')
+            times.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+    finally:
+        for patch in patches:
+            patch.stop()
+    return statistics.median(times), max(times)
+
+
+def measure_rss(variant):
+    """память (МБ) и время (с) импорта приложения в отдельном процессе"""
+    env = dict(os.environ)
+    output = subprocess.run([sys.executable, '-c', RSS_SCRIPT, variant], env=env, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+    return float(output[0]), float(output[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='sudact.sqlite')
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--model', default=MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    os.environ.update(SUDACT_DB=args.db, MODEL_WARM_UP='0')
+    app_module = importlib.import_module('app')
+    results = load_results(args.db, args.limit, args.model)
+    print(f'{len(results)} documents')
+    print('variant\tmedian_ms\tmax_ms')
+    for variant in ('pandas', 'xlsxwriter', 'memoized'):
+        median, worst = measure_requests(app_module, results, variant)
+        print(f'{variant}\t{median:.2f}\t{worst:.2f}')
+
+    print('worker\trss_mb\timport_s')
+    for variant in ('pandas', 'xlsxwriter'):
+        rss, seconds = measure_rss(variant)
+        print(f'{variant}\t{rss:.1f}\t{seconds:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+время разбора html одного документа (без классификатора):
+- separate -- экстракторы и split_sentences разбирают html каждый сам, как раньше
+- shared -- один ParsedDocument на документ
+- shared-lxml -- то же с парсером lxml
+
+    python -m benchmarks.html_pipeline --db sudact.sqlite --limit 200
+"""
+
+import argparse
+import sqlite3
+import time
+
+from lib.classifier import split_sentences
+from lib.document import ParsedDocument
+from lib.metadata_extractor import get_metadict
+
+
+def separate(html):
+    split_sentences(html)
+    get_metadict(html)
+
+
+def shared(html, parser='html.parser'):
+    doc = ParsedDocument(html, parser)
+    split_sentences(doc)
+    get_metadict(doc)
+
+
+def shared_lxml(html):
+    shared(html, 'lxml')
+
+
+VARIANTS = {'separate': separate, 'shared': shared, 'shared-lxml': shared_lxml}
+
+
+def load_htmls(db_path, limit):
+    """html первых limit документов, которые разбираются целиком"""
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    htmls = []
+    for html, in db.execute('select data from documents order by id limit ?', (limit,)):
+        try:
+            separate(html)
+        except Exception:
+            continue
+        htmls.append(html)
+    db.close()
+    return htmls
+
+
+def measure(func, htmls, repeat):
+    """лучшее из repeat время на документ, мс"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in htmls:
+            func(html)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000 / len(htmls)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='sudact.sqlite')
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=list(VARIANTS))
+    args = parser.parse_args(argv)
+
+    htmls = load_htmls(args.db, args.limit)
+    print(f'{len(htmls)} documents')
+    print('variant\tms/document')
+    for name in args.variants:
+        print(f'{name}\t{measure(VARIANTS[name], htmls, args.repeat):.3f}')
+
+
+if __name__ == '__main__':
+    main()
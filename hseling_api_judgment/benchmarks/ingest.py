@@ -0,0 +1,81 @@
+"""
+пропускная способность lib.ingest: первые --limit решений из --db выгружаются в jsonl
+и загружаются в пустую базу заново, для каждого числа процессов из --workers (0 -- без пула)
+
+- docs/sec -- загрузка с разбором, записью, metadata_terms, facet_counts (и FTS с --fts)
+- duplicates/sec -- повторный запуск того же файла, все документы отбрасываются как повторы
+- время по стадиям: read (чтение и проверка повторов), parts/metadata (сумма по процессам), write, index
+
+    python -m benchmarks.ingest --db sudact.sqlite --limit 1000 --workers 0 4 --fts
+"""
+
+import argparse
+import io
+import json
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+
+from lib import classifier, ingest
+from lib.search_index import create_index
+
+
+def export_jsonl(db_path, limit, path):
+    """решения из базы в формате источника lib.ingest"""
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for header, url, data in db.execute('select header, url, data from documents order by id limit ?', (limit,)):
+            f.write(json.dumps({'html': data, 'url': url, 'header': header}, ensure_ascii=False) + '\n')
+    db.close()
+
+
+def measure(source, tmp_dir, workers, chunk_size, fts):
+    """загрузка в новую базу и повторная загрузка того же файла"""
+    db_path = os.path.join(tmp_dir, f'ingest_{workers}.sqlite')
+    if fts:
+        db = sqlite3.connect(db_path)
+        create_index(db)
+        db.close()
+    first = ingest.run(db_path, source, chunk_size, workers, out=io.StringIO())
+    again = ingest.run(db_path, source, chunk_size, workers, out=io.StringIO())
+    return first, again['read'] / again['seconds']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='sudact.sqlite')
+    parser.add_argument('--limit', type=int, default=1000)
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, os.cpu_count()])
+    parser.add_argument('--fts', action='store_true', help='загружать в базу с полнотекстовым индексом')
+    parser.add_argument('--model', default=None, help='файл классификатора вместо models/finalized_parts_clf.sav')
+    args = parser.parse_args(argv)
+
+    patches = []
+    if args.model:
+        # процессы пула получают подмену при fork
+        predict_parts = classifier.predict_parts
+        patches.append(mock.patch.object(classifier, 'predict_parts',
+                                         lambda text, clf_filename=None: predict_parts(text, args.model)))
+    for patch in patches:
+        patch.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = os.path.join(tmp_dir, 'documents.jsonl')
+            export_jsonl(args.db, args.limit, source)
+            print('workers\tinserted\tfailed\tdocs/sec\tduplicates/sec\tread_s\tparts_s\tmetadata_s\twrite_s\tindex_s')
+            for workers in args.workers:
+                stats, duplicates = measure(source, tmp_dir, workers, args.chunk_size, args.fts)
+                timings = stats['timings']
+                stages = '\t'.join(f"{timings.get(stage, 0):.2f}"
+                                   for stage in ('read', 'parts', 'metadata', 'write', 'index'))
+                print(f"{workers}\t{stats['inserted']}\t{stats['failed']}\t{stats['docs_per_sec']:.1f}\t"
+                      f"{duplicates:.0f}\t{stages}")
+    finally:
+        for patch in patches:
+            patch.stop()
+
+
+if __name__ == '__main__':
+    main()
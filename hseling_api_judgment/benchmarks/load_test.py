@@ -0,0 +1,125 @@
+"""
+нагрузочный тест запущенного API: запросы в секунду и перцентили задержки для /documents/ и /documents/<id>
+
+    gunicorn -c hseling_api_judgment/gunicorn.conf.py hseling_api_judgment:app
+    python -m benchmarks.load_test --url http://localhost:5000 --concurrency 16 --duration 30
+
+id документов для /documents/<id> берутся с первых страниц выдачи; каждый поток держит свое
+keep-alive соединение
+"""
+
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+PAGE_QUERIES = [
+    {},
+    {'page_num': 2},
+    {'region': 'Кемеровская область'},
+    {'year': '2016'},
+    {'judge': 'Кузнецов'},
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Client:
+    """одно keep-alive соединение, переоткрывается после ошибки"""
+
+    def __init__(self, url, timeout=30):
+        parts = urlsplit(url)
+        self.host, self.port, self.timeout = parts.hostname, parts.port or 80, timeout
+        self.conn = None
+
+    def get(self, path):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self.conn.request('GET', path)
+            response = self.conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+
+
+def document_ids(url, pages=5):
+    client, ids = Client(url), []
+    for page_num in range(1, pages + 1):
+        status, body = client.get('/documents/?' + urlencode({'page_num': page_num}))
+        if status != 200:
+            break
+        ids += [doc['id'] for doc in json.loads(body)['documents']]
+    return ids
+
+
+def run(url, paths, concurrency, duration):
+    """гоняем случайные пути из paths в concurrency потоков duration секунд"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        client, local, failed = Client(url), [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status, _ = client.get(random.choice(paths))
+            except (OSError, http.client.HTTPException):
+                status = None
+            if status == 200:
+                local.append(time.perf_counter() - start)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / elapsed, 1),
+        **{f'p{p}_ms': round(percentile(latencies, p) * 1000, 2) if latencies else None for p in (50, 90, 99)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='секунд на каждый эндпоинт')
+    args = parser.parse_args(argv)
+
+    ids = document_ids(args.url)
+    if not ids:
+        parser.error(f'no documents at {args.url}/documents/')
+    endpoints = {
+        '/documents/': ['/documents/?' + urlencode(query) for query in PAGE_QUERIES],
+        '/documents/<id>': [f'/documents/{doc_id}' for doc_id in ids],
+    }
+    print('endpoint\trequests\terrors\trps\tp50_ms\tp90_ms\tp99_ms')
+    for name, paths in endpoints.items():
+        res = run(args.url, paths, args.concurrency, args.duration)
+        print('\t'.join(str(value) for value in [name, res['requests'], res['errors'], res['rps'],
+                                                 res['p50_ms'], res['p90_ms'], res['p99_ms']]))
+
+
+if __name__ == '__main__':
+    main()
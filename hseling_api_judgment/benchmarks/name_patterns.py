@@ -0,0 +1,70 @@
+"""
+время поиска обвиняемых по шапке документа (get_accused_name, html уже разобран):
+- rescan -- каждая проверка заново прогоняет FIO1/FIO2/FIO_ABBR/REG_CAPS по строке, как раньше
+- name_hits -- совпадения всех шаблонов ищутся один раз на строку и запоминаются
+
+    python -m benchmarks.name_patterns --db sudact.sqlite --limit 500
+"""
+
+import argparse
+import sqlite3
+import time
+from unittest import mock
+
+from lib import metadata_extractor
+from lib.document import ParsedDocument
+
+
+def load_documents(db_path, limit):
+    """разобранные документы с уже выделенной шапкой"""
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    docs = []
+    for html, in db.execute('select data from documents order by id limit ?', (limit,)):
+        doc = ParsedDocument(html)
+        doc.header  # шапка вычисляется заранее и не входит в замер
+        docs.append(doc)
+    db.close()
+    return docs
+
+
+def measure(docs, repeat, memoized):
+    """лучшее из repeat время на документ, мс, и число просмотров строк шаблонами"""
+    name_hits = metadata_extractor.name_hits
+    scans = [0]
+
+    def rescan(line):
+        scans[0] += 1
+        return name_hits.__wrapped__(line)
+
+    best = None
+    with mock.patch.object(metadata_extractor, 'name_hits', name_hits if memoized else rescan):
+        for _ in range(repeat):
+            name_hits.cache_clear()
+            scans[0] = 0
+            start = time.perf_counter()
+            for doc in docs:
+                metadata_extractor.get_accused_name(doc)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    if memoized:
+        scans[0] = name_hits.cache_info().misses
+    return best * 1000 / len(docs), scans[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='sudact.sqlite')
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    docs = load_documents(args.db, args.limit)
+    print(f'{len(docs)} documents')
+    print('variant\tms/document\tline_scans')
+    for name, memoized in [('rescan', False), ('name_hits', True)]:
+        ms, scans = measure(docs, args.repeat, memoized)
+        print(f'{name}\t{ms:.3f}\t{scans}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+стоимость классификации одного документа в зависимости от размера пакета
+
+    python -m benchmarks.parts_batch --db sudact.sqlite --limit 512 --batch-sizes 1 8 32 128
+"""
+
+import argparse
+import sqlite3
+import time
+
+from lib.classifier import MODEL_PATH, get_registry, predict_parts, predict_parts_many, split_sentences
+
+
+def load_sentences(db_path, limit):
+    """предложения основной части первых limit стандартных документов"""
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    sentence_lists = []
+    for html, in db.execute('select data from documents order by id limit ?', (limit,)):
+        try:
+            sents = split_sentences(html)
+        except ValueError:
+            continue
+        if sents:
+            sentence_lists.append(sents)
+    db.close()
+    return sentence_lists
+
+
+def measure(sentence_lists, batch_size, repeat, clf_filename=MODEL_PATH):
+    """лучшее из repeat время на документ, мс"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if batch_size == 1:
+            for sents in sentence_lists:
+                predict_parts(sents, clf_filename)
+        else:
+            predict_parts_many(sentence_lists, batch_size, clf_filename)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000 / len(sentence_lists)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='sudact.sqlite')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--limit', type=int, default=512)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16, 64, 256])
+    args = parser.parse_args(argv)
+
+    get_registry(args.model).get()
+    sentence_lists = load_sentences(args.db, args.limit)
+    sentences = sum(len(sents) for sents in sentence_lists)
+    print(f'{len(sentence_lists)} documents, {sentences / len(sentence_lists):.1f} sentences per document')
+    print('batch_size\tms/document')
+    for batch_size in args.batch_sizes:
+        print(f'{batch_size}\t{measure(sentence_lists, batch_size, args.repeat, args.model):.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+задержка поиска по тексту решений: LIKE '%...%' по documents.data против индекса FTS5
+(индекс строится заранее: python -m lib.search_index --db sudact.sqlite)
+
+    python -m benchmarks.search --db sudact.sqlite --queries кража свидетель "телесные повреждения"
+"""
+
+import argparse
+import sqlite3
+import time
+
+from lib.search_index import FTS_TABLE, has_index, to_match_query
+
+# как в /documents/: сначала count(*) по фильтру, затем первая страница
+LIKE_SQL = '''select {selector}
+    from documents d
+    join metadata m on m.document_id=d.id
+    where {where}
+    {tail}'''
+
+FTS_SQL = f'''select {{selector}}
+    from documents d
+    join metadata m on m.document_id=d.id
+    join {FTS_TABLE} on {FTS_TABLE}.rowid=d.id
+    where {FTS_TABLE} match ?
+    {{tail}}'''
+
+PAGE = {'selector': 'd.id', 'tail': 'order by d.id limit 50'}
+FTS_PAGE = {'selector': f"d.id, snippet({FTS_TABLE}, -1, '<b>', '</b>', '…', 24)",
+            'tail': f'order by {FTS_TABLE}.rank, d.id limit 50'}
+COUNT = {'selector': 'count(*)', 'tail': ''}
+
+
+def measure(db, count_sql, page_sql, params, repeat):
+    """лучшее из repeat время подсчета и первой страницы, мс, и число найденных документов"""
+    best, found = None, 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found, = db.execute(count_sql, params).fetchone()
+        db.execute(page_sql, params).fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='sudact.sqlite')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--queries', nargs='+', default=['кража', 'свидетель', 'телесные повреждения'])
+    args = parser.parse_args(argv)
+
+    db = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    if not has_index(db):
+        parser.error('no full-text index, build it with python -m lib.search_index')
+    print('query\tlike_ms\tlike_rows\tfts_ms\tfts_rows')
+    for query in args.queries:
+        words = query.split()
+        where = ' and '.join(['d.data like ?'] * len(words))
+        like_ms, like_rows = measure(db, LIKE_SQL.format(where=where, **COUNT), LIKE_SQL.format(where=where, **PAGE),
+                                     [f'%{word}%' for word in words], args.repeat)
+        fts_ms, fts_rows = measure(db, FTS_SQL.format(**COUNT), FTS_SQL.format(**FTS_PAGE),
+                                   (to_match_query(query),), args.repeat)
+        print(f'{query}\t{like_ms:.2f}\t{like_rows}\t{fts_ms:.2f}\t{fts_rows}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+разбиение основной части приговоров на предложения:
+- rusenttokenize -- эталон, ru_sent_tokenize
+- fast -- FastSegmenter, те же границы без копирования остатка текста на каждом фрагменте
+- memoized -- segment_many с кэшем по хэшу текста (повторный разбор тех же документов)
+
+заодно проверяется, что fast дает ровно те же предложения, что эталон
+
+    python -m benchmarks.segmenter --db sudact.sqlite --limit 500
+"""
+
+import argparse
+import sqlite3
+import time
+
+from lib import classifier
+from lib.classifier import SEGMENTERS, divide_into_parts, segment_many
+from lib.document import ParsedDocument
+
+
+def load_texts(db_path, limit):
+    """основные части документов (без шапки и резолютивной части)"""
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    texts = []
+    for html, in db.execute('select data from documents order by id limit ?', (limit,)):
+        try:
+            texts.append(divide_into_parts(ParsedDocument(html).text)[1])
+        except ValueError:
+            pass
+    db.close()
+    return texts
+
+
+def measure(fn, texts, repeat):
+    """лучшее из repeat время на документ, мс"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(texts)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000 / len(texts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='sudact.sqlite')
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    texts = load_texts(args.db, args.limit)
+    reference, fast = SEGMENTERS['rusenttokenize'], SEGMENTERS['fast']
+    mismatches = sum(fast.segment(text) != reference.segment(text) for text in texts)
+    print(f'{len(texts)} documents, {sum(map(len, texts)) // len(texts)} chars on average, {mismatches} mismatches')
+
+    classifier._SEGMENT_CACHE.clear()
+    segment_many(texts, fast)  # прогрев кэша
+    print('variant\tms/document')
+    for name, fn in [('rusenttokenize', reference.segment_many), ('fast', fast.segment_many),
+                     ('memoized', lambda batch: segment_many(batch, fast))]:
+        print(f'{name}\t{measure(fn, texts, args.repeat):.3f}')
+
+
+if __name__ == '__main__':
+    main()
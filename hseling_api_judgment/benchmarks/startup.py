@@ -0,0 +1,88 @@
+"""
+холодный старт процесса API: что и сколько стоит при импорте app и сколько длится прогрев
+
+- время импорта по пакетам верхнего уровня (python -X importtime в отдельном процессе)
+- какие тяжелые зависимости попали в импорт, хотя должны грузиться при первом использовании
+- --warm-up: еще и load_models (классификатор и natasha), как в when_ready gunicorn
+
+    python -m benchmarks.startup --top 15 --warm-up
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+
+# должны грузиться при первом использовании или при прогреве, но не при импорте app
+DEFERRED = ('bs4', 'xlsxwriter', 'pandas', 'sklearn', 'natasha', 'yargy', 'nltk')
+
+MARKER = '-- warm-up --'
+
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+modules = sorted(sys.modules)
+warm_up = None
+if sys.argv[1] == '1':
+    sys.stderr.write(sys.argv[2] + '\\n')
+    from lib.pipeline import load_models, readiness
+    load_models()
+    warm_up = readiness()
+with open('/proc/self/status') as f:
+    peak = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:')) / 1024
+print(json.dumps({'import_s': imported, 'modules': modules, 'warm_up': warm_up, 'rss_mb': peak}))
+'''
+
+
+def parse_importtime(lines):
+    """строки -X importtime -> (собственное время, суммарное, глубина, модуль), мкс"""
+    rows = []
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--warm-up', action='store_true')
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, MODEL_WARM_UP='0')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', SCRIPT, '1' if args.warm_up else '0', MARKER],
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode:
+        sys.exit(result.stderr)
+    report = json.loads(result.stdout.splitlines()[-1])
+    lines = result.stderr.splitlines()
+    split = lines.index(MARKER) if MARKER in lines else len(lines)
+
+    packages = Counter()
+    for self_us, _, _, name in parse_importtime(lines[:split]):
+        packages[name.split('.')[0]] += self_us
+    print(f"import app: {report['import_s'] * 1000:.0f} ms, {len(report['modules'])} modules")
+    print('package\tself_ms')
+    for name, self_us in packages.most_common(args.top):
+        print(f'{name}\t{self_us / 1000:.1f}')
+
+    eager = [name for name in DEFERRED if name in report['modules']]
+    print('heavy imports at start:', ', '.join(eager) or 'none')
+
+    if report['warm_up'] is not None:
+        warm_up = report['warm_up']
+        imported = sum(self_us for self_us, _, _, _ in parse_importtime(lines[split:]))
+        print(f"warm-up: {warm_up['state']} in {warm_up['seconds']:.2f} s ({imported / 10 ** 6:.2f} s of imports), "
+              f"ready={warm_up['ready']}" + (f", error {warm_up['error']}" if warm_up['error'] else ''))
+    print(f"peak rss: {report['rss_mb']:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
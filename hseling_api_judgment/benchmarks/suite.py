@@ -0,0 +1,313 @@
+"""
+воспроизводимый набор замеров на синтетической базе (benchmarks.corpus): стадии разбора и эндпоинты API
+
+- setup -- генерация корпуса, lib.schema и полнотекстовый индекс (документов в секунду)
+- stages -- время стадий разбора (soup, text, segment, predict, metadata.* ...) на документ: каждый документ
+  разбирается под lib.metrics.profiling, как /documents/<id>?profile=1; плюс пакетный разбор parse_rows
+- endpoints -- запросы к приложению в этом же процессе подряд: запросов в секунду, перцентили задержки
+  и первый (холодный) запрос; конкурентную нагрузку на gunicorn меряет benchmarks.load_test
+
+результат -- json с коммитом, окружением и параметрами корпуса; одинаковые --documents и --seed дают
+одинаковую базу, поэтому замеры разных коммитов сравнимы (--baseline печатает отношение к прошлому замеру)
+
+    python -m benchmarks.suite --documents 5000 --output before.json
+    python -m benchmarks.suite --documents 5000 --output after.json --baseline before.json
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from benchmarks import corpus
+from benchmarks.load_test import percentile
+from lib import classifier
+from lib.metrics import profiling
+from lib.parse_cache import pipeline_version
+from lib.pipeline import parse_row, parse_rows
+from lib.schema import migrate
+from lib.search_index import has_index, update_index
+
+# что сравнивать с --baseline: раздел -> (метрика, больше -- лучше)
+COMPARED = {'setup': [('docs_per_sec', True)], 'stages': [('p50_ms', False), ('docs_per_sec', True)],
+            'endpoints': [('p50_ms', False), ('rps', True)]}
+
+
+def summary(values, count=None):
+    """перцентили в мс и число в секунду для списка времен в секундах"""
+    total = sum(values)
+    return {
+        'total_s': round(total, 4),
+        'mean_ms': round(total * 1000 / len(values), 3) if values else None,
+        **{f'p{p}_ms': round(percentile(values, p) * 1000, 3) if values else None for p in (50, 90, 99)},
+        'docs_per_sec': round((count or len(values)) / total, 1) if total else None,
+    }
+
+
+def git_revision():
+    """коммит и есть ли незакоммиченные изменения (None вне git)"""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=cwd, check=True, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=cwd, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def environment():
+    commit, dirty = git_revision()
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pipeline_version': pipeline_version(),
+    }
+
+
+def prepare_corpus(db_path, documents, seed):
+    """синтетическая база с индексами, фасетами и FTS; время каждого шага"""
+    setup = {}
+    seconds = corpus.generate(db_path, documents, seed)
+    setup['generate'] = {'seconds': round(seconds, 2), 'docs_per_sec': round(documents / seconds, 1)}
+    db = sqlite3.connect(db_path)
+    for name, step in [('schema', lambda: migrate(db)), ('fts', lambda: update_index(db))]:
+        start = time.perf_counter()
+        step()
+        seconds = time.perf_counter() - start
+        setup[name] = {'seconds': round(seconds, 2), 'docs_per_sec': round(documents / seconds, 1)}
+    db.close()
+    setup['db_mb'] = round(os.path.getsize(db_path) / 2 ** 20, 1)
+    return setup
+
+
+def read_rows(db_path, ids):
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    rows = [db.execute('select id, header, url, data from documents where id=?', (doc_id,)).fetchone()
+            for doc_id in ids]
+    db.close()
+    return [row for row in rows if row is not None]
+
+
+def measure_stages(rows):
+    """стадии разбора по документам (как /documents/<id>) и пакетный разбор тех же документов"""
+    per_stage, totals = {}, []
+    for i, row in enumerate(rows):
+        with profiling() as profile:
+            start = time.perf_counter()
+            parse_row(*row)
+            totals.append(time.perf_counter() - start)
+        for stage in set(per_stage) | set(profile):
+            per_stage.setdefault(stage, [0.] * i).append(profile.get(stage, 0.))
+    stages = {stage: summary(values) for stage, values in sorted(per_stage.items())}
+    stages['parse_row'] = summary(totals)
+
+    classifier._SEGMENT_CACHE.clear()
+    start = time.perf_counter()
+    results = parse_rows(rows)
+    seconds = time.perf_counter() - start
+    stages['parse_rows'] = {'total_s': round(seconds, 4), 'docs_per_sec': round(len(rows) / seconds, 1),
+                            'failed': sum(1 for _, _, error in results if error is not None)}
+    return stages
+
+
+def sample_values(db_path):
+    """значения фильтров, под которыми есть документы: самые частые регион, год и фамилия судьи"""
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    region, = db.execute('select region from metadata group by 1 order by count(*) desc, 1 limit 1').fetchone()
+    year, = db.execute('select substr(date, 1, 4) from metadata group by 1 order by count(*) desc, 1 limit 1'
+                       ).fetchone()
+    judge, = db.execute('select judge from metadata group by 1 order by count(*) desc, 1 limit 1').fetchone()
+    law_id, = db.execute('select min(id) from uk_sections where level=3').fetchone()
+    max_id, = db.execute('select max(id) from documents').fetchone()
+    db.close()
+    return {'region': region, 'year': year, 'judge': judge.split()[0], 'law_id': law_id, 'max_id': max_id}
+
+
+def endpoint_requests(values, ids, htmls, fts, encode_cursor):
+    """
+    эндпоинт -> функция (номер запроса -> (метод, путь, json)) и допустимые коды ответа
+    id документов у эндпоинтов с разбором не пересекаются, поэтому каждый их запрос холодный
+    """
+    region, year, judge = values['region'], values['year'], values['judge']
+    pages = ['/documents/', '/documents/?page_num=3', f'/documents/?region={region}', f'/documents/?year={year}',
+             f'/documents/?judge={judge}', '/documents/?article=158', f'/documents/?region={region}&year={year}']
+    slices = {name: ids[i::3] for i, name in enumerate(['document', 'download', 'batch'])}
+    batches = [slices['batch'][start:start + 10] for start in range(0, len(slices['batch']), 10)]
+    cursors = [f'/documents/?cursor={encode_cursor(last_id)}' for last_id in range(0, values['max_id'], 500)]
+
+    def cycle(paths):
+        return lambda i: ('GET', paths[i % len(paths)], None)
+
+    endpoints = {
+        'livez': (cycle(['/livez']), (200,)),
+        'healthz': (cycle(['/healthz']), (200, 503)),
+        'metrics': (cycle(['/metrics']), (200,)),
+        'laws': (cycle(['/laws/']), (200,)),
+        'law': (cycle([f"/laws/{values['law_id']}"]), (200,)),
+        'regions': (cycle(['/regions/']), (200,)),
+        'facets': (cycle(['/facets', f'/facets?region={region}', f'/facets?year={year}&judge={judge}']), (200,)),
+        'documents': (cycle(pages), (200,)),
+        'documents_cursor': (cycle(cursors), (200,)),
+        'document': (cycle([f'/documents/{doc_id}' for doc_id in slices['document']]), (200,)),
+        'document_cached': (cycle([f'/documents/{doc_id}' for doc_id in slices['document'][:10]]), (200,)),
+        'document_download': (cycle([f'/documents/{doc_id}/download' for doc_id in slices['download']]), (200,)),
+        'documents_batch': (lambda i: ('POST', '/documents/batch', {'ids': batches[i % len(batches)]}), (200,)),
+        'parts': (lambda i: ('POST', '/parts/', {'documents': htmls[i % len(htmls):][:5]}), (200,)),
+        'export_csv': (cycle([f'/documents/download?format=csv&region={region}']), (200,)),
+        'export_xlsx': (cycle([f'/documents/download?format=xlsx&region={region}&year={year}']), (200,)),
+    }
+    if fts:
+        endpoints['search'] = (cycle(['/documents/?q=кража телефона', f'/documents/?q=наркотического&region={region}',
+                                      '/documents/?q=свидетель']), (200,))
+    return endpoints
+
+
+def measure_endpoint(client, request_for, statuses, count, max_seconds):
+    """count запросов подряд (или сколько успеет за max_seconds, но не меньше одного)"""
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for i in range(count):
+        method, path, body = request_for(i)
+        start = time.perf_counter()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        latencies.append(time.perf_counter() - start)
+        response.close()
+        if response.status_code not in statuses:
+            errors += 1
+        if time.perf_counter() - started > max_seconds:
+            break
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'first_ms': round(latencies[0] * 1000, 3),
+        **{f'p{p}_ms': round(percentile(latencies, p) * 1000, 3) for p in (50, 90, 99)},
+    }
+
+
+def measure_endpoints(db_path, tmp_dir, count, max_seconds, seed, only=None):
+    """приложение импортируется с базой db_path и кэшами во временном каталоге"""
+    os.environ.update(SUDACT_DB=db_path, MODEL_WARM_UP='0', PARSE_CACHE_DB=os.path.join(tmp_dir, 'parse_cache.sqlite'),
+                      EXPORT_CACHE_DIR=os.path.join(tmp_dir, 'exports'))
+    app_module = importlib.import_module('app')
+    values = sample_values(db_path)
+    ids = list(range(1, values['max_id'] + 1))
+    random.Random(seed).shuffle(ids)
+    htmls = [row[3] for row in read_rows(db_path, ids[:20])]
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    fts = has_index(db)
+    db.close()
+
+    client = app_module.app.test_client()
+    results = {}
+    endpoints = endpoint_requests(values, ids, htmls, fts, app_module.encode_cursor)
+    for name, (request_for, statuses) in endpoints.items():
+        if only and name not in only:
+            continue
+        results[name] = measure_endpoint(client, request_for, statuses, count, max_seconds)
+        print(f"{name}\t{results[name]['rps']}\t{results[name]['p50_ms']}\t{results[name]['p99_ms']}\t"
+              f"{results[name]['first_ms']}\t{results[name]['errors']}", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, out=sys.stdout):
+    """отношение новых результатов к baseline по метрикам COMPARED"""
+    if baseline.get('corpus') != results.get('corpus'):
+        print(f"warning: different corpus {baseline.get('corpus')} vs {results.get('corpus')}", file=out)
+    print(f"baseline {baseline['meta'].get('commit')} -> {results['meta'].get('commit')}", file=out)
+    print('section\tname\tmetric\tbaseline\tcurrent\tchange', file=out)
+    for section, metrics in COMPARED.items():
+        for name, current in results.get(section, {}).items():
+            old = baseline.get(section, {}).get(name)
+            if not isinstance(current, dict) or not isinstance(old, dict):
+                continue
+            for metric, higher_is_better in metrics:
+                if current.get(metric) is None or not old.get(metric):
+                    continue
+                change = current[metric] / old[metric] - 1
+                mark = '' if abs(change) < .1 else ('+' if (change > 0) == higher_is_better else '-')
+                print(f'{section}\t{name}\t{metric}\t{old[metric]}\t{current[metric]}\t{change:+.1%}{mark}', file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=None, help='готовая база вместо синтетической (не изменяется)')
+    parser.add_argument('--documents', type=int, default=5000, help='размер синтетического корпуса')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stage-documents', type=int, default=200, help='сколько документов разбирать по стадиям')
+    parser.add_argument('--requests', type=int, default=50, help='запросов на эндпоинт')
+    parser.add_argument('--max-seconds', type=float, default=20, help='не дольше стольких секунд на эндпоинт')
+    parser.add_argument('--only', nargs='+', default=None, help='только эти разделы (setup, stages, endpoints) '
+                                                                'или эндпоинты')
+    parser.add_argument('--model', default=None, help='файл классификатора вместо models/finalized_parts_clf.sav')
+    parser.add_argument('--output', default=None, help='записать результаты в этот json')
+    parser.add_argument('--baseline', default=None, help='json прошлого замера для сравнения')
+    args = parser.parse_args(argv)
+
+    if args.model:
+        predict_parts = classifier.predict_parts
+        mock.patch.object(classifier, 'predict_parts',
+                          lambda text, clf_filename=None: predict_parts(text, args.model)).start()
+    try:
+        classifier.get_registry(args.model or classifier.MODEL_PATH).get()
+    except Exception as e:
+        parser.error(f'classifier: {e!r}')
+
+    only = set(args.only or [])
+    sections = {'setup', 'stages', 'endpoints'}
+    wanted = (only & sections) or sections
+    results = {'meta': dict(environment(), args=vars(args))}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.db is None:
+            db_path = os.path.join(tmp_dir, 'synthetic.sqlite')
+            results['corpus'] = {'documents': args.documents, 'seed': args.seed}
+            results['setup'] = prepare_corpus(db_path, args.documents, args.seed)
+            print(f"setup: {json.dumps(results['setup'])}", file=sys.stderr)
+        else:
+            db_path = os.path.abspath(args.db)
+            results['corpus'] = {'db': db_path, 'db_mb': round(os.path.getsize(db_path) / 2 ** 20, 1)}
+
+        if 'stages' in wanted:
+            ids = list(range(1, sample_values(db_path)['max_id'] + 1))
+            random.Random(args.seed + 1).shuffle(ids)
+            results['stages'] = measure_stages(read_rows(db_path, ids[:args.stage_documents]))
+            print('stage\tp50_ms\tp99_ms\tdocs/sec', file=sys.stderr)
+            for stage, res in results['stages'].items():
+                print(f"{stage}\t{res.get('p50_ms')}\t{res.get('p99_ms')}\t{res['docs_per_sec']}", file=sys.stderr)
+
+        if 'endpoints' in wanted:
+            print('endpoint\trps\tp50_ms\tp99_ms\tfirst_ms\terrors', file=sys.stderr)
+            results['endpoints'] = measure_endpoints(db_path, tmp_dir, args.requests, args.max_seconds, args.seed,
+                                                     only - sections or None)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f), out=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
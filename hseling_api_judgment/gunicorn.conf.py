@@ -0,0 +1,44 @@
+"""
+gunicorn для API (из корня репозитория):
+    gunicorn -c hseling_api_judgment/gunicorn.conf.py hseling_api_judgment:app
+
+- приложение, классификатор и natasha загружаются один раз в главном процессе (preload_app),
+  воркеры получают их после fork через copy-on-write; gc.freeze не дает сборщику мусора
+  трогать эти объекты и копировать страницы памяти в каждый воркер
+- модели грузятся в when_ready, когда сокет уже открыт: соединения копятся в очереди, а не отвергаются;
+  GUNICORN_PRELOAD=0 -- воркеры стартуют сразу и прогреваются каждый в фоне (быстрее старт, больше памяти)
+- воркеры gthread: GUNICORN_WORKERS процессов по GUNICORN_THREADS потоков
+- kill -HUP <pid главного процесса> -- плавный перезапуск воркеров: старые дорабатывают текущие запросы
+  (до graceful_timeout секунд); модель при этом перечитывается, только если файл изменился
+- живость -- GET /livez, готовность -- GET /readyz (503, пока прогрев не закончен)
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:80')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+# перезапуск воркера после стольких запросов (0 -- никогда); разброс, чтобы воркеры не перезапускались разом
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+if preload_app:
+    # фоновый поток загрузки модели в главном процессе нельзя переживать через fork -- грузим синхронно в when_ready
+    os.environ['MODEL_WARM_UP'] = '0'
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from lib.pipeline import load_models
+    load_models()
+    gc.freeze()
+    server.log.info('models preloaded in master %s', os.getpid())
@@ -0,0 +1,153 @@
+"""
+пакетный разбор всей таблицы documents в кэш parse_document
+
+запуск из каталога hseling_api_judgment:
+    python -m lib.batch_parse --db sudact.sqlite --cache parse_cache.sqlite
+
+документы читаются пачками по id, разбираются в пуле процессов (по одному на ядро),
+результаты пишутся в кэш одной транзакцией на пачку вместе с отметкой последнего id,
+поэтому прерванный запуск продолжается с места остановки
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from lib.classifier import PREDICT_BATCH_SIZE
+from lib.parse_cache import ParseCache, pipeline_version
+
+CHECKPOINT_NAME = 'batch_parse'
+
+
+def init_worker(names_fallback=None):
+    """
+    каждый процесс один раз загружает классификатор и экстрактор имен natasha
+    (при fork они уже загружены в родителе и достаются процессу без копирования)
+    :param names_fallback: настройки запасного поиска имен, {'enabled': ..., 'budget': ...}
+    """
+    from lib.metadata_extractor import configure_names_fallback
+    from lib.pipeline import load_models
+    configure_names_fallback(**(names_fallback or {}))
+    load_models()
+
+
+def parse_chunk(rows, batch_size=PREDICT_BATCH_SIZE):
+    """разбираем пачку строк documents, возвращаем результаты, ошибки и время по стадиям"""
+    from lib.pipeline import parse_rows
+
+    timings = Counter()
+    results, errors = [], []
+    for db_id, result, error in parse_rows(rows, timings, batch_size):
+        if error is None:
+            results.append((db_id, result))
+        else:
+            errors.append((db_id, repr(error)))
+    return results, errors, timings
+
+
+def read_chunks(db, start_id, chunk_size, limit=None):
+    """читаем documents пачками по возрастанию id, не держа всю таблицу в памяти"""
+    sql = '''select id, header, url, data
+    from documents
+    where id > ?
+    order by id
+    limit ?'''
+    last_id, total = start_id, 0
+    while limit is None or total < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - total)
+        rows = db.execute(sql, (last_id, size)).fetchall()
+        if not rows:
+            return
+        total += len(rows)
+        last_id = rows[-1][0]
+        yield rows
+
+
+def run(db_path, cache_path, chunk_size=100, workers=None, limit=None, restart=False, out=sys.stderr,
+        batch_size=PREDICT_BATCH_SIZE, names_fallback=None):
+    """
+    разбираем документы и возвращаем итоговую статистику
+    :param names_fallback: настройки запасного поиска имен наташей (см. init_worker)
+    """
+    workers = workers or os.cpu_count()
+    init_worker(names_fallback)
+    version = pipeline_version()
+    cache = ParseCache(cache_path, maxsize=0)
+    start_id = 0 if restart else (cache.get_checkpoint(CHECKPOINT_NAME, version) or 0)
+    print(f'pipeline version {version}, starting after id {start_id}, {workers} workers', file=out)
+
+    db = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    timings = Counter()
+    done, failed = 0, 0
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(names_fallback,)) as pool:
+        pending = deque()
+
+        def commit_oldest():
+            nonlocal done, failed
+            last_id, future = pending.popleft()
+            results, errors, chunk_timings = future.result()
+            write_start = time.perf_counter()
+            cache.put_many(results, version, checkpoint=(CHECKPOINT_NAME, last_id))
+            timings['write'] += time.perf_counter() - write_start
+            timings.update(chunk_timings)
+            done += len(results)
+            failed += len(errors)
+            for db_id, error in errors:
+                print(f'document {db_id}: {error}', file=out)
+            elapsed = time.perf_counter() - started
+            print(f'last id {last_id}: {done} parsed, {failed} failed, {done / elapsed:.1f} docs/sec', file=out)
+
+        read_start = time.perf_counter()
+        for rows in read_chunks(db, start_id, chunk_size, limit):
+            timings['read'] += time.perf_counter() - read_start
+            pending.append((rows[-1][0], pool.submit(parse_chunk, rows, batch_size)))
+            # держим в работе не больше двух пачек на процесс, пишем строго по порядку id
+            while len(pending) >= 2 * workers:
+                commit_oldest()
+            read_start = time.perf_counter()
+        while pending:
+            commit_oldest()
+
+    db.close()
+    elapsed = time.perf_counter() - started
+    stats = {
+        'version': version,
+        'parsed': done,
+        'failed': failed,
+        'seconds': elapsed,
+        'docs_per_sec': done / elapsed if elapsed else None,
+        # parts и metadata -- суммарное время по всем процессам, names_* -- счетчики запасного поиска имен
+        'timings': dict(timings),
+    }
+    print(stats, file=out)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='разбор всех документов судакта в кэш parse_document')
+    parser.add_argument('--db', default='sudact.sqlite')
+    parser.add_argument('--cache', default=os.environ.get('PARSE_CACHE_DB', 'parse_cache.sqlite'))
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=PREDICT_BATCH_SIZE,
+                        help='сколько документов классифицировать одним вызовом predict')
+    parser.add_argument('--workers', type=int, default=None, help='по умолчанию -- число ядер')
+    parser.add_argument('--limit', type=int, default=None, help='разобрать не больше стольких документов')
+    parser.add_argument('--restart', action='store_true', help='начать заново, не глядя на сохраненный прогресс')
+    parser.add_argument('--no-names-fallback', action='store_true',
+                        help='не искать обвиняемых наташей (быстрее, результаты пишутся под отдельной версией)')
+    parser.add_argument('--names-budget', type=float, default=None,
+                        help='секунд на поиск имен наташей в одном документе')
+    args = parser.parse_args(argv)
+    names_fallback = {'enabled': False if args.no_names_fallback else None, 'budget': args.names_budget}
+    run(args.db, args.cache, args.chunk_size, args.workers, args.limit, args.restart, batch_size=args.batch_size,
+        names_fallback=names_fallback)
+
+
+if __name__ == '__main__':
+    main()
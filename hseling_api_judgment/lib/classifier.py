@@ -6,17 +6,323 @@
 - meditation (рассуждения судьи)
 """
 
+import hashlib
+import logging
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from bs4 import BeautifulSoup
 from rusenttokenize import ru_sent_tokenize
+from rusenttokenize import tokenizer as rst
 import pickle
 
+from lib.document import as_document
+from lib.metrics import timed, timer
+
+MODEL_PATH = Path(__file__).parent / 'models' / 'finalized_parts_clf.sav'
+
+# сколько документов классифицируем одним вызовом predict
+PREDICT_BATCH_SIZE = 64
+
+# сколько разбиений на предложения помнить (ключ -- хэш текста)
+SEGMENT_CACHE_SIZE = int(os.environ.get('SEGMENT_CACHE_SIZE', 1024))
+
+
+class ModelRegistry:
+    """держим классификатор в памяти процесса, перезагружаем его при изменении файла на диске"""
+
+    def __init__(self, filename=MODEL_PATH):
+        self.filename = Path(filename)
+        self.version = None
+        self.load_time = None
+        self.loaded_at = None
+        self.error = None
+        self._clf = None
+        self._mtime = None
+        # mtime файла, который не удалось загрузить: пока файл не изменится, заново его не читаем
+        self._failed_mtime = None
+        self._lock = threading.Lock()
+
+    def _file_mtime(self):
+        return self.filename.stat().st_mtime_ns
+
+    def load(self):
+        """
+        загружаем модель из файла, версия -- начало sha1 от содержимого
+        если файл недописан или испорчен, а модель уже загружена, работаем со старой (ошибка -- в status());
+        исключение -- только при холодном старте, когда отдавать нечего
+        """
+        with self._lock:
+            start = time.perf_counter()
+            mtime = None
+            try:
+                mtime = self._file_mtime()
+                if self._clf is not None and mtime in (self._mtime, self._failed_mtime):
+                    # модель уже загрузил (или не смог загрузить) другой поток
+                    return self._clf
+                with timer('model_load'), open(self.filename, 'rb') as f:
+                    data = f.read()
+                    clf = pickle.loads(data)
+            except Exception as e:
+                self.error = repr(e)
+                if self._clf is None:
+                    raise
+                logging.exception('model reload failed, keeping version %s', self.version)
+                self._failed_mtime = mtime
+                return self._clf
+            self._clf, self._mtime, self._failed_mtime = clf, mtime, None
+            self.version = hashlib.sha1(data).hexdigest()[:12]
+            self.load_time = time.perf_counter() - start
+            self.loaded_at = time.time()
+            self.error = None
+            return clf
+
+    def get(self):
+        """отдаем загруженную модель, при изменении файла загружаем ее заново"""
+        clf = self._clf
+        try:
+            changed = self._file_mtime() not in (self._mtime, self._failed_mtime)
+        except OSError:
+            # файл пропал -- продолжаем работать со старой моделью
+            changed = False
+        if clf is None or changed:
+            clf = self.load()
+        return clf
+
+    def warm_up(self, background=True):
+        """загружаем модель заранее, по умолчанию в фоновом потоке"""
+        def target():
+            try:
+                self.get()
+            except Exception:
+                pass  # ошибка сохраняется в self.error и видна в status()
+
+        if not background:
+            return target()
+        thread = threading.Thread(target=target, name='model-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def ready(self):
+        return self._clf is not None
+
+    def status(self):
+        return {
+            'ready': self.ready,
+            'path': str(self.filename),
+            'version': self.version,
+            'load_time': self.load_time,
+            'loaded_at': self.loaded_at,
+            'error': self.error,
+        }
+
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_registry(clf_filename=MODEL_PATH):
+    """один реестр на файл модели в рамках процесса"""
+    key = str(Path(clf_filename).resolve())
+    with _REGISTRIES_LOCK:
+        if key not in _REGISTRIES:
+            _REGISTRIES[key] = ModelRegistry(clf_filename)
+        return _REGISTRIES[key]
+
+
+def _at_pos(pattern):
+    """шаблон '^...' для pattern.match(text, pos): с pos '^' не срабатывает, а match и так привязан к началу"""
+    assert pattern.pattern.startswith('^')
+    return re.compile(pattern.pattern[1:], pattern.flags)
+
+
+def _tail(text, spaces=1):
+    """
+    суффикс text, начинающийся с spaces-го с конца пробела (или весь text):
+    совпадение шаблона, привязанного к '$', в котором после первого символа меньше spaces пробелов,
+    целиком лежит в суффиксе, а пробел перед ним сохраняет контекст для \\b
+    """
+    start = len(text)
+    for _ in range(spaces):
+        start = text.rfind(' ', 0, start)
+        if start < 0:
+            return text
+    return text[start:]
+
+
+def _paired_tail(text):
+    """
+    суффикс для rst._PAIRED_SHORTENING_IN_THE_END ('\\b(\\w+)\\. (\\w+)\\.\\W*$')
+    или None, если совпадения быть не может:
+    '\\.\\W*' -- это вся концевая серия не-буквенных символов, в совпадении ее пробелы и еще один
+    """
+    end = len(text)
+    while end and not (text[end - 1].isalnum() or text[end - 1] == '_'):
+        end -= 1
+    if end == len(text) or text[end] != '.':
+        return None
+    return _tail(text, text.count(' ', end) + 2)
+
+
+class Segmenter:
+    """разбиение текста на предложения"""
+
+    name = None
+
+    def segment(self, text):
+        raise NotImplementedError
+
+    def segment_many(self, texts):
+        """разбиение для пачки текстов (для пакетной обработки)"""
+        return [self.segment(text) for text in texts]
+
+
+class ReferenceSegmenter(Segmenter):
+    """rusenttokenize.ru_sent_tokenize как есть"""
+
+    name = 'rusenttokenize'
+
+    def segment(self, text):
+        return ru_sent_tokenize(text)
+
+
+class FastSegmenter(Segmenter):
+    """
+    тот же алгоритм, что ru_sent_tokenize, с теми же границами предложений, но без лишних просмотров текста:
+    - оригинал на каждом фрагменте копирует весь остаток текста (text[i:].index(s), text[span_end:]),
+      здесь позиции ищутся в исходной строке, а шаблоны для правого контекста применяются с pos
+    - шаблоны конца левой части ('...$') ищутся не по всему предложению, а по его хвосту (_tail)
+    """
+
+    name = 'fast'
+
+    STARTS_WITH_EMPTYNESS = _at_pos(rst._STARTS_WITH_EMPTYNESS)
+    FIRST_WORD = _at_pos(rst._FIRST_WORD)
+    STARTS_WITH_LOWER = _at_pos(rst._STARTS_WITH_LOWER)
+    STARTS_WITH_DIGIT = _at_pos(rst._STARTS_WITH_DIGIT)
+
+    def __init__(self, shortenings=rst.SHORTENINGS, joining_shortenings=rst.JOINING_SHORTENINGS,
+                 paired_shortenings=rst.PAIRED_SHORTENINGS):
+        self.shortenings = shortenings
+        self.joining_shortenings = joining_shortenings
+        self.paired_shortenings = paired_shortenings
+
+    def is_sentence_end(self, left, text, pos):
+        """rst._is_sentence_end(left, text[pos:])"""
+        if not self.STARTS_WITH_EMPTYNESS.match(text, pos):
+            return rst._JOIN
+        word = _tail(left)
+        if rst._HAS_DOT_INSIDE.search(word):
+            return rst._JOIN
+
+        left_last_word = rst._LAST_WORD.search(word)
+        lw = ' '
+        if left_last_word:
+            lw = left_last_word.group(1)
+            if lw.lower() in self.joining_shortenings:
+                return rst._JOIN
+            if rst._ONLY_RUS_CONSONANTS.search(lw) and lw[-1].islower():
+                return rst._MAYBE
+
+        paired = _paired_tail(left)
+        pse = paired is not None and rst._PAIRED_SHORTENING_IN_THE_END.search(paired)
+        if pse and pse.groups() in self.paired_shortenings:
+            return rst._MAYBE
+
+        right_first_word = self.FIRST_WORD.match(text, pos)
+        if right_first_word and (lw, right_first_word.group(1)) in self.paired_shortenings:
+            return rst._MAYBE
+
+        if self.STARTS_WITH_LOWER.match(text, pos) and rst._ENDS_WITH_EMOTION.search(left):
+            return rst._JOIN
+
+        initials = rst._INITIALS.search(word)
+        if initials and (initials.group(1) or ' ') not in "°'":
+            return rst._JOIN
+
+        if lw.lower() in self.shortenings:
+            return rst._MAYBE
+
+        last_letter = rst._ENDS_WITH_ONE_LETTER_LAT_AND_DOT.search(word)
+        if last_letter and (last_letter.group(1) or ' ') not in "°'":
+            return rst._MAYBE
+        if rst._NUMERATION.match(left):
+            return rst._JOIN
+        return rst._SPLIT
+
+    def segment(self, text):
+        sentences = []
+        processed_index = 0
+        sent_start = 0
+        for s in rst._regex_split_separators(text):
+            # как в оригинале: поиск от processed_index, который после склеек может отставать от конца фрагмента
+            span_start = text.index(s, processed_index)
+            span_end = span_start + len(s)
+            processed_index += len(s)
+
+            left = text[sent_start:span_end]
+            send = self.is_sentence_end(left, text, span_end)
+            if send == rst._JOIN:
+                continue
+            if send == rst._MAYBE and (self.STARTS_WITH_LOWER.match(text, span_end)
+                                       or self.STARTS_WITH_DIGIT.match(text, span_end)):
+                continue
+
+            if not left.strip():
+                logging.warning("Something went wrong while tokenizing")
+            sentences.append(left.strip())
+            sent_start = span_end
+            processed_index = span_end
+
+        if sent_start != len(text) and text[sent_start:].strip():
+            sentences.append(text[sent_start:].strip())
+        return sentences
+
+
+SEGMENTERS = {segmenter.name: segmenter for segmenter in (ReferenceSegmenter(), FastSegmenter())}
+
+# SEGMENTER=rusenttokenize -- эталонная реализация
+SEGMENTER = SEGMENTERS[os.environ.get('SEGMENTER', FastSegmenter.name)]
+
+_SEGMENT_CACHE = OrderedDict()
+_SEGMENT_CACHE_LOCK = threading.Lock()
+
+
+def segment_many(texts, segmenter=None):
+    """
+    предложения для каждого текста; разбиения запоминаются по хэшу текста,
+    поэтому повторный разбор того же документа (просмотр, пакетная обработка) не делит его заново
+    """
+    segmenter = segmenter or SEGMENTER
+    keys = [(segmenter.name, hashlib.sha1(text.encode()).digest()) for text in texts]
+    results = {}
+    with _SEGMENT_CACHE_LOCK:
+        for key in keys:
+            if key in _SEGMENT_CACHE:
+                _SEGMENT_CACHE.move_to_end(key)
+                results[key] = _SEGMENT_CACHE[key]
+    missing = {key: text for key, text in zip(keys, texts) if key not in results}
+    if missing:
+        with timer('segment'):
+            segmented = dict(zip(missing, segmenter.segment_many(list(missing.values()))))
+        results.update(segmented)
+        with _SEGMENT_CACHE_LOCK:
+            for key, sentences in segmented.items():
+                _SEGMENT_CACHE[key] = sentences
+            while len(_SEGMENT_CACHE) > SEGMENT_CACHE_SIZE:
+                _SEGMENT_CACHE.popitem(last=False)
+    return [list(results[key]) for key in keys]
+
+
 def to_bound_pattern(patterns):
     """формируем паттерны для разбиения документа на начальную, основную и финальную части"""
     return re.compile(r'(?:{}):?'.format('|'.join(r'\s*'.join(s) for s in patterns)), re.IGNORECASE)
 
 
+@timed('divide')
 def divide_into_parts(text):
     """делим документ на части по паттернам"""
     begin_pattern = to_bound_pattern(["УСТАНОВИЛ"])
@@ -27,22 +333,20 @@ def divide_into_parts(text):
 
 
 def split_sentences(html):
-    """делим на предложения основную часть приговора"""
-    soup = BeautifulSoup(html, 'html.parser')
-    for script in soup(["script", "style"]):
-        script.decompose()
-    text = soup.text
-    begin, main_part, end = divide_into_parts(text)
+    """делим на предложения основную часть приговора (html -- строка или ParsedDocument)"""
+    begin, main_part, end = divide_into_parts(as_document(html).text)
 
-    return ru_sent_tokenize(main_part)
+    return segment_many([main_part])[0]
 
 
-def predict_parts(text, clf_filename='./lib/models/finalized_parts_clf.sav'):
+def predict_parts(text, clf_filename=MODEL_PATH):
     """предсказываем метки частей для каждого предложения из основной части документа"""
-    clf = pickle.load(open(clf_filename, 'rb'))
-    return clf.predict(text)
+    clf = get_registry(clf_filename).get()
+    with timer('predict'):
+        return clf.predict(text)
 
 
+@timed('concatenate')
 def concatenate_parts(lines, tags):
     """собираем предложения с общими метками в части"""
     current_tag = None
@@ -69,3 +373,40 @@ def get_parts(html):
     sents = split_sentences(html)
     predictions = predict_parts(sents)
     return concatenate_parts(sents, predictions)
+
+
+def predict_parts_many(sentence_lists, batch_size=PREDICT_BATCH_SIZE, clf_filename=MODEL_PATH):
+    """
+    предсказываем метки для предложений многих документов:
+    предложения batch_size документов склеиваем в один вызов predict и разрезаем обратно по смещениям
+    """
+    tags = []
+    for start in range(0, len(sentence_lists), batch_size):
+        batch = sentence_lists[start:start + batch_size]
+        offsets = [0]
+        for sents in batch:
+            offsets.append(offsets[-1] + len(sents))
+        sentences = [sent for sents in batch for sent in sents]
+        predictions = predict_parts(sentences, clf_filename) if sentences else []
+        tags.extend(predictions[offsets[i]:offsets[i + 1]] for i in range(len(batch)))
+    return tags
+
+
+def get_parts_many(htmls, batch_size=PREDICT_BATCH_SIZE, clf_filename=MODEL_PATH):
+    """
+    get_parts для списка документов с пакетной классификацией предложений
+    :return: список частей в порядке htmls; None для документов, которые не удалось разбить
+    """
+    main_parts = []
+    for html in htmls:
+        try:
+            main_parts.append(divide_into_parts(as_document(html).text)[1])
+        except ValueError:
+            main_parts.append(None)
+    segmented = iter(segment_many([text for text in main_parts if text is not None]))
+    sentence_lists = [None if text is None else next(segmented) for text in main_parts]
+
+    # документ без предложений get_parts тоже не разбирает (predict не принимает пустой список)
+    standard = [sents for sents in sentence_lists if sents]
+    tags = iter(predict_parts_many(standard, batch_size, clf_filename))
+    return [concatenate_parts(sents, next(tags)) if sents else None for sents in sentence_lists]
@@ -0,0 +1,130 @@
+"""
+пул соединений только для чтения к sudact.sqlite
+
+- одно соединение sqlite нельзя делить между потоками, поэтому каждый запрос берет свое соединение из пула
+  и возвращает его по окончании; если свободных нет, а пул заполнен -- ждет, время ожидания учитывается
+- соединения открываются по uri с mode=ro и query_only: api ничего не пишет в базу
+- база переводится в режим WAL (один раз, через соединение на запись), чтобы чтение не блокировалось
+  загрузкой новых документов; mmap_size и cache_size задаются при открытии соединения
+- после fork (gunicorn с preload) соединения родителя не используются, пул создает новые
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+PRAGMAS = {
+    'mmap_size': 256 * 1024 ** 2,
+    # отрицательное значение -- размер в килобайтах
+    'cache_size': -64 * 1024,
+    'query_only': 1,
+}
+
+
+def enable_wal(path):
+    """переводим базу в WAL; на базе без прав на запись оставляем как есть"""
+    if not os.path.exists(path):
+        return None
+    try:
+        db = sqlite3.connect(path)
+        try:
+            mode, = db.execute('pragma journal_mode=wal').fetchone()
+        finally:
+            db.close()
+    except sqlite3.Error:
+        return None
+    return mode
+
+
+class ConnectionPool:
+    """не больше size соединений на процесс; connection() выдает свободное соединение на время блока with"""
+
+    def __init__(self, path, size=8, timeout=30, pragmas=None):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(PRAGMAS, **(pragmas or {}))
+        self.journal_mode = enable_wal(path)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self.borrowed = 0
+        self.waits = 0
+        self.wait_time = 0.
+        self.max_wait = 0.
+
+    def _connect(self):
+        db = sqlite3.connect('file:{}?mode=ro'.format(quote(os.path.abspath(self.path))), uri=True,
+                             check_same_thread=False, timeout=self.timeout)
+        for name, value in self.pragmas.items():
+            db.execute(f'pragma {name}={value}')
+        return db
+
+    def _acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            try:
+                return self._idle.get_nowait(), 0.
+            except queue.Empty:
+                pass
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect(), 0.
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        started = time.perf_counter()
+        try:
+            db = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f'no free connection to {self.path} in {self.timeout} s')
+        return db, time.perf_counter() - started
+
+    @contextmanager
+    def connection(self):
+        db, waited = self._acquire()
+        with self._lock:
+            self.borrowed += 1
+            if waited:
+                self.waits += 1
+                self.wait_time += waited
+                self.max_wait = max(self.max_wait, waited)
+        idle = self._idle
+        try:
+            yield db
+        finally:
+            # после fork очередь уже другая: соединение родителя просто закрываем
+            if idle is self._idle:
+                idle.put(db)
+            else:
+                db.close()
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+                self._created -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'size': self.size, 'open': self._created, 'idle': self._idle.qsize(),
+                    'journal_mode': self.journal_mode, 'borrowed': self.borrowed, 'waits': self.waits,
+                    'wait_time': round(self.wait_time, 6), 'max_wait': round(self.max_wait, 6)}
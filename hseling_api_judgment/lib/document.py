@@ -0,0 +1,69 @@
+"""
+документ судакта, разобранный один раз и общий для экстракторов метаданных и классификатора частей:
+- soup -- дерево BeautifulSoup
+- text -- текст без script и style
+- lines -- html, разбитый по <br/>
+- header -- шапка дела (строки до "установил")
+"""
+
+import os
+
+from lib.metrics import timer
+
+# html.parser есть всегда, lxml заметно быстрее, но ставится отдельно
+HTML_PARSER = os.environ.get('HTML_PARSER', 'html.parser')
+
+
+class ParsedDocument:
+    """html документа и лениво посчитанные производные от него"""
+
+    def __init__(self, html, parser=None):
+        self.html = html
+        self.parser = parser or HTML_PARSER
+        self._soup = None
+        self._text = None
+        self._lines = None
+        self._header = None
+
+    @property
+    def soup(self):
+        if self._soup is None:
+            # bs4 импортируется долго (~70 мс), а процессу API до первого разбора не нужен
+            from bs4 import BeautifulSoup
+            with timer('soup'):
+                self._soup = BeautifulSoup(self.html, self.parser)
+        return self._soup
+
+    @property
+    def text(self):
+        if self._text is None:
+            soup = self.soup
+            with timer('text'):
+                for script in soup(["script", "style"]):
+                    script.decompose()
+                self._text = soup.text
+        return self._text
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = self.html.split("<br/>")
+        return self._lines
+
+    @property
+    def header(self):
+        """ шапка дела: список строк до "установил" или весь html, если такой строки нет """
+        if self._header is None:
+            self._header = self.html
+            for i, line in enumerate(self.lines):
+                if "установил" in line.lower().replace(" ", ""):
+                    self._header = self.lines[:i]
+                    break
+        return self._header
+
+
+def as_document(doc):
+    """ ParsedDocument из строки html (готовый документ возвращаем как есть) """
+    if isinstance(doc, ParsedDocument):
+        return doc
+    return ParsedDocument(doc)
@@ -0,0 +1,152 @@
+"""
+выгрузка результатов поиска в xlsx, csv и ndjson без загрузки всей выборки в память
+
+строки читаются из курсора пачками и сразу пишутся в файл или в ответ;
+xlsx пишется в режиме constant_memory, когда xlsxwriter держит в памяти только текущую строку
+
+write_document_xlsx -- таблица по одному разобранному документу (/documents/<id>/download)
+"""
+
+import csv
+import io
+import json
+
+# колонки запроса DOCUMENT_COLUMNS и их заголовки в выгрузке (id в таблицы не попадает)
+EXPORT_COLUMNS = [
+    ('header', 'Заголовок'),
+    ('url', 'Ссылка'),
+    ('date', 'Дата'),
+    ('number', 'Номер дела'),
+    ('court', 'Суд'),
+    ('region', 'Регион'),
+    ('judge', 'Судья'),
+    ('article', 'Статья'),
+    ('accused', 'Обвиняемый'),
+    ('fabula', 'Фабула'),
+    ('witness', 'Показания свидетелей'),
+    ('prove', 'Описание доказательств'),
+    ('meditation', 'Размышления судьи'),
+]
+
+FORMATS = {
+    'xlsx': ('судебная_практика.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('судебная_практика.csv', 'text/csv; charset=utf-8'),
+    'ndjson': ('судебная_практика.ndjson', 'application/x-ndjson'),
+}
+
+# таблица одного документа: заголовки колонок, подписи строк и части документа по строкам
+DOCUMENT_COLUMNS = ['Номер', 'Дата', 'Статьи', 'Суд', 'Регион', 'Судья', 'Подсудимый(ые)', 'url']
+DOCUMENT_INFO_ROW = 'Информация о документе'
+DOCUMENT_PARTS = [
+    ('fabula', 'Фабула'),
+    ('witness', 'Показания свидетелей'),
+    ('prove', 'Доказательства'),
+    ('meditation', 'Размышления судьи'),
+]
+DOCUMENT_MIMETYPE = FORMATS['xlsx'][1]
+
+# как часто (в строках) сообщать о прогрессе
+PROGRESS_EVERY = 1000
+
+
+def iter_rows(cursor, chunk_size=500):
+    """строки курсора как словари, читаем по chunk_size; по окончании курсор закрывается"""
+    column_names = [desc[0] for desc in cursor.description]
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(column_names, row))
+    finally:
+        cursor.close()
+
+
+def _counted(rows, progress):
+    """пропускаем строки насквозь, время от времени вызывая progress(число строк)"""
+    count = 0
+    for count, row in enumerate(rows, 1):
+        yield row
+        if progress is not None and count % PROGRESS_EVERY == 0:
+            progress(count)
+    if progress is not None:
+        progress(count)
+
+
+def write_xlsx(rows, output, progress=None):
+    """пишем строки в xlsx; output -- имя файла или файловый объект"""
+    import xlsxwriter  # импортируется долго, нужен только выгрузкам
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'strings_to_urls': False})
+    worksheet = workbook.add_worksheet()
+    worksheet.write_row(0, 0, [title for _, title in EXPORT_COLUMNS])
+    for i, row in enumerate(_counted(rows, progress), 1):
+        worksheet.write_row(i, 0, [row[name] for name, _ in EXPORT_COLUMNS])
+    workbook.close()
+
+
+def iter_csv(rows, progress=None):
+    """csv по кускам; BOM в начале, чтобы Excel узнал utf-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([title for _, title in EXPORT_COLUMNS])
+    yield '\ufeff' + buffer.getvalue()
+    for row in _counted(rows, progress):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([row[name] for name, _ in EXPORT_COLUMNS])
+        yield buffer.getvalue()
+
+
+def iter_ndjson(rows, progress=None):
+    """по одному json-объекту на строку, с id документа"""
+    for row in _counted(rows, progress):
+        yield json.dumps({name: row[name] for name in ['id'] + [name for name, _ in EXPORT_COLUMNS]},
+                         ensure_ascii=False) + '\n'
+
+
+def write_export(rows, export_format, output, progress=None):
+    """пишем выгрузку в файл output в формате export_format"""
+    if export_format == 'xlsx':
+        write_xlsx(rows, output, progress)
+        return
+    chunks = iter_csv(rows, progress) if export_format == 'csv' else iter_ndjson(rows, progress)
+    with open(output, 'w', encoding='utf-8', newline='') as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def document_filename(result):
+    """имя файла по суду и номеру дела: 'ленинский_1-101_2015.xlsx'"""
+    court = result['metadata']['court'].split()[0] + '_'
+    no = result['header'].split('от')[0].strip()
+    no = no.replace('№', '').replace(r'/', '_').replace(' ', '_')
+    return (court + no).lower() + '.xlsx'
+
+
+def write_document_xlsx(result, output):
+    """
+    таблица по разобранному документу (ответ /documents/<id>): строка метаданных и части документа;
+    раскладка и оформление как у прежней выгрузки через pandas.DataFrame.to_excel
+    """
+    metadata = result['metadata']
+    parsed = result['parsed'] if isinstance(result['parsed'], dict) else {}
+    accused = metadata['accused']
+    info = [result['header'], metadata['date'], metadata['article'], metadata['court'], metadata['region'],
+            metadata['judge'], ' '.join(accused) if isinstance(accused, list) else accused, result['url']]
+
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    worksheet = workbook.add_worksheet('Sheet1')
+    # как заголовки pandas: жирный шрифт, рамка, по центру сверху
+    header = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+
+    worksheet.write_row(0, 1, DOCUMENT_COLUMNS, header)
+    worksheet.write(1, 0, DOCUMENT_INFO_ROW, header)
+    worksheet.write_row(1, 1, info)
+    worksheet.write_blank(2, 0, None, header)
+    worksheet.write(2, 1, 'Части документа:')
+    for row, (name, title) in enumerate(DOCUMENT_PARTS, 3):
+        worksheet.write(row, 0, title, header)
+        worksheet.write(row, 1, '\n'.join(parsed.get(name, '')))
+    workbook.close()
@@ -0,0 +1,227 @@
+"""
+фоновые выгрузки: задание строит файл в пуле потоков, клиент опрашивает его состояние и забирает файл
+
+- id задания -- хэш параметров выгрузки, поэтому одинаковые запросы попадают в одно задание,
+  а готовый файл отдается сразу
+- состояние задания лежит рядом с файлом (<id>.status), а не в памяти процесса: под gunicorn опрос
+  попадает в любой воркер, и повторный POST из другого воркера не запускает второе такое же задание
+- задание занимается под файловой блокировкой каталога; занятое задание, чей процесс умер, можно занять заново
+- файл пишется во временный (mkstemp в том же каталоге) и переименовывается в <id>.<формат> целиком
+- готовые файлы лежат в каталоге-кэше, общий размер которого ограничен: старые файлы удаляются первыми
+"""
+
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+# не чаще раза в столько секунд задание записывает свой ход на диск
+PROGRESS_INTERVAL = 1.
+
+SERVICE_SUFFIXES = ('.status', '.part', '.lock')
+
+
+def job_id(key):
+    """id задания по json-сериализуемым параметрам выгрузки"""
+    return hashlib.sha1(json.dumps(key, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:20]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ExportJobs:
+    """очередь выгрузок и кэш готовых файлов, общие для всех процессов с тем же каталогом"""
+
+    def __init__(self, directory, max_bytes=1024 ** 3, workers=2):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # задания, которые строит этот экземпляр, и его метка в файлах состояния
+        self._running = set()
+        self._owner = uuid.uuid4().hex
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, job):
+        return os.path.join(self.directory, f"{job['id']}.{job['format']}")
+
+    def _status_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.status')
+
+    @contextmanager
+    def _locked(self):
+        """блокировка каталога: между процессами (flock) и между потоками (у каждого свой дескриптор)"""
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self, job_id):
+        try:
+            with open(self._status_path(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, job):
+        """состояние задания целиком: временный файл и os.replace, читатели не видят недописанного"""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=f"{job['id']}.", suffix='.part')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp, self._status_path(job['id']))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _is_active(self, job):
+        """задание в очереди или строится живым процессом"""
+        if job['status'] not in (QUEUED, RUNNING):
+            return False
+        if (job.get('pid'), job.get('owner')) == (os.getpid(), self._owner):
+            # после fork (gunicorn с preload) метка у воркеров общая, поэтому сверяем и pid
+            return job['id'] in self._running
+        return job.get('pid') is not None and _pid_alive(job['pid'])
+
+    @staticmethod
+    def _public(job):
+        return {name: value for name, value in job.items() if name not in ('pid', 'owner')}
+
+    def _done(self, job):
+        """готовое задание по файлу в кэше или None, если файла нет"""
+        path = self.path(job)
+        try:
+            os.utime(path)  # отмечаем использование для вытеснения старых файлов
+            finished = os.path.getmtime(path)
+        except OSError:
+            return None
+        if job.get('status') == DONE:
+            return job
+        # файл остался от задания без состояния на диске
+        return dict(job, status=DONE, rows=None, total=None, error=None, created_at=finished, finished_at=finished)
+
+    def submit(self, key, export_format, build):
+        """
+        ставим выгрузку в очередь, если ее еще нет, прошлая попытка упала или процесс, который ее строил, умер
+        :param build: build(output_path, progress) пишет файл; progress(rows, total) сообщает о ходе работы
+        """
+        job = {'id': job_id([key, export_format]), 'format': export_format, 'status': QUEUED,
+               'rows': 0, 'total': None, 'error': None, 'created_at': time.time(), 'finished_at': None,
+               'pid': os.getpid(), 'owner': self._owner}
+        with self._locked():
+            current = self._read(job['id']) or {'id': job['id'], 'format': export_format}
+            done = self._done(current)
+            if done is not None:
+                return self._public(done)
+            if current.get('status') is not None and self._is_active(current):
+                return self._public(current)
+            # недописанные файлы упавшего или брошенного задания
+            for part in glob.glob(os.path.join(glob.escape(self.directory), f"{job['id']}.*.part")):
+                os.remove(part)
+            self._running.add(job['id'])
+            self._write(job)
+        self._pool.submit(self._run, job, build)
+        return self._public(job)
+
+    def get(self, job_id):
+        job = self._read(job_id)
+        if job is None:
+            # файл мог остаться от задания без состояния на диске
+            for export_format in self._formats_on_disk(job_id):
+                job = self._done({'id': job_id, 'format': export_format})
+                if job is not None:
+                    break
+            return self._public(job) if job else None
+        if job['status'] == DONE:
+            # файл мог быть вытеснен из кэша
+            job = self._done(job)
+        elif not self._is_active(job) and job['status'] != FAILED:
+            # процесс, строивший файл, умер; следующий POST /exports поставит задание заново
+            job = dict(job, status=FAILED, error='export worker exited')
+        return self._public(job) if job else None
+
+    def _formats_on_disk(self, job_id):
+        prefix = job_id + '.'
+        return [name[len(prefix):] for name in os.listdir(self.directory)
+                if name.startswith(prefix) and not name.endswith(SERVICE_SUFFIXES)]
+
+    def _run(self, job, build):
+        path = self.path(job)
+        fd, part = tempfile.mkstemp(dir=self.directory, prefix=f"{job['id']}.", suffix='.part')
+        os.close(fd)
+        written = {'at': 0.}
+
+        def progress(rows, total=None):
+            job['rows'] = rows
+            if total is not None:
+                job['total'] = total
+            now = time.monotonic()
+            if now - written['at'] >= PROGRESS_INTERVAL:
+                written['at'] = now
+                self._write(job)
+
+        job['status'] = RUNNING
+        self._write(job)
+        try:
+            build(part, progress)
+            os.replace(part, path)
+            job['status'] = DONE
+        except Exception as e:
+            job.update(status=FAILED, error=repr(e))
+            if os.path.exists(part):
+                os.remove(part)
+        job['finished_at'] = time.time()
+        try:
+            self._write(job)
+        finally:
+            # только после записи итога: до нее get() в этом процессе счел бы задание брошенным
+            self._running.discard(job['id'])
+        if job['status'] == DONE:
+            self._evict()
+
+    def _evict(self):
+        """удаляем давно не использованные готовые файлы, пока кэш не влезет в max_bytes"""
+        with self._locked():
+            files = []
+            for name in os.listdir(self.directory):
+                if name.endswith(SERVICE_SUFFIXES):
+                    continue
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in files)
+            for _, size, name in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                os.remove(os.path.join(self.directory, name))
+                try:
+                    os.remove(self._status_path(name.split('.')[0]))
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def stats(self):
+        """задания по состояниям, по файлам состояния в каталоге"""
+        counts = dict.fromkeys((QUEUED, RUNNING, DONE, FAILED), 0)
+        for name in os.listdir(self.directory):
+            if name.endswith('.status'):
+                job = self._read(name[:-len('.status')])
+                if job is not None and job.get('status') in counts:
+                    counts[job['status']] += 1
+        return counts
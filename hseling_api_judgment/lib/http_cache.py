@@ -0,0 +1,66 @@
+"""
+условные GET и сжатие ответов API
+
+- ETag строится из пути, поколения базы и (для разобранных документов) версии конвейера разбора:
+  пока база не перезагружена, тот же путь дает те же байты, поэтому ETag сильный
+- сжатый ответ -- другое представление, к его ETag добавляется суффикс кодировки (-gzip, -br);
+  при сравнении If-None-Match суффикс отбрасывается
+- brotli используется, если установлен пакет brotli
+"""
+
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# меньшие ответы не сжимаем: заголовки и время сжатия дороже выигрыша
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def make_etag(*parts):
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()[:24]
+
+
+def matching_etag(if_none_match, etag):
+    """тег из If-None-Match, совпавший с etag (в любой кодировке), или None"""
+    for tag in (if_none_match or '').split(','):
+        tag = tag.strip()
+        if tag == '*':
+            return etag
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag.split('-')[0] == etag:
+            return tag
+    return None
+
+
+def accepted_encoding(accept_encoding):
+    """лучшая поддерживаемая кодировка из заголовка Accept-Encoding или None"""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
@@ -0,0 +1,362 @@
+"""
+загрузка новых решений в sudact.sqlite
+
+источники:
+- каталог с файлами *.html / *.htm (url -- из <link rel="canonical">, если он есть в файле)
+- jsonl, по решению в строке: {"html": ..., "url": ..., "header": ...}, url и header необязательны
+
+повторы отбрасываются по url и по sha1 от html (в том числе среди документов, загруженных раньше);
+новые документы разбираются (get_metadict и части) пачками в пуле процессов, как в lib.batch_parse,
+и каждая пачка пишется одной транзакцией: documents, metadata, metadata_terms и facet_counts вместе.
+после пачки дополняется полнотекстовый индекс (если он построен) и, если задан, кэш разборов
+
+запуск из каталога hseling_api_judgment:
+    python -m lib.ingest --db sudact.sqlite decisions/
+    python -m lib.ingest --db sudact.sqlite --cache parse_cache.sqlite decisions.jsonl
+только подготовить базу (таблицы, индексы, sha1 уже загруженных документов) -- до включения POST /ingest:
+    python -m lib.ingest --db sudact.sqlite --prepare
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from lib.batch_parse import init_worker, parse_chunk
+from lib.classifier import PREDICT_BATCH_SIZE
+from lib.parse_cache import ParseCache, pipeline_version
+from lib.schema import SCHEMA_VERSION, bump_generation, index_facets, index_terms, migrate
+from lib.search_index import has_index, update_index
+
+# таблицы sudact.sqlite, если база создается загрузкой с нуля
+TABLES = [
+    'create table if not exists documents (id integer primary key, header text, url text, data text)',
+    '''create table if not exists metadata (document_id integer, date text, number text, court text, region text,
+        judge text, article text, accused text, fabula text, witness text, prove text, meditation text)''',
+    'create table if not exists uk_sections (id integer primary key, name text, url text, level integer)',
+]
+
+METADATA_FIELDS = ('date', 'number', 'court', 'region', 'judge', 'article', 'accused')
+PARTS = ('fabula', 'witness', 'prove', 'meditation')
+
+HTML_SUFFIXES = ('.html', '.htm')
+
+REG_H1 = re.compile(r'<h1[^>]*>(.*?)</h1>', re.S | re.I)
+REG_CANONICAL = re.compile(r'<link[^>]+rel=["\']canonical["\'][^>]*>', re.I)
+REG_HREF = re.compile(r'href=["\']([^"\']+)["\']', re.I)
+REG_TAG = re.compile(r'<[^>]+>')
+
+
+def content_hash(data):
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def make_record(item, source=None):
+    """
+    документ для загрузки из словаря {"html", "url", "header"}
+    заголовок по умолчанию -- текст h1, как в шапке решения
+    """
+    if not isinstance(item, dict) or not isinstance(item.get('html'), str) or not item['html'].strip():
+        raise ValueError(f'{source or "document"}: no html')
+    data = item['html']
+    header = item.get('header')
+    if not header:
+        match = REG_H1.search(data)
+        header = ' '.join(html.unescape(REG_TAG.sub('', match.group(1))).split()) if match else None
+    return {'html': data, 'url': item.get('url') or None, 'header': header, 'hash': content_hash(data),
+            'source': source}
+
+
+def canonical_url(data):
+    link = REG_CANONICAL.search(data)
+    href = REG_HREF.search(link.group(0)) if link else None
+    return html.unescape(href.group(1)) if href else None
+
+
+def read_directory(path):
+    """решения из html-файлов каталога (рекурсивно, в порядке имен)"""
+    for file_path in sorted(Path(path).rglob('*')):
+        if file_path.suffix.lower() in HTML_SUFFIXES and file_path.is_file():
+            data = file_path.read_text(encoding='utf-8', errors='replace')
+            yield make_record({'html': data, 'url': canonical_url(data)}, str(file_path))
+
+
+def read_jsonl(lines, name='jsonl'):
+    for number, line in enumerate(lines, 1):
+        if line.strip():
+            try:
+                item = json.loads(line)
+            except ValueError:
+                raise ValueError(f'{name}:{number}: invalid json')
+            yield make_record(item, f'{name}:{number}')
+
+
+def read_records(path):
+    """каталог -- html-файлы, иначе jsonl ('-' -- стандартный ввод)"""
+    if path == '-':
+        yield from read_jsonl(sys.stdin, 'stdin')
+    elif os.path.isdir(path):
+        yield from read_directory(path)
+    else:
+        with open(path, encoding='utf-8') as f:
+            yield from read_jsonl(f, path)
+
+
+def chunked(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def record_keys(record):
+    keys = [('hash', record['hash'])]
+    if record['url']:
+        keys.append(('url', record['url']))
+    return keys
+
+
+def backfill_hashes(db, chunk_size=1000, out=None):
+    """sha1 документов, появившихся в базе не через загрузку (по возрастанию id, каждая пачка -- транзакция)"""
+    last_id, = db.execute('select coalesce(max(document_id), 0) from document_hashes').fetchone()
+    total = 0
+    while True:
+        rows = db.execute('select id, data from documents where id > ? order by id limit ?',
+                          (last_id, chunk_size)).fetchall()
+        if not rows:
+            return total
+        with db:
+            db.executemany('insert or ignore into document_hashes values (?, ?)',
+                           [(content_hash(data or ''), doc_id) for doc_id, data in rows])
+        last_id, total = rows[-1][0], total + len(rows)
+        if out is not None:
+            print(f'hashed documents up to id {last_id}', file=out)
+
+
+def prepare(db, out=None):
+    """таблицы, индексы фильтров и фасетов, sha1 уже загруженных документов; повторный вызов почти бесплатен"""
+    with db:
+        for sql in TABLES:
+            db.execute(sql)
+        db.execute('''create table if not exists document_hashes (
+            hash text primary key,
+            document_id integer not null
+        ) without rowid''')
+        db.execute('create index if not exists document_hashes_document_id on document_hashes(document_id)')
+        db.execute('create index if not exists documents_url on documents(url)')
+    migrate(db, out, analyze=False)
+    backfill_hashes(db, out=out)
+
+
+def is_prepared(db):
+    """база прошла prepare: есть document_hashes и схема lib.schema последней версии"""
+    version, = db.execute('pragma user_version').fetchone()
+    row = db.execute("select 1 from sqlite_master where type='table' and name='document_hashes'").fetchone()
+    return row is not None and version >= SCHEMA_VERSION
+
+
+def is_duplicate(db, record):
+    if db.execute('select 1 from document_hashes where hash=?', (record['hash'],)).fetchone():
+        return True
+    if not record['url']:
+        return False
+    return db.execute('select 1 from documents where url=?', (record['url'],)).fetchone() is not None
+
+
+def metadata_row(db_id, result):
+    """строка metadata по ответу /documents/<id>; 'undefined' пишем как null, списки -- через запятую"""
+    metadata, parsed = result['metadata'], result['parsed']
+    values = []
+    for field in METADATA_FIELDS:
+        value = metadata.get(field)
+        if isinstance(value, list):
+            value = ', '.join(value)
+        values.append(None if value in (None, '', 'undefined') else value)
+    parts = parsed if isinstance(parsed, dict) else {}
+    return (db_id, *values, *(('\n'.join(parts[part]) if parts.get(part) else None) for part in PARTS))
+
+
+def write_documents(db, records, results):
+    """
+    пишем разобранные документы одной транзакцией
+    повторы проверяются заново под блокировкой на запись: пока документ разбирался, его мог записать
+    другой процесс (воркер API или lib.ingest из командной строки)
+    :param results: {номер в records: ответ /documents/<id>}; неразобранные документы не пишутся
+    :return: [(id, ответ)] с настоящими id и число документов, оказавшихся повторами
+    """
+    written, rows, duplicates = [], [], 0
+    with db:
+        db.execute('begin immediate')
+        for position, record in enumerate(records):
+            result = results.get(position)
+            if result is None:
+                continue
+            if is_duplicate(db, record):
+                duplicates += 1
+                continue
+            cursor = db.execute('insert into documents (header, url, data) values (?, ?, ?)',
+                                (record['header'], record['url'], record['html']))
+            db_id = cursor.lastrowid
+            db.execute('insert into document_hashes values (?, ?)', (record['hash'], db_id))
+            result = dict(result, db_id=db_id)
+            written.append((db_id, result))
+            rows.append(metadata_row(db_id, result))
+        db.executemany('''insert into metadata (document_id, date, number, court, region, judge, article, accused,
+            fabula, witness, prove, meditation) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+        index_terms(db, [(row[0], row[5], row[6]) for row in rows])
+        index_facets(db, [(row[0], row[4], row[1], row[5], row[6]) for row in rows])
+        if written:
+            bump_generation(db)
+    return written, duplicates
+
+
+class _Done:
+    """готовый результат разбора в этом же процессе (интерфейс Future)"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+def ingest(db, records, submit=None, chunk_size=100, max_pending=1, cache=None, out=None,
+           batch_size=PREDICT_BATCH_SIZE):
+    """
+    загружаем документы в подготовленную (prepare) базу и возвращаем статистику
+    :param submit: submit пула процессов для parse_chunk; None -- разбор в этом же процессе
+    :param max_pending: сколько пачек может разбираться одновременно (записываются строго по порядку)
+    :param cache: ParseCache, куда кладутся готовые разборы новых документов
+    """
+    if submit is None:
+        def submit(fn, *args):
+            return _Done(fn(*args))
+
+    counts = Counter(read=0, inserted=0, duplicates=0, failed=0)
+    timings = Counter()
+    pending = deque()
+    # ключи документов, которые разбираются, но еще не записаны
+    queued = set()
+    fts = has_index(db)
+    version = pipeline_version() if cache is not None else None
+    started = time.perf_counter()
+
+    def write_oldest():
+        fresh, future = pending.popleft()
+        results, errors, chunk_timings = future.result()
+        timings.update(chunk_timings)
+        start = time.perf_counter()
+        written, duplicates = write_documents(db, fresh, dict(results))
+        timings['write'] += time.perf_counter() - start
+        start = time.perf_counter()
+        if fts:
+            update_index(db)
+        if cache is not None:
+            cache.put_many(written, version)
+        timings['index'] += time.perf_counter() - start
+
+        queued.difference_update(key for record in fresh for key in record_keys(record))
+        counts['inserted'] += len(written)
+        counts['duplicates'] += duplicates
+        counts['failed'] += len(errors)
+        for position, error in errors:
+            print(f"{fresh[position]['source'] or position}: {error}", file=out or sys.stderr)
+        if out is not None and written:
+            elapsed = time.perf_counter() - started
+            print(f"last id {written[-1][0]}: {counts['inserted']} inserted, {counts['duplicates']} duplicates, "
+                  f"{counts['failed']} failed, {counts['inserted'] / elapsed:.1f} docs/sec", file=out)
+
+    read_start = time.perf_counter()
+    for chunk in chunked(records, chunk_size):
+        fresh = []
+        for record in chunk:
+            keys = record_keys(record)
+            if queued.intersection(keys) or is_duplicate(db, record):
+                counts['duplicates'] += 1
+                continue
+            queued.update(keys)
+            fresh.append(record)
+        counts['read'] += len(chunk)
+        timings['read'] += time.perf_counter() - read_start
+        if fresh:
+            rows = [(position, record['header'], record['url'], record['html'])
+                    for position, record in enumerate(fresh)]
+            pending.append((fresh, submit(parse_chunk, rows, batch_size)))
+            while len(pending) >= max_pending:
+                write_oldest()
+        read_start = time.perf_counter()
+    while pending:
+        write_oldest()
+
+    elapsed = time.perf_counter() - started
+    return dict(counts, seconds=elapsed, docs_per_sec=counts['inserted'] / elapsed if elapsed else None,
+                timings=dict(timings))
+
+
+def run(db_path, source, chunk_size=100, workers=None, cache_path=None, out=sys.stderr,
+        batch_size=PREDICT_BATCH_SIZE, names_fallback=None):
+    """
+    загрузка из каталога или jsonl с разбором в пуле процессов (workers=0 -- в этом же процессе)
+    :param names_fallback: настройки запасного поиска имен наташей (см. lib.batch_parse.init_worker)
+    """
+    workers = os.cpu_count() if workers is None else workers
+    init_worker(names_fallback)
+    db = sqlite3.connect(db_path)
+    prepare(db, out)
+    cache = ParseCache(cache_path, maxsize=0) if cache_path else None
+    records = read_records(source)
+    try:
+        if not workers:
+            stats = ingest(db, records, chunk_size=chunk_size, cache=cache, out=out, batch_size=batch_size)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(names_fallback,)) as pool:
+                stats = ingest(db, records, pool.submit, chunk_size, 2 * workers, cache, out, batch_size)
+    finally:
+        db.close()
+    print(stats, file=out)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='загрузка новых решений в sudact.sqlite')
+    parser.add_argument('source', nargs='?', help='каталог с html-файлами или jsonl ("-" -- стандартный ввод)')
+    parser.add_argument('--db', default='sudact.sqlite')
+    parser.add_argument('--prepare', action='store_true', help='только подготовить базу для POST /ingest')
+    parser.add_argument('--cache', default=None, help='положить разборы новых документов в этот кэш parse_document')
+    parser.add_argument('--chunk-size', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=PREDICT_BATCH_SIZE,
+                        help='сколько документов классифицировать одним вызовом predict')
+    parser.add_argument('--workers', type=int, default=None, help='по умолчанию -- число ядер, 0 -- без пула')
+    parser.add_argument('--no-names-fallback', action='store_true',
+                        help='не искать обвиняемых наташей (быстрее, результаты пишутся под отдельной версией)')
+    args = parser.parse_args(argv)
+    if args.prepare:
+        db = sqlite3.connect(args.db)
+        prepare(db, out=sys.stderr)
+        db.close()
+        return
+    if args.source is None:
+        parser.error('source is required')
+    names_fallback = {'enabled': False if args.no_names_fallback else None}
+    try:
+        run(args.db, args.source, args.chunk_size, args.workers, args.cache, batch_size=args.batch_size,
+            names_fallback=names_fallback)
+    except ValueError as e:
+        sys.exit(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,12 +8,29 @@
 - статьи, связанные с судебной практикой
 """
 
+import os
 import re
+import threading
+import time
 from collections import Counter
-from bs4 import BeautifulSoup
-from natasha import NamesExtractor
+from functools import lru_cache
 
-EXTRACTOR = NamesExtractor()
+from lib.document import as_document
+from lib.metrics import timer
+
+# запасной поиск обвиняемых наташей -- самая медленная часть разбора шапки:
+# NAMES_FALLBACK=0 выключает его, NAMES_FALLBACK_BUDGET -- секунд на документ (0 -- без ограничения)
+NAMES_FALLBACK = {
+    'enabled': os.environ.get('NAMES_FALLBACK', '1') == '1',
+    'budget': float(os.environ.get('NAMES_FALLBACK_BUDGET', 0)),
+}
+
+# сколько документов разобрано, в скольких сработал запасной поиск, сколько строк он обработал и пропустил
+NAMES_STATS = Counter()
+_STATS_LOCK = threading.Lock()
+
+_EXTRACTOR = None
+_EXTRACTOR_LOCK = threading.Lock()
 
 # необходимые регулярные выражения
 
@@ -27,6 +44,10 @@ FIO_ABBR = re.compile(r"[А-Я][а-яА-Я\-]{1,25} ФИО[0-9]{1,3}")
 FIO_SHORT = re.compile(r"ФИО[0-9]{1,3}")
 REG_CAPS = re.compile(r"[А-Я]{1,20} [А-Я]{1,20} [А-Я]{1,20}")
 
+# шаблоны, которые ищутся в строках шапки вместе, в порядке, в котором find_accused складывает их результаты
+NAME_PATTERNS = (("fio1", FIO1), ("fio2", FIO2), ("fio_abbr", FIO_ABBR), ("reg_caps", REG_CAPS))
+FULL_NAME_TAGS = ("fio1", "fio2")
+
 # дата в формате "11 июля 2015"
 REG_DATE = re.compile("[0-9]{1,2} [а-яА-Я]{1,15} [0-9]{4}")
 
@@ -75,8 +96,17 @@ key2city = {"югра": "Ханты-Мансийский автономный о
             "чукот": "Чукотский автономный округ",
             "москв": "Москва"}
 
+# индексы для нормализации, строятся один раз:
+# - название региона в нижнем регистре -> название из списка (при совпадении в регистре побеждает первое)
+# - одно регулярное выражение на все указатели региона: один проход по строке вместо цикла по словам
+ALL_REGIONS_SET = frozenset(ALL_REGIONS)
+REGIONS_BY_LOWER = {}
+for _region in ALL_REGIONS:
+    REGIONS_BY_LOWER.setdefault(_region.lower(), _region)
+REGION_NAMES_RE = re.compile("|".join(map(re.escape, REGION_NAMES)))
+
 
-# doc_str -- html в простом строковом виде
+# doc_str -- html в простом строковом виде или уже разобранный ParsedDocument
 
 # НОМЕР
 def get_number(soup_format):
@@ -101,21 +131,34 @@ def get_date(soup_format):
 
 
 # СУД
+def get_court_string(soup_format):
+    """ строка суда из последнего <div class="b-justice"> (или ссылки в нем) """
+    court_string = "undefined"
+    for div in soup_format.find_all("div", class_="b-justice"):
+        if div["class"] != ['b-justice']:
+            continue
+        court = div.find("a") or div
+        court_string = court.string
+    return court_string
+
+
 def get_court(soup_format):
     """ достаем название суда """
-    court_string = "undefined"
-    # ищем в тегах соответствующий тег
-    for i in soup_format.find_all("div"):
-        try:
-            if i["class"] == ['b-justice']:
-                if i.find("a"):
-                    court = i.find("a")
-                else:
-                    court = i
-                court_string = court.string
-        except KeyError:
-            pass
+    return resolve_court(get_court_string(soup_format))[0]
+
 
+@lru_cache(maxsize=8192)
+def resolve_court(court_string):
+    """
+    строка суда со страницы -> (название суда, регион)
+    судов несколько тысяч, поэтому результат запоминается для всех документов
+    """
+    court = clean_court(court_string)
+    return court, get_region(get_city(court))
+
+
+def clean_court(court_string):
+    """ убираем из названия суда вид судопроизводства """
     court_string = court_string.replace("- Уголовное", "")
     court_string = court_string.replace("- Гражданские и административные", "")
     court_string = court_string.replace("- Административные правонарушения", "")
@@ -126,10 +169,7 @@ def get_court(soup_format):
 # РЕГИОН
 def is_with_region(line):
     """ узнаем, есть ли регион в строке """
-    for region in REGION_NAMES:
-        if region in line.lower():
-            return True
-    return False
+    return REGION_NAMES_RE.search(line.lower()) is not None
 
 
 def get_city(court_string):
@@ -150,6 +190,7 @@ def preprocess_region(region):
     return region
 
 
+@lru_cache(maxsize=4096)
 def get_region(raw_region):
     """
     находим соответствие региону в списке
@@ -157,35 +198,48 @@ def get_region(raw_region):
     :return: регион из списка
     """
     region = raw_region.strip()
-    if region in ALL_REGIONS:
-        return region
-
-    for reg in ALL_REGIONS:
-        if region.lower() == reg.lower():
-            region = reg
-            return region
+    lower = region.lower()
+    if lower in REGIONS_BY_LOWER:
+        return REGIONS_BY_LOWER[lower]
 
     for key in key2city:
-        if key in region.lower():
+        if key in lower:
             return key2city[key]
 
     region = preprocess_region(region)
-    if region in ALL_REGIONS:
+    if region in ALL_REGIONS_SET:
         return region
 
     return "Регион не определен"
 
 
+# ИМЕНА
+@lru_cache(maxsize=4096)
+def name_hits(line):
+    """
+    все совпадения NAME_PATTERNS в строке: кортеж (тег, совпадение) в порядке шаблонов
+    одни и те же строки шапки проверяются несколько раз (разбиение, поиск обвиняемых), поэтому
+    результат запоминается и каждая строка просматривается один раз
+    """
+    return tuple((tag, match) for tag, pattern in NAME_PATTERNS for match in pattern.findall(line))
+
+
+def full_names(line):
+    """ совпадения FIO1, затем FIO2 """
+    return [match for tag, match in name_hits(line) if tag in FULL_NAME_TAGS]
+
+
 # СУДЬЯ
 def get_judge(doc_str):
     """ достаем имена судей """
-    judge_str = doc_str.split("Судьи дела:")[-1]
+    doc = as_document(doc_str)
+    judge_str = doc.html.split("Судьи дела:")[-1]
     judge_str = judge_str.split("(судья)")[0].replace("</h3>", "").strip()
     if len(judge_str) < 50:
         return judge_str
-    for line in doc_str.split("<br/>"):
+    for line in doc.lines:
         if "Судья" in line:
-            judge_names = re.findall(FIO1, line) + re.findall(FIO2, line)
+            judge_names = full_names(line)
             if judge_names:
                 return judge_names[0]
     return "undefined"
@@ -194,16 +248,18 @@ def get_judge(doc_str):
 # СТАТЬЯ
 def get_article(doc_str):
     """ достаем номера релевантных статей """
+    doc = as_document(doc_str)
     articles = []
-    for line in doc_str.split("<"):
+    for line in doc.html.split("<"):
         if "Судебная практика по применению" in line:
             articles.append(line.split("ст.")[-1].strip())
 
     # выбираем из шапки
-    header = get_first(doc_str)
-    if "ст." in "".join(header):
-        splitted_header = "".join(header).split("ст.")
-        article = BeautifulSoup(splitted_header[-1]).a
+    header = "".join(get_first(doc))
+    if "ст." in header:
+        from bs4 import BeautifulSoup
+        splitted_header = header.split("ст.")
+        article = BeautifulSoup(splitted_header[-1], 'html.parser').a
         if article:
             articles.append(article.string)
 
@@ -218,12 +274,7 @@ def get_article(doc_str):
 # ПОДСУДИМЫЙ
 def get_first(doc_str):
     """ достаем шапку дела """
-    header = doc_str
-    for i, line in enumerate(doc_str.split("<br/>")):
-        if "установил" in line.lower().replace(" ", ""):
-            header = doc_str.split("<br/>")[:i]
-            break
-    return header
+    return as_document(doc_str).header
 
 
 def splitting_text(header_lines):
@@ -234,14 +285,14 @@ def splitting_text(header_lines):
     # выбираем разделитель, по которому мы это делаем
     # (стараемся минимизировать число имен в строке)
     for line in lines:
-        if len(FIO1.findall(line) + FIO2.findall(line)) > 1:
+        if len(full_names(line)) > 1:
             trouble_counter += 1
     if trouble_counter != 0:
         lines = [line for line in text.split("\n") if line.strip()]
 
     new_lines = []
     for line in lines:
-        if len(FIO1.findall(line) + FIO2.findall(line)) > 2:
+        if len(full_names(line)) > 2:
             new_lines += line.split(",")
         else:
             new_lines.append(line)
@@ -280,29 +331,100 @@ def kill_doubles(name_list):
     return name_list
 
 
-def get_names(line):
-    """ достаем из строки имена наташей """
+def get_extractor():
+    """ NamesExtractor строится при первом обращении: он долго грузится, а нужен не для каждого документа """
+    global _EXTRACTOR
+    if _EXTRACTOR is None:
+        with _EXTRACTOR_LOCK:
+            if _EXTRACTOR is None:
+                from natasha import NamesExtractor
+                _EXTRACTOR = NamesExtractor()
+    return _EXTRACTOR
+
+
+def configure_names_fallback(enabled=None, budget=None):
+    """ включаем или выключаем запасной поиск наташей, задаем бюджет времени на документ """
+    if enabled is not None:
+        NAMES_FALLBACK['enabled'] = enabled
+    if budget is not None:
+        NAMES_FALLBACK['budget'] = budget
+
+
+def extractor_loaded():
+    return _EXTRACTOR is not None
+
+
+def names_fallback_tag():
+    """ отметка нестандартных настроек для версии кэша разбора: с ними результаты другие """
+    if NAMES_FALLBACK['enabled'] and not NAMES_FALLBACK['budget']:
+        return ''
+    if not NAMES_FALLBACK['enabled']:
+        return 'names-off'
+    return 'names-budget-{:g}'.format(NAMES_FALLBACK['budget'])
+
+
+@lru_cache(maxsize=4096)
+def _extract_names(line):
     names = []
-    matches = EXTRACTOR(line.title())
-    for match in matches:
+    for match in get_extractor()(line):
         fact = match.fact.as_json
         if "first" in fact.keys() and "middle" in fact.keys() and "last" in fact.keys():
             name = fact["first"][0].upper() + "." + fact["middle"][0].upper() \
                    + ". " + fact["last"].capitalize()
             names.append(name)
+    return tuple(names)
+
+
+def get_names(line):
+    """ достаем из строки имена наташей (результат запоминается по нормализованной строке) """
+    return list(_extract_names(" ".join(line.split()).title()))
+
+
+def fallback_names(line, usage):
+    """ get_names с учетом выключателя и бюджета времени документа; usage -- счетчики документа """
+    budget = NAMES_FALLBACK['budget']
+    if not NAMES_FALLBACK['enabled'] or (budget and usage['names_fallback_seconds'] >= budget):
+        usage['names_fallback_skipped'] += 1
+        return []
+    start = time.perf_counter()
+    names = get_names(line)
+    usage['names_fallback_seconds'] += time.perf_counter() - start
+    usage['names_fallback_lines'] += 1
     return names
 
 
+def names_fallback_stats():
+    with _STATS_LOCK:
+        stats = dict(NAMES_STATS)
+    info = _extract_names.cache_info()
+    stats.update(NAMES_FALLBACK, extractor_loaded=extractor_loaded(),
+                 memo_hits=info.hits, memo_misses=info.misses, memo_size=info.currsize)
+    return stats
+
+
 def find_accused(line):
     """ стандартный шаблон для начального поиска обвиняемых """
-    accused_names = [x.title() for x in re.findall(FIO1, line)] + \
-                    [x.title() for x in re.findall(FIO2, line)] \
-                    + re.findall(FIO_ABBR, line) + re.findall(REG_CAPS, line)
+    return [match.title() if tag in FULL_NAME_TAGS else match for tag, match in name_hits(line)]
+
+
+def get_accused_name(doc_str, stats=None):
+    """
+    рулы для поиска обвиняемых
+    :param stats: Counter, куда добавляются счетчики запасного поиска наташей по этому документу
+    """
+    usage = Counter()
+    accused_names = _get_accused_name(doc_str, usage)
+    usage['names_documents'] += 1
+    if usage['names_fallback_lines']:
+        usage['names_fallback_documents'] += 1
+    with _STATS_LOCK:
+        NAMES_STATS.update(usage)
+    if stats is not None:
+        stats.update(usage)
     return accused_names
 
 
-def get_accused_name(doc_str):
-    """ рулы для поиска обвиняемых  """
+def _get_accused_name(doc_str, usage):
     accused_names = []
     accused_lines = get_accused_lines(doc_str)
 
@@ -329,7 +451,7 @@ def get_accused_name(doc_str):
         if not accused_names:
             accused_names += re.findall(FIO3, line)
         if not accused_names:
-            accused_names += get_names(line)
+            accused_names += fallback_names(line, usage)
 
     # правим имена
     accused_names = [x.replace(",", ".") for x in accused_names]
@@ -349,19 +471,28 @@ def get_accused_name(doc_str):
     return accused_names
 
 
-def get_metadict(doc_str):
-    """ собираем все в словарь """
+def get_metadict(doc_str, stats=None):
+    """
+    собираем все в словарь
+    :param stats: Counter для счетчиков разбора (см. get_accused_name)
+    """
 
-    soup_format = BeautifulSoup(doc_str, 'html.parser')
+    doc = as_document(doc_str)
+    soup_format = doc.soup
 
     metadict = {}
-    metadict["date"] = get_date(soup_format)
-    metadict["number"] = get_number(soup_format)
-    metadict["court"] = get_court(soup_format)
-    metadict["region"] = get_region(get_city(metadict["court"]))
-    metadict["judge"] = get_judge(doc_str)
-    metadict["article"] = get_article(doc_str)
-    metadict["accused"] = get_accused_name(doc_str)
+    with timer('metadata.date'):
+        metadict["date"] = get_date(soup_format)
+    with timer('metadata.number'):
+        metadict["number"] = get_number(soup_format)
+    with timer('metadata.court'):
+        metadict["court"], metadict["region"] = resolve_court(get_court_string(soup_format))
+    with timer('metadata.judge'):
+        metadict["judge"] = get_judge(doc)
+    with timer('metadata.article'):
+        metadict["article"] = get_article(doc)
+    with timer('metadata.accused'):
+        metadict["accused"] = get_accused_name(doc, stats)
 
     for key in metadict:
         if not metadict[key]:
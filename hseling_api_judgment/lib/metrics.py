@@ -0,0 +1,207 @@
+"""
+время стадий разбора и счетчики событий процесса
+
+- timer(stage) -- контекстный менеджер, добавляет время блока к сумме стадии; timed(stage) -- то же декоратором
+- increment(name) -- счетчик событий
+- profiling() -- разбивка по стадиям для одного запроса (в текущем потоке), см. server_timing
+- render() -- все в текстовом формате Prometheus для /metrics
+
+METRICS=0 выключает сбор: timer тогда возвращает пустой контекст и стоит один вызов функции
+(разбивка запроса, если ее запросили, собирается все равно)
+"""
+
+import bisect
+import functools
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+ENABLED = os.environ.get('METRICS', '1') == '1'
+
+PREFIX = 'judgment'
+
+# границы корзин гистограммы времени ответа, секунды
+REQUEST_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+
+
+class Registry:
+    """суммы времени и числа вызовов по стадиям, счетчики и гистограмма времени ответов"""
+
+    def __init__(self, buckets=REQUEST_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.seconds = Counter()
+            self.calls = Counter()
+            self.counters = Counter()
+            # (endpoint, status) -> [число ответов по корзинам..., сумма времени]
+            self.requests = {}
+
+    def observe(self, stage, elapsed):
+        with self._lock:
+            self.seconds[stage] += elapsed
+            self.calls[stage] += 1
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def observe_request(self, endpoint, status, elapsed):
+        key = (endpoint or 'unknown', str(status))
+        with self._lock:
+            row = self.requests.get(key)
+            if row is None:
+                row = self.requests[key] = [0] * (len(self.buckets) + 2)
+            row[bisect.bisect_left(self.buckets, elapsed)] += 1
+            row[-1] += elapsed
+
+    def render(self, gauges=None):
+        """
+        текстовый формат Prometheus
+        :param gauges: {группа: {имя: число}} -- текущие значения (статистика кэшей, пула и т.п.)
+        """
+        with self._lock:
+            seconds, calls = dict(self.seconds), dict(self.calls)
+            counters = dict(self.counters)
+            requests = {key: list(row) for key, row in self.requests.items()}
+
+        lines = [f'# HELP {PREFIX}_stage_seconds time spent in parsing stages and SQL queries',
+                 f'# TYPE {PREFIX}_stage_seconds summary']
+        for stage in sorted(seconds):
+            labels = _labels(stage=stage)
+            lines.append(f'{PREFIX}_stage_seconds_sum{labels} {seconds[stage]:.6f}')
+            lines.append(f'{PREFIX}_stage_seconds_count{labels} {calls[stage]}')
+
+        lines += [f'# HELP {PREFIX}_events_total events counted by the API',
+                  f'# TYPE {PREFIX}_events_total counter']
+        for name in sorted(counters):
+            lines.append(f'{PREFIX}_events_total{_labels(name=name)} {counters[name]}')
+
+        lines += [f'# HELP {PREFIX}_request_seconds HTTP response time',
+                  f'# TYPE {PREFIX}_request_seconds histogram']
+        for (endpoint, status), row in sorted(requests.items()):
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), row):
+                total += count
+                labels = _labels(endpoint=endpoint, status=status, le=bound)
+                lines.append(f'{PREFIX}_request_seconds_bucket{labels} {total}')
+            labels = _labels(endpoint=endpoint, status=status)
+            lines.append(f'{PREFIX}_request_seconds_sum{labels} {row[-1]:.6f}')
+            lines.append(f'{PREFIX}_request_seconds_count{labels} {total}')
+
+        for group, values in sorted((gauges or {}).items()):
+            for name, value in sorted(values.items()):
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    lines.append(f'# TYPE {PREFIX}_{group}_{name} gauge')
+                    lines.append(f'{PREFIX}_{group}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+REGISTRY = Registry()
+
+_local = threading.local()
+
+
+class _Timer:
+    __slots__ = ('stage', 'profile', 'start')
+
+    def __init__(self, stage, profile):
+        self.stage = stage
+        self.profile = profile
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        if ENABLED:
+            REGISTRY.observe(self.stage, elapsed)
+        if self.profile is not None:
+            self.profile[self.stage] += elapsed
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage):
+    """with timer('soup'): ... -- время блока идет в стадию stage"""
+    profile = getattr(_local, 'profile', None)
+    if not ENABLED and profile is None:
+        return _NULL_TIMER
+    return _Timer(stage, profile)
+
+
+def timed(stage):
+    """декоратор: время каждого вызова функции идет в стадию stage"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(name, value=1):
+    if ENABLED:
+        REGISTRY.increment(name, value)
+
+
+@contextmanager
+def profiling():
+    """разбивка по стадиям всего, что выполнится в блоке в этом потоке: Counter {стадия: секунды}"""
+    previous = getattr(_local, 'profile', None)
+    profile = _local.profile = Counter()
+    try:
+        yield profile
+    finally:
+        _local.profile = previous
+
+
+def start_profile():
+    """profiling() для хуков before/after_request, которые не оборачивают запрос целиком"""
+    profile = _local.profile = Counter()
+    return profile
+
+
+def stop_profile():
+    profile = getattr(_local, 'profile', None)
+    _local.profile = None
+    return profile
+
+
+def server_timing(profile, total=None):
+    """заголовок Server-Timing: стадии в миллисекундах, от самых долгих"""
+    items = [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in profile.most_common()]
+    if total is not None:
+        items.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(items)
+
+
+def render(gauges=None):
+    return REGISTRY.render(gauges)
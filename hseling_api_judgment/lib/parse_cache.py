@@ -0,0 +1,218 @@
+"""
+кэш результатов parse_document
+
+- в памяти процесса держим ограниченный LRU
+- на диске -- таблица parsed_documents в отдельной базе sqlite
+- ключ -- id документа и версия конвейера разбора (хэш кода экстракторов, файла модели и html-парсера),
+  поэтому при изменении metadata_extractor.py, classifier.py, модели или HTML_PARSER старые записи перестают читаться
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from lib import document
+from lib.classifier import MODEL_PATH
+from lib.metadata_extractor import names_fallback_tag
+
+LIB_DIR = Path(__file__).parent
+
+# файлы, от которых зависит результат разбора документа
+PIPELINE_FILES = [
+    LIB_DIR / 'document.py',
+    LIB_DIR / 'metadata_extractor.py',
+    LIB_DIR / 'classifier.py',
+    LIB_DIR / 'pipeline.py',
+    MODEL_PATH,
+]
+
+_VERSION_LOCK = threading.Lock()
+_VERSION = {'stamp': None, 'version': None}
+
+
+def _files_stamp(files):
+    stamp = []
+    for filename in files:
+        try:
+            st = Path(filename).stat()
+            stamp.append((str(filename), st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append((str(filename), None, None))
+    return tuple(stamp)
+
+
+def pipeline_version(files=None):
+    """
+    хэш содержимого файлов конвейера и имени html-парсера (lxml и html.parser строят разные деревья);
+    пересчитывается только при изменении mtime/размера файлов или парсера
+    к нему добавляются настройки, меняющие результат разбора (выключенный поиск имен наташей)
+    """
+    tag = names_fallback_tag()
+    version = _files_version(PIPELINE_FILES if files is None else files, document.HTML_PARSER)
+    return f'{version}-{tag}' if tag else version
+
+
+def _files_version(files, parser):
+    stamp = (parser, _files_stamp(files))
+    with _VERSION_LOCK:
+        if _VERSION['stamp'] == stamp:
+            return _VERSION['version']
+        digest = hashlib.sha1(parser.encode())
+        for filename, mtime, _ in stamp[1]:
+            digest.update(filename.encode())
+            if mtime is not None:
+                with open(filename, 'rb') as f:
+                    digest.update(hashlib.sha1(f.read()).digest())
+        version = digest.hexdigest()[:16]
+        _VERSION['stamp'], _VERSION['version'] = stamp, version
+        return version
+
+
+class ParseCache:
+    """LRU в памяти + таблица parsed_documents на диске"""
+
+    def __init__(self, db_path='parse_cache.sqlite', maxsize=1024):
+        self.db_path = db_path
+        self.maxsize = maxsize
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30)
+            db.execute('pragma journal_mode=wal')
+            db.execute('''create table if not exists parsed_documents (
+                document_id integer not null,
+                version text not null,
+                data text not null,
+                created_at real not null,
+                primary key (document_id, version)
+            )''')
+            db.execute('''create table if not exists parse_checkpoints (
+                name text not null,
+                version text not null,
+                last_id integer not null,
+                updated_at real not null,
+                primary key (name, version)
+            )''')
+            db.commit()
+            self._local.db = db
+        return db
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._lru[key] = result
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+
+    def get(self, doc_id, version=None):
+        """отдаем сохраненный разбор документа или None"""
+        key = (doc_id, version or pipeline_version())
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return self._lru[key]
+
+        row = self._connect().execute('select data from parsed_documents where document_id=? and version=?',
+                                      key).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        result = json.loads(row[0])
+        self._remember(key, result)
+        with self._lock:
+            self.disk_hits += 1
+        return result
+
+    def get_many(self, doc_ids, version=None):
+        """{doc_id: разбор} для сохраненных документов из doc_ids (без повторов); с диска -- одним запросом"""
+        version = version or pipeline_version()
+        found, missing = {}, []
+        with self._lock:
+            for doc_id in doc_ids:
+                key = (doc_id, version)
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    self.hits += 1
+                    found[doc_id] = self._lru[key]
+                else:
+                    missing.append(doc_id)
+
+        db = self._connect()
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            rows = db.execute('select document_id, data from parsed_documents where version=? and document_id in ({})'
+                              .format(', '.join('?' * len(chunk))), [version] + chunk).fetchall()
+            for doc_id, data in rows:
+                found[doc_id] = json.loads(data)
+                self._remember((doc_id, version), found[doc_id])
+        with self._lock:
+            self.disk_hits += len(found) - (len(doc_ids) - len(missing))
+            self.misses += len(doc_ids) - len(found)
+        return found
+
+    def put(self, doc_id, result, version=None):
+        self.put_many([(doc_id, result)], version)
+
+    def put_many(self, items, version=None, checkpoint=None):
+        """
+        сохраняем пачку разборов [(doc_id, result)] одной транзакцией
+        :param checkpoint: (имя, последний id) -- отметка прогресса пакетной обработки в той же транзакции
+        """
+        version = version or pipeline_version()
+        now = time.time()
+        rows = []
+        for doc_id, result in items:
+            self._remember((doc_id, version), result)
+            rows.append((doc_id, version, json.dumps(result, ensure_ascii=False), now))
+        db = self._connect()
+        with db:
+            db.executemany('insert or replace into parsed_documents values (?, ?, ?, ?)', rows)
+            if checkpoint is not None:
+                name, last_id = checkpoint
+                db.execute('insert or replace into parse_checkpoints values (?, ?, ?, ?)',
+                           (name, version, last_id, now))
+
+    def get_checkpoint(self, name, version=None):
+        """последний id, сохраненный пакетной обработкой name для этой версии конвейера"""
+        version = version or pipeline_version()
+        row = self._connect().execute('select last_id from parse_checkpoints where name=? and version=?',
+                                      (name, version)).fetchone()
+        return row[0] if row else None
+
+    def purge_stale(self, version=None):
+        """удаляем записи, сделанные другими версиями конвейера"""
+        version = version or pipeline_version()
+        db = self._connect()
+        with db:
+            cursor = db.execute('delete from parsed_documents where version != ?', (version,))
+        return cursor.rowcount
+
+    def clear_memory(self):
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.disk_hits + self.misses
+            return {
+                'version': pipeline_version(),
+                'size': len(self._lru),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.disk_hits) / requests if requests else None,
+            }
@@ -0,0 +1,140 @@
+"""
+полный разбор одного документа судакта: метаданные и части
+(общий код для API и пакетной обработки)
+"""
+
+import logging
+import threading
+import time
+
+from lib.document import ParsedDocument
+from lib.metadata_extractor import NAMES_FALLBACK, extractor_loaded, get_extractor, get_metadict
+from lib.classifier import get_parts, get_parts_many, get_registry, PREDICT_BATCH_SIZE
+from lib.metrics import increment
+
+NON_STANDARD_DOCUMENT = "NON_STANDARD_DOCUMENT"
+
+# прогрев процесса: cold -> warming -> done (или failed); время и ошибка последней попытки
+WARM_UP = {'state': 'cold', 'seconds': None, 'error': None}
+
+
+def load_models():
+    """
+    загружаем классификатор и экстрактор имен natasha в текущем процессе
+    (если сделать это до fork, процессы-потомки получают их без копирования);
+    экстрактор не грузим, если запасной поиск имен выключен
+    """
+    WARM_UP['state'] = 'warming'
+    start = time.perf_counter()
+    try:
+        if NAMES_FALLBACK['enabled']:
+            get_extractor()
+        get_registry().warm_up(background=False)
+    except Exception as e:
+        WARM_UP.update(state='failed', error=repr(e))
+        raise
+    finally:
+        WARM_UP['seconds'] = time.perf_counter() - start
+    model_error = get_registry().error
+    WARM_UP.update(state='failed' if model_error else 'done', error=model_error)
+
+
+def warm_up(background=True):
+    """load_models в фоновом потоке: процесс сразу отвечает на /livez, а /readyz -- после прогрева"""
+    def target():
+        try:
+            load_models()
+        except Exception:
+            logging.exception('warm-up failed')
+
+    if not background:
+        return target()
+    thread = threading.Thread(target=target, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness():
+    """готов ли процесс принимать запросы на разбор без холодной загрузки моделей"""
+    model_ready = get_registry().ready
+    names_ready = not NAMES_FALLBACK['enabled'] or extractor_loaded()
+    return dict(WARM_UP, ready=model_ready and names_ready, model=model_ready, names_extractor=names_ready)
+
+
+def parse_parts(html):
+    """части документа или NON_STANDARD_DOCUMENT, если в тексте нет нужных разделителей"""
+    try:
+        return get_parts(html)
+    except ValueError:
+        return NON_STANDARD_DOCUMENT
+
+
+def parse_parts_many(htmls, batch_size=PREDICT_BATCH_SIZE):
+    """parse_parts для списка документов с пакетной классификацией"""
+    parts = get_parts_many(htmls, batch_size)
+    return [NON_STANDARD_DOCUMENT if item is None else item for item in parts]
+
+
+def make_document(db_id, header, url, metadata, parsed):
+    """ответ /documents/<id>"""
+    return {
+        'db_id': db_id,
+        'header': header,
+        'url': url,
+        'metadata': metadata,
+        'parsed': parsed,
+        # 'raw_html': html
+    }
+
+
+def parse_row(db_id, header, url, html, timings=None):
+    """
+    собираем ответ /documents/<id> по строке таблицы documents
+    :param timings: Counter, куда добавляется время стадий parts и metadata и счетчики запасного поиска имен
+    """
+    doc = ParsedDocument(html)
+    start = time.perf_counter()
+    parsed = parse_parts(doc)
+    middle = time.perf_counter()
+    metadata = get_metadict(doc, timings)
+    if timings is not None:
+        timings['parts'] += middle - start
+        timings['metadata'] += time.perf_counter() - middle
+    increment('documents_parsed')
+    return make_document(db_id, header, url, metadata, parsed)
+
+
+def parse_rows(rows, timings=None, batch_size=PREDICT_BATCH_SIZE):
+    """
+    parse_row для пачки строк documents: предложения всех документов классифицируются пакетно
+    :return: список (db_id, ответ, None) или (db_id, None, ошибка) в порядке rows
+    """
+    docs = [ParsedDocument(html) for _, _, _, html in rows]
+    start = time.perf_counter()
+    try:
+        parts = parse_parts_many(docs, batch_size)
+    except Exception:
+        # пакет целиком не разобрался -- разбираем по одному, чтобы найти сломанные документы
+        results = []
+        for row in rows:
+            try:
+                results.append((row[0], parse_row(*row, timings=timings), None))
+            except Exception as e:
+                increment('documents_failed')
+                results.append((row[0], None, e))
+        return results
+    if timings is not None:
+        timings['parts'] += time.perf_counter() - start
+
+    results = []
+    for (db_id, header, url, _), doc, parsed in zip(rows, docs, parts):
+        start = time.perf_counter()
+        try:
+            results.append((db_id, make_document(db_id, header, url, get_metadict(doc, timings), parsed), None))
+            increment('documents_parsed')
+        except Exception as e:
+            increment('documents_failed')
+            results.append((db_id, None, e))
+        if timings is not None:
+            timings['metadata'] += time.perf_counter() - start
+    return results
@@ -0,0 +1,227 @@
+"""
+индексы sudact.sqlite для фильтров /documents/
+
+- metadata(document_id) -- соединение documents и metadata
+- metadata(region, date) и metadata(date) -- фильтры по региону и году (год -- диапазон дат)
+- metadata_terms -- нормализованные слова из фамилий судей и номера статей (kind judge, article)
+  и все их суффиксы (judge_suffix, article_suffix): фильтр по судье или статье находит кандидатов поиском
+  по префиксу среди суффиксов, то есть по подстроке внутри слова, а like '%...%' проверяет только их
+- facet_counts -- готовое число документов по каждому региону, году, статье и судье для /facets и /regions/;
+  новые документы добавляются к счетчикам через index_facets
+- db_generation -- счетчик записей в базу и время последней из них: по нему API строит ETag и Last-Modified,
+  каждая запись (lib.ingest, полнотекстовый индекс, пересчет фасетов) увеличивает его через bump_generation
+
+применить к базе (из каталога hseling_api_judgment; повторный запуск ничего не ломает):
+    python -m lib.schema --db sudact.sqlite
+пересчитать facet_counts, если документы загружались в обход index_facets
+(заодно сменится поколение базы, и API перестанет отдавать закэшированные до правки ответы):
+    python -m lib.schema --db sudact.sqlite --refresh-facets
+"""
+
+import argparse
+import re
+import sqlite3
+import sys
+import time
+from collections import Counter
+
+SCHEMA_VERSION = 4
+
+TERM_KINDS = ('judge', 'article')
+
+FACETS = ('region', 'year', 'article', 'judge')
+
+# максимальный символ юникода: все строки с префиксом p лежат в [p, p + TERM_END)
+TERM_END = '\U0010ffff'
+
+INDEXES = [
+    'create index if not exists metadata_document_id on metadata(document_id)',
+    'create index if not exists metadata_region_date on metadata(region, date)',
+    'create index if not exists metadata_date on metadata(date)',
+]
+
+
+def metadata_terms(kind, value):
+    """
+    нормализованные слова для поиска:
+    - судья -- слова от двух букв в нижнем регистре (фамилии без инициалов), ё = е
+    - статья -- номера статей вида 158 или 228.1
+    """
+    if not value:
+        return []
+    if kind == 'article':
+        terms = re.findall(r'\d+(?:\.\d+)*', value)
+    else:
+        terms = [word for word in re.findall(r'\w+', value.lower().replace('ё', 'е'))
+                 if len(word) > 1 and not word.isdigit()]
+    return list(dict.fromkeys(terms))
+
+
+def term_suffixes(kind, terms):
+    """
+    суффиксы слов: префикс суффикса -- любая подстрока слова, поэтому поиск по диапазону [p, p + TERM_END)
+    среди суффиксов находит те же слова, что like '%p%'; у судей -- от двух букв, как и сами слова запроса
+    """
+    min_length = 1 if kind == 'article' else 2
+    return list(dict.fromkeys(term[i:] for term in terms for i in range(len(term) - min_length + 1)))
+
+
+def suffix_kind(kind):
+    return f'{kind}_suffix'
+
+
+def has_terms(db):
+    row = db.execute("select 1 from sqlite_master where type='table' and name='metadata_terms'").fetchone()
+    return row is not None
+
+
+def has_term_suffixes(db):
+    """суффиксы слов появились в metadata_terms со схемой версии 4"""
+    version, = db.execute('pragma user_version').fetchone()
+    return version >= 4 and has_terms(db)
+
+
+def index_terms(db, rows):
+    """добавляем слова и их суффиксы для строк (document_id, judge, article), без commit"""
+    values = []
+    for document_id, judge, article in rows:
+        for kind, value in zip(TERM_KINDS, (judge, article)):
+            terms = metadata_terms(kind, value)
+            values += [(kind, term, document_id) for term in terms]
+            values += [(suffix_kind(kind), suffix, document_id) for suffix in term_suffixes(kind, terms)]
+    db.executemany('insert or ignore into metadata_terms values (?, ?, ?)', values)
+
+
+def facet_values(region, date, judge, article):
+    """
+    значения фасетов одного документа, [(фасет, значение)]:
+    регион и судья -- как в metadata, год -- из даты, статьи -- каждый номер отдельно, как в metadata_terms
+    """
+    values = [('region', region)] if region else []
+    if date and re.match(r'[0-9]{4}', date):
+        values.append(('year', date[:4]))
+    values += [('article', term) for term in metadata_terms('article', article)]
+    if judge:
+        values.append(('judge', judge))
+    return values
+
+
+def has_facets(db):
+    row = db.execute("select 1 from sqlite_master where type='table' and name='facet_counts'").fetchone()
+    return row is not None
+
+
+def index_facets(db, rows):
+    """прибавляем документы (document_id, region, date, judge, article) к facet_counts, без commit"""
+    counts = Counter(value for _, *row in rows for value in facet_values(*row))
+    db.executemany('''insert into facet_counts values (?, ?, ?)
+        on conflict (facet, value) do update set count=count + excluded.count''',
+                   [(facet, value, count) for (facet, value), count in counts.items()])
+
+
+def has_generation(db):
+    row = db.execute("select 1 from sqlite_master where type='table' and name='db_generation'").fetchone()
+    return row is not None
+
+
+def read_generation(db):
+    """(поколение, время последней записи) или None для базы без lib.schema"""
+    try:
+        return db.execute('select generation, modified from db_generation where id = 1').fetchone()
+    except sqlite3.OperationalError:
+        return None
+
+
+def bump_generation(db):
+    """следующее поколение базы, в транзакции записи и без commit; в базе без lib.schema ничего не делает"""
+    if has_generation(db):
+        db.execute('update db_generation set generation=generation + 1, modified=? where id = 1', (time.time(),))
+
+
+def refresh_facets(db, out=None):
+    """пересчитываем facet_counts по всем документам, без commit"""
+    db.execute('''create table if not exists facet_counts (
+        facet text not null,
+        value text not null,
+        count integer not null,
+        primary key (facet, value)
+    ) without rowid''')
+    db.execute('delete from facet_counts')
+    cursor = db.execute('''select m.document_id, m.region, m.date, m.judge, m.article
+        from metadata m
+        join documents d on d.id=m.document_id''')
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        index_facets(db, rows)
+        if out is not None:
+            print(f'counted facets up to document {rows[-1][0]}', file=out)
+    bump_generation(db)
+
+
+def migrate(db, out=None, analyze=True):
+    """
+    создаем индексы, metadata_terms, facet_counts и db_generation; версия схемы хранится в pragma user_version
+    :param analyze: собрать статистику для планировщика (без нее он не знает, насколько избирательны индексы)
+    """
+    version, = db.execute('pragma user_version').fetchone()
+    if version >= SCHEMA_VERSION:
+        return False
+    with db:
+        if version < 1:
+            for sql in INDEXES:
+                db.execute(sql)
+            db.execute('''create table if not exists metadata_terms (
+                kind text not null,
+                term text not null,
+                document_id integer not null,
+                primary key (kind, term, document_id)
+            ) without rowid''')
+        if version < 4:
+            # с версии 4 в metadata_terms есть и суффиксы слов
+            db.execute('delete from metadata_terms')
+            cursor = db.execute('select document_id, judge, article from metadata')
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                index_terms(db, rows)
+                if out is not None:
+                    print(f'indexed terms up to document {rows[-1][0]}', file=out)
+        if version < 2:
+            refresh_facets(db, out)
+        if version < 3:
+            db.execute('''create table if not exists db_generation (
+                id integer primary key check (id = 1),
+                generation integer not null,
+                modified real not null
+            )''')
+            db.execute('insert or ignore into db_generation values (1, 0, ?)', (time.time(),))
+        bump_generation(db)
+        db.execute(f'pragma user_version={SCHEMA_VERSION}')
+    if analyze:
+        db.execute('analyze')
+        db.commit()
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='индексы sudact.sqlite для фильтров /documents/')
+    parser.add_argument('--db', default='sudact.sqlite')
+    parser.add_argument('--refresh-facets', action='store_true', help='пересчитать facet_counts')
+    args = parser.parse_args(argv)
+
+    db = sqlite3.connect(args.db)
+    migrated = migrate(db, out=sys.stderr)
+    if args.refresh_facets and not migrated:
+        # после миграции счетчики и так только что посчитаны
+        with db:
+            refresh_facets(db, out=sys.stderr)
+    elif not migrated:
+        print(f'schema is already at version {SCHEMA_VERSION}', file=sys.stderr)
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
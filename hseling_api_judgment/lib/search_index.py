@@ -0,0 +1,132 @@
+"""
+полнотекстовый индекс FTS5 по решениям судакта
+
+- индексируется текст решения без разметки и части из таблицы metadata (fabula, witness, prove, meditation)
+- токенизатор unicode61 без учета регистра и диакритики (ё = е), с префиксными индексами
+- слова запроса приводятся к основе стеммером Snowball и ищутся как префиксы,
+  так что "кража" находит "кражу", "кражи" и т.д., а сниппеты строятся по исходному тексту
+- индекс пополняется по возрастанию documents.id, уже проиндексированные документы не перечитываются
+
+построить или дополнить индекс (из каталога hseling_api_judgment):
+    python -m lib.search_index --db sudact.sqlite
+"""
+
+import argparse
+import re
+import sqlite3
+import sys
+import time
+
+from lib.document import ParsedDocument
+from lib.schema import bump_generation
+
+FTS_TABLE = 'documents_fts'
+FTS_COLUMNS = ['text', 'fabula', 'witness', 'prove', 'meditation']
+
+# основа короче этого ищется как слово целиком, а не как префикс
+MIN_PREFIX = 3
+
+_STEMMER = None
+
+
+def get_stemmer():
+    global _STEMMER
+    if _STEMMER is None:
+        from nltk.stem.snowball import SnowballStemmer
+        _STEMMER = SnowballStemmer('russian')
+    return _STEMMER
+
+
+def to_match_query(query):
+    """строка поиска -> выражение MATCH: все слова запроса, каждое по своей основе"""
+    terms = []
+    for word in re.findall(r'\w+', query.lower()):
+        stem = get_stemmer().stem(word)
+        if len(stem) >= MIN_PREFIX:
+            terms.append('"{}"*'.format(stem))
+        else:
+            terms.append('"{}"'.format(word))
+    return ' '.join(terms) or None
+
+
+def has_index(db):
+    row = db.execute("select 1 from sqlite_master where type='table' and name=?", (FTS_TABLE,)).fetchone()
+    return row is not None
+
+
+def create_index(db):
+    db.execute('''create virtual table if not exists {} using fts5(
+        {},
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='3 4 5'
+    )'''.format(FTS_TABLE, ', '.join(FTS_COLUMNS)))
+    db.execute('''create table if not exists {}_state (
+        id integer primary key check (id = 1),
+        last_id integer not null
+    )'''.format(FTS_TABLE))
+    db.commit()
+
+
+def last_indexed_id(db):
+    row = db.execute('select last_id from {}_state where id = 1'.format(FTS_TABLE)).fetchone()
+    return row[0] if row else 0
+
+
+def plain_text(html):
+    """текст решения без разметки и лишних пробелов"""
+    return ' '.join(ParsedDocument(html).text.split())
+
+
+def index_rows(db, rows):
+    """добавляем в индекс строки (id, html, fabula, witness, prove, meditation) по возрастанию id, без commit"""
+    db.executemany('insert or replace into {}(rowid, {}) values (?, ?, ?, ?, ?, ?)'.format(
+        FTS_TABLE, ', '.join(FTS_COLUMNS)),
+        [(doc_id, plain_text(html or ''), *parts) for doc_id, html, *parts in rows])
+    if rows:
+        db.execute('insert or replace into {}_state values (1, ?)'.format(FTS_TABLE), (rows[-1][0],))
+
+
+def update_index(db, chunk_size=500, out=None):
+    """индексируем документы, добавленные после последнего запуска; каждая пачка -- своя транзакция"""
+    create_index(db)
+    sql = '''select d.id, d.data, m.fabula, m.witness, m.prove, m.meditation
+    from documents d
+    left join metadata m on m.document_id=d.id
+    where d.id > ?
+    order by d.id
+    limit ?'''
+    last_id, total = last_indexed_id(db), 0
+    started = time.perf_counter()
+    while True:
+        rows = db.execute(sql, (last_id, chunk_size)).fetchall()
+        if not rows:
+            break
+        with db:
+            index_rows(db, rows)
+            bump_generation(db)
+        last_id, total = rows[-1][0], total + len(rows)
+        if out is not None:
+            print(f'indexed up to id {last_id}: {total} documents, '
+                  f'{total / (time.perf_counter() - started):.1f} docs/sec', file=out)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='построение полнотекстового индекса по документам судакта')
+    parser.add_argument('--db', default='sudact.sqlite')
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--rebuild', action='store_true', help='удалить индекс и построить заново')
+    args = parser.parse_args(argv)
+
+    db = sqlite3.connect(args.db)
+    if args.rebuild:
+        db.execute('drop table if exists {}'.format(FTS_TABLE))
+        db.execute('drop table if exists {}_state'.format(FTS_TABLE))
+    update_index(db, args.chunk_size, out=sys.stderr)
+    db.execute("insert into {}({}) values ('optimize')".format(FTS_TABLE, FTS_TABLE))
+    db.commit()
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""маленькая база в формате sudact.sqlite для тестов"""
+
+import sqlite3
+
+DOCUMENT_HTML = '''<html><head><title>{title}</title></head><body>
+<h1>Приговор № {number} от {date} г. по делу № {number}</h1>
+<div class="b-justice"><a href="/court/">{court} - Уголовное</a></div>
+<h3>Судьи дела: {judge} (судья)</h3>
+<div class="b-practice"><a href="/practice/">Судебная практика по применению норм ст. {article} УК РФ</a></div>
+<div id="content">ПРИГОВОР<br/>
+ИМЕНЕМ РОССИЙСКОЙ ФЕДЕРАЦИИ<br/>
+{date} года {court} в составе председательствующего судьи {judge},<br/>
+при секретаре Петровой Е.В.,<br/>
+рассмотрев в открытом судебном заседании уголовное дело в отношении {accused},<br/>
+обвиняемого в совершении преступления, предусмотренного ч. 1 ст. {article} УК РФ,<br/>
+УСТАНОВИЛ:<br/>
+{accused} совершил кражу, то есть тайное хищение чужого имущества, при следующих обстоятельствах. \
+Так, {date} года около 14 часов {accused} находился в квартире потерпевшего, где увидел телефон. \
+Свидетель Иванова А.А. в судебном заседании показала, что видела подсудимого у дома. \
+Свидетель Смирнов Б.Б. показал, что потерпевший сообщил ему о пропаже телефона. \
+Вина подсудимого также подтверждается протоколом осмотра места происшествия и заключением эксперта. \
+Суд квалифицирует действия подсудимого по ч. 1 ст. {article} УК РФ. \
+При назначении наказания суд учитывает характер и степень общественной опасности преступления.<br/>
+На основании изложенного, руководствуясь ст. 307-309 УПК РФ, суд<br/>
+ПРИГОВОРИЛ:<br/>
+Признать {accused} виновным в совершении преступления.<br/>
+Судья {judge}</div>
+</body></html>'''
+
+DOCUMENTS = [
+    {'number': '1-101/2015', 'date': '11 июля 2015', 'iso_date': '2015-07-11', 'judge': 'Кузнецов А.В.',
+     'court': 'Ленинский районный суд г. Кемерово (Кемеровская область)', 'region': 'Кемеровская область',
+     'article': '158', 'accused': 'Сидоров С.С.'},
+    {'number': '1-7/2016', 'date': '3 марта 2016', 'iso_date': '2016-03-03', 'judge': 'Орлова Н.П.',
+     'court': 'Советский районный суд г. Томска (Томская область)', 'region': 'Томская область',
+     'article': '228', 'accused': 'Волков Д.Д.'},
+    {'number': '1-55/2016', 'date': '21 октября 2016', 'iso_date': '2016-10-21', 'judge': 'Кузнецов А.В.',
+     'court': 'Ленинский районный суд г. Кемерово (Кемеровская область)', 'region': 'Кемеровская область',
+     'article': '158', 'accused': 'Зайцев К.К.'},
+]
+
+
+def document_html(doc):
+    return DOCUMENT_HTML.format(title=doc['number'], **doc)
+
+
+def create_database(path, documents=DOCUMENTS):
+    """создаем documents, metadata и uk_sections с тестовыми документами (id с единицы)"""
+    db = sqlite3.connect(path)
+    db.executescript('''
+    create table documents (id integer primary key, header text, url text, data text);
+    create table metadata (document_id integer, date text, number text, court text, region text, judge text,
+        article text, accused text, fabula text, witness text, prove text, meditation text);
+    create table uk_sections (id integer primary key, name text, url text, level integer);
+    ''')
+    for i, doc in enumerate(documents, 1):
+        header = 'Приговор № {number} от {date} г.'.format(**doc)
+        db.execute('insert into documents values (?, ?, ?, ?)',
+                   (i, header, f'https://sudact.ru/regular/doc/{i}/', document_html(doc)))
+        db.execute('insert into metadata values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                   (i, doc['iso_date'], doc['number'], doc['court'], doc['region'], doc['judge'],
+                    doc['article'], doc['accused'], 'фабула', 'свидетели', 'доказательства', 'размышления'))
+    db.execute("insert into uk_sections values (1, 'Статья 158. Кража', 'https://sudact.ru/law/uk-rf/158/', 3)")
+    db.commit()
+    db.close()
+
+
+def fake_predict(sentences, *args, **kwargs):
+    """замена classifier.predict_parts: настоящая модель в тестах не нужна"""
+    tags = []
+    for sentence in sentences:
+        if 'Свидетель' in sentence:
+            tags.append('witness')
+        elif 'подтверждается' in sentence:
+            tags.append('prove')
+        elif sentence.startswith(('Суд', 'При назначении', 'На основании')):
+            tags.append('meditation')
+        else:
+            tags.append('fabula')
+    return tags
@@ -0,0 +1,40 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import hseling_api_judgment  # noqa: F401
+from lib import batch_parse
+from lib.parse_cache import ParseCache
+from sudact_fixture import DOCUMENTS, create_database, fake_predict
+
+
+class BatchParseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'sudact.sqlite')
+        self.cache_path = os.path.join(self.tmp_dir.name, 'cache.sqlite')
+        create_database(self.db_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @mock.patch('lib.classifier.predict_parts', fake_predict)
+    def test_parses_and_resumes(self):
+        stats = batch_parse.run(self.db_path, self.cache_path, chunk_size=2, workers=2, limit=2, out=io.StringIO())
+        self.assertEqual((stats['parsed'], stats['failed']), (2, 0))
+        self.assertIn('metadata', stats['timings'])
+
+        stats = batch_parse.run(self.db_path, self.cache_path, chunk_size=2, workers=2, out=io.StringIO())
+        self.assertEqual(stats['parsed'], len(DOCUMENTS) - 2)
+
+        cache = ParseCache(self.cache_path)
+        result = cache.get(3)
+        self.assertEqual(result['metadata']['judge'], 'Кузнецов А.В.')
+        self.assertIn('witness', result['parsed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import pickle
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import hseling_api_judgment  # noqa: F401
+from lib import classifier
+from lib.classifier import SEGMENTERS, ModelRegistry, divide_into_parts, get_parts, get_parts_many, segment_many
+from lib.document import ParsedDocument
+from sudact_fixture import DOCUMENTS, document_html, fake_predict
+
+
+class ConstantClassifier:
+
+    def __init__(self, tag):
+        self.tag = tag
+
+    def predict(self, sentences):
+        return [self.tag for _ in sentences]
+
+
+class ModelRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp_dir.name, 'clf.sav')
+        self.dump(ConstantClassifier('fabula'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def dump(self, clf, mtime=None):
+        with open(self.filename, 'wb') as f:
+            pickle.dump(clf, f)
+        if mtime is not None:
+            os.utime(self.filename, ns=(mtime, mtime))
+
+    def test_loads_once(self):
+        registry = ModelRegistry(self.filename)
+        self.assertFalse(registry.ready)
+        clf = registry.get()
+        self.assertIs(clf, registry.get())
+        status = registry.status()
+        self.assertTrue(status['ready'])
+        self.assertIsNotNone(status['version'])
+        self.assertIsNotNone(status['load_time'])
+
+    def test_hot_reload(self):
+        registry = ModelRegistry(self.filename)
+        version = registry.get() and registry.version
+        self.dump(ConstantClassifier('witness'), mtime=os.stat(self.filename).st_mtime_ns + 10 ** 9)
+        self.assertEqual(registry.get().predict(['a']), ['witness'])
+        self.assertNotEqual(version, registry.version)
+
+    def test_broken_reload(self):
+        registry = ModelRegistry(self.filename)
+        clf = registry.get()
+        version = registry.version
+        mtime = os.stat(self.filename).st_mtime_ns + 10 ** 9
+        with open(self.filename, 'wb') as f:
+            f.write(b'half-written')
+        os.utime(self.filename, ns=(mtime, mtime))
+        with self.assertLogs(level='ERROR'):
+            self.assertIs(registry.get(), clf)
+        self.assertEqual((registry.ready, registry.version), (True, version))
+        self.assertIsNotNone(registry.status()['error'])
+        # тот же испорченный файл второй раз не читается
+        with mock.patch('pickle.loads', side_effect=AssertionError):
+            self.assertIs(registry.get(), clf)
+
+        self.dump(ConstantClassifier('witness'), mtime=mtime + 10 ** 9)
+        self.assertEqual(registry.get().predict(['a']), ['witness'])
+        self.assertIsNone(registry.status()['error'])
+
+    def test_broken_model(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'not a pickle')
+        registry = ModelRegistry(self.filename)
+        registry.warm_up(background=False)
+        self.assertFalse(registry.ready)
+        self.assertIsNotNone(registry.status()['error'])
+
+
+@mock.patch('lib.classifier.predict_parts', fake_predict)
+class GetPartsManyTestCase(unittest.TestCase):
+
+    def test_same_as_get_parts(self):
+        htmls = [document_html(doc) for doc in DOCUMENTS]
+        htmls.insert(1, '<html><body>нет разделителей</body></html>')
+        expected = [get_parts(html) for html in htmls if 'УСТАНОВИЛ' in html]
+        for batch_size in (1, 2, 64):
+            parts = get_parts_many(htmls, batch_size)
+            self.assertIsNone(parts[1])
+            self.assertEqual(parts[:1] + parts[2:], expected)
+
+
+TRICKY_TEXTS = [
+    'Подсудимый Иванов И.И. совершил кражу. Потерпевшая Петрова А. Б. пояснила суду.',
+    'В соответствии со ст. 158 ч. 2 п. «в» УК РФ, т.е. кража, т. е. тайное хищение. Далее.',
+    'Проживает по адресу: г. Кемерово, ул. Ленина, д. 5, кв. 12. Ранее не судим.',
+    '1. Признать виновным. 2. Назначить наказание... А потом? ещё! И «так». Конец…',
+    'Сумма 1 500 руб. 00 коп. была похищена. Около 12 час. 30 мин. он ушёл.',
+    'См. пп. 3.1., 3.2. Приложения. А. Б. . В.',
+    'Он сказал: "Хватит!" и ушёл. Она ответила «нет.» Потом — тишина.',
+    'Т.к. он... не явился, суд (ст.247 УПК РФ) рассмотрел дело в его отсутствие.\nНовая строка. ',
+    '',
+    '   ',
+]
+
+
+class SegmenterTestCase(unittest.TestCase):
+
+    def assert_same(self, texts):
+        reference, fast = SEGMENTERS['rusenttokenize'], SEGMENTERS['fast']
+        for text in texts:
+            with self.subTest(text=text[:60]):
+                self.assertEqual(fast.segment(text), reference.segment(text))
+
+    def test_tricky_texts(self):
+        self.assert_same(TRICKY_TEXTS)
+
+    def test_fixture_documents(self):
+        self.assert_same([divide_into_parts(ParsedDocument(document_html(doc)).text)[1] for doc in DOCUMENTS])
+
+    def test_random_texts(self):
+        rnd = random.Random(19)
+        tokens = ['Иванов', 'и', 'ст', 'т', 'е', 'г', 'А', 'б', 'в', 'п', 'руб', 'коп', '158', '1', 'I', 'см',
+                  'т. е.', 'и т. д.', 'т.к.', 'ч.', 'ул.', ' - .', '°', '\xa0',
+                  '.', '. ', ' ', '  ', '\n', '!', '?', '…', '...', '"', '«', '»', '(', ')', '-', '—', ',']
+        self.assert_same([''.join(rnd.choice(tokens) for _ in range(rnd.randint(1, 80))) for _ in range(500)])
+
+    def test_memoized(self):
+        segmenter = mock.Mock(wraps=SEGMENTERS['fast'])
+        segmenter.name = 'mock'
+        texts = TRICKY_TEXTS[:3]
+        first = segment_many(texts + texts[:1], segmenter)
+        self.assertEqual(segment_many(texts, segmenter), first[:3])
+        self.assertEqual(first[3], first[0])
+        segmenter.segment_many.assert_called_once_with(texts)
+
+    def test_cache_bounded(self):
+        with mock.patch.object(classifier, 'SEGMENT_CACHE_SIZE', 2):
+            segment_many(TRICKY_TEXTS[:5], SEGMENTERS['fast'])
+            self.assertLessEqual(len(classifier._SEGMENT_CACHE), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
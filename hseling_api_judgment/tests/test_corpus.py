@@ -0,0 +1,56 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import hseling_api_judgment  # noqa: F401
+from benchmarks import corpus
+from lib.classifier import split_sentences
+from lib.metadata_extractor import get_metadict
+
+FIELDS = ('date', 'number', 'court', 'region', 'judge', 'article', 'accused')
+
+
+class CorpusTestCase(unittest.TestCase):
+    """синтетический корпус для замеров должен разбираться так же, как решения судакта"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def generate(self, name, documents=60, seed=0):
+        path = os.path.join(self.tmp_dir.name, name)
+        corpus.generate(path, documents, seed, chunk_size=25)
+        return path
+
+    def test_metadata_matches_extractor(self):
+        db = sqlite3.connect(self.generate('a.sqlite'))
+        rows = db.execute(f'''select d.data, {', '.join('m.' + field for field in FIELDS)}, m.fabula
+            from documents d join metadata m on m.document_id=d.id order by d.id''').fetchall()
+        self.assertEqual(len(rows), 60)
+        for html, *expected, fabula in rows:
+            with self.subTest(number=expected[1]):
+                metadict = get_metadict(html)
+                metadict['accused'] = ', '.join(metadict['accused'])
+                self.assertEqual([metadict[field] for field in FIELDS], expected)
+                self.assertIn(fabula.split('. ')[0], ' '.join(split_sentences(html)))
+        self.assertTrue(db.execute('select count(*) from uk_sections where level=3').fetchone()[0])
+        db.close()
+
+    def test_same_seed_same_corpus(self):
+        def digest(path):
+            db = sqlite3.connect(path)
+            data = db.execute('select group_concat(url || data, char(0)) from documents order by id').fetchone()[0]
+            db.close()
+            return hashlib.sha1(data.encode()).hexdigest()
+
+        first, second = self.generate('a.sqlite'), self.generate('b.sqlite')
+        self.assertEqual(digest(first), digest(second))
+        self.assertNotEqual(digest(first), digest(self.generate('c.sqlite', seed=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
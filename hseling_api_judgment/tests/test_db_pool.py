@@ -0,0 +1,63 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+import hseling_api_judgment  # noqa: F401
+from lib.db_pool import ConnectionPool
+from sudact_fixture import create_database
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'sudact.sqlite')
+        create_database(self.db_path)
+        self.pool = ConnectionPool(self.db_path, size=1, timeout=5)
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp_dir.cleanup()
+
+    def test_read_only_wal(self):
+        self.assertEqual(self.pool.journal_mode, 'wal')
+        with self.pool.connection() as db:
+            self.assertEqual(db.execute('select count(*) from documents').fetchone(), (3,))
+            with self.assertRaises(sqlite3.OperationalError):
+                db.execute('delete from documents')
+
+    def test_connections_are_reused_and_waits_counted(self):
+        with self.pool.connection() as db:
+            first = db
+        with self.pool.connection() as db:
+            self.assertIs(db, first)
+
+        borrowed = []
+
+        def borrow():
+            with self.pool.connection() as db:
+                borrowed.append(db)
+
+        with self.pool.connection():
+            thread = threading.Thread(target=borrow)
+            thread.start()
+            time.sleep(0.05)
+            self.assertEqual(borrowed, [])
+        thread.join()
+        self.assertEqual(borrowed, [first])
+        stats = self.pool.stats()
+        self.assertEqual((stats['open'], stats['borrowed'], stats['waits']), (1, 4, 1))
+        self.assertGreater(stats['max_wait'], 0)
+
+    def test_sees_new_writes(self):
+        with self.pool.connection() as db:
+            self.assertEqual(db.execute('select count(*) from metadata').fetchone(), (3,))
+        writer = sqlite3.connect(self.db_path)
+        writer.execute('delete from metadata where document_id=1')
+        writer.commit()
+        writer.close()
+        with self.pool.connection() as db:
+            self.assertEqual(db.execute('select count(*) from metadata').fetchone(), (2,))
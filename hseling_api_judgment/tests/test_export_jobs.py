@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import hseling_api_judgment  # noqa: F401
+from lib.export_jobs import DONE, FAILED, RUNNING, ExportJobs, job_id
+
+
+class ExportJobsTestCase(unittest.TestCase):
+    """состояние заданий на диске: два экземпляра на одном каталоге -- как два воркера gunicorn"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.first = ExportJobs(self.tmp_dir.name, max_bytes=10 ** 6)
+        self.second = ExportJobs(self.tmp_dir.name, max_bytes=10 ** 6)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def wait(self, jobs, job_id):
+        for _ in range(100):
+            job = jobs.get(job_id)
+            if job['status'] in (DONE, FAILED):
+                return job
+            time.sleep(0.05)
+        self.fail('export job did not finish')
+
+    def test_shared_between_workers(self):
+        release = threading.Event()
+        outputs = []
+
+        def build(output, progress):
+            outputs.append(output)
+            progress(0, 2)
+            release.wait(5)
+            with open(output, 'w') as f:
+                f.write('a,b\n')
+            progress(2)
+
+        def duplicate(output, progress):
+            raise AssertionError('the same export is built twice')
+
+        job = self.first.submit({'judge': 'Кузнецов'}, 'csv', build)
+        for _ in range(100):
+            if outputs:
+                break
+            time.sleep(0.01)
+        # опрос и повторный POST попали в другой воркер
+        self.assertEqual(self.second.get(job['id'])['status'], RUNNING)
+        self.assertEqual(self.second.submit({'judge': 'Кузнецов'}, 'csv', duplicate)['id'], job['id'])
+        # файл строится под временным именем в том же каталоге
+        self.assertEqual(os.path.dirname(outputs[0]), self.tmp_dir.name)
+        self.assertNotEqual(outputs[0], self.first.path(job))
+
+        release.set()
+        job = self.wait(self.second, job['id'])
+        self.assertEqual((job['status'], job['rows'], job['total']), (DONE, 2, 2))
+        self.assertNotIn('owner', job)
+        with open(self.second.path(job)) as f:
+            self.assertEqual(f.read(), 'a,b\n')
+        self.assertEqual(self.second.stats()[DONE], 1)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), ['.lock', f"{job['id']}.csv", f"{job['id']}.status"])
+
+    def test_abandoned_job_is_restarted(self):
+        # задание занял процесс, который уже умер
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        key = {'judge': 'Орлова'}
+        self.first._write({'id': job_id([key, 'csv']), 'format': 'csv', 'status': RUNNING, 'rows': 0,
+                           'total': None, 'error': None, 'created_at': 0, 'finished_at': None, 'pid': process.pid})
+        self.assertEqual(self.second.get(job_id([key, 'csv']))['status'], FAILED)
+
+        def build(output, progress):
+            with open(output, 'w') as f:
+                f.write('a\n')
+
+        job = self.second.submit(key, 'csv', build)
+        self.assertEqual(self.wait(self.first, job['id'])['status'], DONE)
+
+
+if __name__ == '__main__':
+    unittest.main()
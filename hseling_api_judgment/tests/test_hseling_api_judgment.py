@@ -1,6 +1,27 @@
+import gzip
+import html
+import importlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
 import unittest
+import zipfile
+from unittest import mock
 
 import hseling_api_judgment
+from lib import ingest
+from lib.db_pool import ConnectionPool
+from lib.export_jobs import ExportJobs
+from lib.parse_cache import ParseCache
+from lib.pipeline import warm_up
+from lib.schema import bump_generation, has_facets, has_generation, index_facets, index_terms, migrate, refresh_facets
+from lib.search_index import update_index
+from sudact_fixture import DOCUMENTS, create_database, document_html, fake_predict
+
+app_module = importlib.import_module('hseling_api_judgment.app')
 
 
 class HSELing_API_JudgmentTestCase(unittest.TestCase):
@@ -12,6 +33,403 @@ class HSELing_API_JudgmentTestCase(unittest.TestCase):
         rv = self.app.get('/healthz')
         self.assertIn('Application Judgment', rv.data.decode())
 
+    def test_liveness_and_readiness(self):
+        self.assertEqual(self.app.get('/livez').status_code, 200)
+        registry = mock.Mock(ready=False, error=None)
+        with mock.patch('lib.pipeline.get_registry', return_value=registry), \
+                mock.patch.dict('lib.pipeline.NAMES_FALLBACK', enabled=False), \
+                mock.patch.dict('lib.pipeline.WARM_UP', state='cold', error=None):
+            rv = self.app.get('/readyz')
+            self.assertEqual((rv.status_code, rv.get_json()['state']), (503, 'cold'))
+            registry.ready = True
+            warm_up(background=False)
+            registry.warm_up.assert_called_once_with(background=False)
+            rv = self.app.get('/readyz')
+            self.assertEqual((rv.status_code, rv.get_json()['state']), (200, 'done'))
+
+    @mock.patch('lib.classifier.predict_parts', fake_predict)
+    def test_parts(self):
+        htmls = [document_html(DOCUMENTS[0]), '<p>нет разделителей</p>']
+        rv = self.app.post('/parts/', json={'documents': htmls})
+        parts, non_standard = rv.get_json()
+        self.assertIn('witness', parts)
+        self.assertEqual(non_standard, 'NON_STANDARD_DOCUMENT')
+        self.assertEqual(self.app.post('/parts/', json={'documents': 'html'}).status_code, 400)
+        self.assertEqual(self.app.post('/parts/?batch_size=0', json={'documents': htmls}).status_code, 400)
+        for batch_size in ('abc', '100000'):
+            rv = self.app.post(f'/parts/?batch_size={batch_size}', json={'documents': htmls})
+            self.assertEqual(rv.get_json(), [parts, non_standard])
+
+
+class DocumentsTestCase(unittest.TestCase):
+    """запросы к тестовой базе в формате sudact.sqlite"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'sudact.sqlite')
+        create_database(self.db_path)
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.pool = ConnectionPool(self.db_path, size=2)
+        for name, value in [('DB_POOL', self.pool), ('DB_PATH', self.db_path)]:
+            patcher = mock.patch.object(app_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        app_module.COUNT_CACHE.clear()
+        app_module.RESPONSE_CACHE.clear()
+        app_module.DOCUMENT_FILES.clear()
+        self.app = hseling_api_judgment.app.test_client()
+
+    def tearDown(self):
+        self.pool.close()
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def set_mtimes(self, stamps):
+        for path, mtime in stamps.items():
+            os.utime(path, ns=(mtime, mtime))
+
+    def age_database(self, seconds=10):
+        """последняя запись в базу -- seconds назад (записям этой секунды Last-Modified не отдается)"""
+        if has_generation(self.db):
+            with self.db:
+                self.db.execute('update db_generation set modified=modified - ?', (seconds,))
+        self.set_mtimes({path: os.stat(path).st_mtime_ns - seconds * 10 ** 9
+                         for path in (self.db_path, self.db_path + '-wal') if os.path.exists(path)})
+
+    def test_filters(self):
+        data = self.app.get('/documents/?region=Кемеровская область&year=2016').get_json()
+        self.assertEqual([doc['id'] for doc in data['documents']], [3])
+        self.assertEqual(data['pages'], 1)
+
+    def test_keyset_pagination(self):
+        ids, cursor = [], ''
+        while cursor is not None:
+            data = self.app.get(f'/documents/?page_size=2&cursor={cursor}').get_json()
+            self.assertEqual(data['pages'], 2)
+            ids += [doc['id'] for doc in data['documents']]
+            cursor = data['next_cursor']
+        self.assertEqual(ids, [1, 2, 3])
+        self.assertEqual(self.app.get('/documents/?cursor=garbage').status_code, 400)
+
+    def test_counts_are_cached(self):
+        self.app.get('/documents/?judge=Кузнецов')
+        hits = app_module.COUNT_CACHE.stats()['hits']
+        self.app.get('/documents/?judge=Кузнецов&page_num=2')
+        self.assertEqual(app_module.COUNT_CACHE.stats()['hits'], hits + 1)
+
+    def test_export(self):
+        rv = self.app.get('/documents/download?region=Кемеровская область')
+        self.assertEqual(rv.data[:2], b'PK')
+        self.assertEqual(rv.headers['X-Total-Count'], '2')
+
+        rv = self.app.get('/documents/download?format=csv')
+        lines = rv.data.decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), len(DOCUMENTS) + 1)
+        self.assertTrue(lines[0].startswith('Заголовок,Ссылка'))
+
+        with mock.patch.dict(hseling_api_judgment.app.config, EXPORT_MAX_ROWS=2):
+            rv = self.app.get('/documents/download?format=ndjson')
+        documents = [json.loads(line) for line in rv.data.decode().splitlines()]
+        self.assertEqual([doc['id'] for doc in documents], [1, 2])
+        self.assertEqual(rv.headers['X-Export-Truncated'], '1')
+
+    def test_export_jobs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            jobs = ExportJobs(directory, max_bytes=10 ** 6)
+            with mock.patch.object(app_module, 'EXPORT_JOBS', jobs):
+                rv = self.app.post('/exports', json={'format': 'csv', 'judge': 'Кузнецов'})
+                self.assertEqual(rv.status_code, 202)
+                job = rv.get_json()
+                for _ in range(100):
+                    job = self.app.get(job['status_url']).get_json()
+                    if job['status'] in ('done', 'failed'):
+                        break
+                    time.sleep(0.05)
+                self.assertEqual((job['status'], job['rows'], job['total']), ('done', 2, 2))
+
+                rv = self.app.get(job['file_url'])
+                self.assertEqual(len(rv.data.decode('utf-8-sig').splitlines()), 3)
+                rv.close()
+
+                again = self.app.post('/exports', json={'format': 'csv', 'judge': 'Кузнецов'}).get_json()
+                self.assertEqual((again['id'], again['status']), (job['id'], 'done'))
+                self.assertEqual(self.app.get('/exports/unknown/file').status_code, 404)
+
+    @mock.patch('lib.classifier.predict_parts', fake_predict)
+    def test_conditional_get(self):
+        with mock.patch.object(app_module, 'PARSE_CACHE', ParseCache(os.path.join(self.tmp_dir.name, 'cache.sqlite'))):
+            rv = self.app.get('/documents/1', headers={'Accept-Encoding': 'gzip, br;q=0'})
+            self.assertEqual(rv.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(json.loads(gzip.decompress(rv.data))['db_id'], 1)
+            self.assertIn('max-age=604800', rv.headers['Cache-Control'])
+            rv = self.app.get('/documents/1', headers={'If-None-Match': rv.headers['ETag']})
+            self.assertEqual((rv.status_code, rv.data), (304, b''))
+
+            # после смены конвейера разбора If-Modified-Since не должен отдавать 304 на старый разбор
+            self.age_database()
+            self.assertNotIn('Last-Modified', rv.headers)
+            since = 'Fri, 01 Jan 2100 00:00:00 GMT'
+            with mock.patch.object(app_module, 'pipeline_version', return_value='changed'):
+                rv = self.app.get('/documents/1', headers={'If-Modified-Since': since})
+            self.assertEqual(rv.status_code, 200)
+            self.assertNotIn('Last-Modified', rv.headers)
+
+        self.age_database()
+        rv = self.app.get('/regions/')
+        etag = rv.headers['ETag']
+        self.assertNotIn('Content-Encoding', rv.headers)
+        self.assertEqual(self.app.get('/regions/', headers={'If-Modified-Since': rv.headers['Last-Modified']}
+                                      ).status_code, 304)
+        # после записи в базу старый ETag больше не подходит
+        self.db.execute("update metadata set region='Новосибирская область' where document_id=2")
+        if has_facets(self.db):
+            # правка metadata в обход загрузки -- счетчики фасетов пересчитываются целиком
+            refresh_facets(self.db)
+        self.db.commit()
+        rv = self.app.get('/regions/', headers={'If-None-Match': etag})
+        self.assertEqual(rv.status_code, 200)
+        self.assertIn('Новосибирская область', rv.get_json())
+
+    def test_preconditions_need_resource(self):
+        self.assertEqual(self.app.get('/laws/999', headers={'If-None-Match': '*'}).status_code, 404)
+        self.assertEqual(self.app.get('/laws/1', headers={'If-None-Match': '*'}).status_code, 304)
+
+    def test_generation_counter(self):
+        migrate(self.db, analyze=False)
+        self.age_database()
+        rv = self.app.get('/laws/')
+        self.assertIn('Last-Modified', rv.headers)
+        # запись не меняет mtime файлов (тот же тик или checkpoint), но поколение базы уже другое
+        stamps = {path: os.stat(path).st_mtime_ns for path in (self.db_path, self.db_path + '-wal')
+                  if os.path.exists(path)}
+        with self.db:
+            self.db.execute("update uk_sections set name='Статья 158. Кража (ред.)' where id=1")
+            bump_generation(self.db)
+        self.set_mtimes(stamps)
+        modified, = self.db.execute('select modified from db_generation').fetchone()
+        # запрос в ту же секунду, что и запись, даже если тест попал на границу секунды
+        with mock.patch.object(app_module.time, 'time', return_value=modified):
+            rv = self.app.get('/laws/', headers={'If-None-Match': rv.headers['ETag']})
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(rv.get_json()[0]['name'], 'Статья 158. Кража (ред.)')
+        # запись этой секунды: Last-Modified не отдается, чтобы следующая запись в ту же секунду его сменила
+        self.assertNotIn('Last-Modified', rv.headers)
+
+    @mock.patch('lib.classifier.predict_parts', fake_predict)
+    def test_documents_batch(self):
+        cache = ParseCache(os.path.join(self.tmp_dir.name, 'cache.sqlite'))
+        with mock.patch.object(app_module, 'PARSE_CACHE', cache):
+            rv = self.app.post('/documents/batch', json={'ids': [2, 999, 1, 2]})
+            self.assertEqual(rv.mimetype, 'application/x-ndjson')
+            lines = [json.loads(line) for line in rv.data.decode().splitlines()]
+            self.assertEqual([line['db_id'] for line in lines], [2, 999, 1, 2])
+            self.assertEqual(lines[1]['status'], 404)
+            self.assertEqual(lines[0], lines[3])
+            self.assertEqual(lines[2]['metadata']['judge'], DOCUMENTS[0]['judge'])
+
+            hits = cache.stats()['hits']
+            rv = self.app.post('/documents/batch', json={'ids': [1, 2]})
+            self.assertEqual(len(rv.data.decode().splitlines()), 2)
+            self.assertEqual(cache.stats()['hits'], hits + 2)
+            self.assertEqual(self.app.post('/documents/batch', json={'ids': ['1']}).status_code, 400)
+            self.assertEqual(self.app.post('/documents/batch', json={'ids': [2 ** 70]}).status_code, 400)
+            self.assertEqual(self.app.post('/documents/batch?batch_size=0', json={'ids': [3]}).status_code, 400)
+            rv = self.app.post('/documents/batch?batch_size=abc', json={'ids': [3]})
+            self.assertEqual(json.loads(rv.data)['db_id'], 3)
+
+    @mock.patch('lib.classifier.predict_parts', fake_predict)
+    def test_document_download(self):
+        with mock.patch.object(app_module, 'PARSE_CACHE', ParseCache(os.path.join(self.tmp_dir.name, 'cache.sqlite'))):
+            rv = self.app.get('/documents/1/download')
+            parsed = self.app.get('/documents/1').get_json()
+        self.assertEqual(rv.mimetype, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        self.assertIn('attachment', rv.headers['Content-Disposition'])
+        with zipfile.ZipFile(io.BytesIO(rv.data)) as xlsx:
+            strings = xlsx.read('xl/sharedStrings.xml').decode()
+        for text in ['Части документа:', 'Размышления судьи', parsed['header'], parsed['metadata']['judge'],
+                     parsed['parsed']['fabula'][0][:40]]:
+            self.assertIn(html.escape(text, quote=False), strings)
+
+        # готовый файл запоминается и документ заново не разбирается
+        with mock.patch.object(app_module, 'parse_document', side_effect=AssertionError):
+            self.assertEqual(self.app.get('/documents/1/download').data, rv.data)
+
+    @mock.patch('lib.classifier.predict_parts', fake_predict)
+    def test_profile_and_metrics(self):
+        with mock.patch.object(app_module, 'PARSE_CACHE', ParseCache(os.path.join(self.tmp_dir.name, 'cache.sqlite'))):
+            self.app.get('/documents/1')
+            # без PROFILE_TOKEN или с чужим токеном -- обычный ответ из кэшей
+            with mock.patch.object(app_module, 'parse_row', side_effect=AssertionError):
+                self.assertNotIn('Server-Timing', self.app.get('/documents/1?profile=1').headers)
+                with mock.patch.dict(app_module.app.config, PROFILE_TOKEN='secret'):
+                    rv = self.app.get('/documents/1', headers={'X-Profile': '1'})
+                    self.assertNotIn('Server-Timing', rv.headers)
+                    rv = self.app.get('/documents/1?profile=ж')
+                    self.assertEqual(rv.status_code, 200)
+                    self.assertNotIn('Server-Timing', rv.headers)
+                    rv = self.app.get('/livez', headers={'X-Profile': 'é'.encode('utf-8')})
+                    self.assertEqual(rv.status_code, 200)
+
+            # с токеном разобранный документ разбирается заново
+            with mock.patch.dict(app_module.app.config, PROFILE_TOKEN='secret'):
+                rv = self.app.get('/documents/1?profile=secret')
+            self.assertEqual(rv.get_json()['db_id'], 1)
+            stages = [item.split(';')[0] for item in rv.headers['Server-Timing'].split(', ')]
+            for stage in ('soup', 'text', 'divide', 'concatenate', 'metadata.accused', 'sql.document', 'total'):
+                self.assertIn(stage, stages)
+            self.assertNotIn('Server-Timing', self.app.get('/documents/1').headers)
+
+        self.app.get('/documents/?region=Кемеровская область')
+        rv = self.app.get('/metrics')
+        self.assertEqual(rv.mimetype, 'text/plain')
+        text = rv.data.decode()
+        self.assertIn('judgment_stage_seconds_count{stage="sql.documents"}', text)
+        self.assertIn('judgment_request_seconds_count{endpoint="parse_doc",status="200"}', text)
+        self.assertIn('judgment_db_pool_borrowed', text)
+
+    def test_full_text_search(self):
+        self.assertEqual(self.app.get('/documents/?q=кражи').status_code, 503)
+        update_index(self.db)
+        data = self.app.get('/documents/?q=Томской области').get_json()
+        self.assertEqual([doc['id'] for doc in data['documents']], [2])
+        self.assertIn('<b>', data['documents'][0]['snippet'])
+        data = self.app.get('/documents/?q=кражи телефона&region=Кемеровская область').get_json()
+        self.assertEqual(sorted(doc['id'] for doc in data['documents']), [1, 3])
+
+    def test_facets(self):
+        facets = self.app.get('/facets').get_json()
+        self.assertEqual(facets['region'], [{'value': 'Кемеровская область', 'count': 2},
+                                            {'value': 'Томская область', 'count': 1}])
+        self.assertEqual(facets['year'], [{'value': '2016', 'count': 2}, {'value': '2015', 'count': 1}])
+        self.assertEqual(facets['judge'][0], {'value': 'Кузнецов А.В.', 'count': 2})
+        # свой фильтр фасета не применяется, остальные -- да
+        facets = self.app.get('/facets?region=Кемеровская область&facet=region&facet=year').get_json()
+        self.assertEqual(sorted(facets), ['region', 'year'])
+        self.assertEqual(len(facets['region']), 2)
+        self.assertEqual(facets['year'], [{'value': '2015', 'count': 1}, {'value': '2016', 'count': 1}])
+        self.assertEqual(self.app.get('/facets?facet=court').status_code, 400)
+        self.assertEqual(self.app.get('/facets?limit=1').get_json()['article'], [{'value': '158', 'count': 2}])
+
+    @mock.patch('lib.classifier.predict_parts', fake_predict)
+    def test_ingest(self):
+        doc = dict(DOCUMENTS[1], number='1-12/2017', date='9 февраля 2017', iso_date='2017-02-09')
+        body = {'documents': [{'html': document_html(doc), 'url': 'https://sudact.ru/regular/doc/new/'},
+                              {'html': document_html(DOCUMENTS[0])}]}
+        self.assertEqual(self.app.post('/ingest', json=body).status_code, 404)
+        cache = ParseCache(os.path.join(self.tmp_dir.name, 'cache.sqlite'))
+        with mock.patch.dict(app_module.app.config, INGEST_TOKEN='secret'), \
+                mock.patch.object(app_module, 'PARSE_CACHE', cache):
+            self.assertEqual(self.app.get('/documents/?region=Томская область').get_json()['documents'][0]['id'], 2)
+            self.assertEqual(self.app.post('/ingest', json=body, headers={'Authorization': 'Bearer wrong'}
+                                           ).status_code, 401)
+            self.assertEqual(self.app.post('/ingest', json=body, headers={'Authorization': 'Bearer é'.encode('utf-8')}
+                                           ).status_code, 401)
+            headers = {'Authorization': 'Bearer secret'}
+            self.assertEqual(self.app.post('/ingest', json={'documents': [{}]}, headers=headers).status_code, 400)
+            # база не подготовлена: sha1 всех документов в запросе не считаем
+            self.assertEqual(self.app.post('/ingest', json=body, headers=headers).status_code, 503)
+            ingest.prepare(self.db)
+            stats = self.app.post('/ingest', json=body, headers=headers).get_json()
+            self.assertEqual((stats['inserted'], stats['duplicates']), (1, 1))
+            # счетчик под тем же фильтром не берется из кэша, разбор нового документа -- уже в кэше
+            data = self.app.get('/documents/?region=Томская область').get_json()
+            self.assertEqual([item['id'] for item in data['documents']], [2, 4])
+            self.assertIsNotNone(app_module.PARSE_CACHE.get(4))
+            self.assertEqual(self.app.get('/facets?facet=year').get_json()['year'][0], {'value': '2016', 'count': 2})
+
+
+class QueryPlanTestCase(DocumentsTestCase):
+    """фильтры /documents/ должны идти по индексам, а не полным просмотром таблиц"""
+
+    FILTERS = [
+        {'year': '2016'},
+        {'region': 'Томская область'},
+        {'region': 'Кемеровская область', 'year': '2015'},
+        {'judge': 'Кузнецов'},
+        {'article': '158', 'region': 'Кемеровская область'},
+    ]
+
+    def setUp(self):
+        super().setUp()
+        # статистика по трем строкам убедит планировщик, что проще читать таблицы целиком
+        migrate(self.db, analyze=False)
+
+    def plan(self, sql, args):
+        return [row[3] for row in self.db.execute('explain query plan ' + sql, args)]
+
+    def test_filters_use_indexes(self):
+        base = {name: None for name in app_module.FILTER_KEYS}
+        base.update(limit=50, offset=0, after_id=None)
+        for filters in self.FILTERS:
+            params = dict(base, **filters)
+            with self.subTest(filters=filters):
+                count_plan = self.plan(*app_module.documents_sql(self.db, params))
+                self.assertFalse([step for step in count_plan if step.startswith('SCAN')], count_plan)
+                page_plan = self.plan(*app_module.documents_sql(self.db, params, app_module.DOCUMENT_COLUMNS, 'offset'))
+                self.assertFalse([step for step in page_plan if step.startswith('SCAN m')], page_plan)
+
+    def test_results_match_substring_filters(self):
+        data = self.app.get('/documents/?judge=Кузнецов А.В.&article=158&year=2016').get_json()
+        self.assertEqual([doc['id'] for doc in data['documents']], [3])
+        self.assertEqual(self.app.get('/documents/?year=20%').status_code, 400)
+
+        # подстрока с середины слова находится так же, как like '%...%' в базе без lib.schema
+        for name, value in [('judge', 'узнецов'), ('judge', 'рлова'), ('judge', 'знецов А.'), ('article', '58'),
+                            ('article', '28')]:
+            with self.subTest(**{name: value}):
+                expected = [doc_id for doc_id, in self.db.execute(
+                    f'select document_id from metadata where {name} like ? order by 1', (f'%{value}%',))]
+                self.assertTrue(expected)
+                data = self.app.get(f'/documents/?{name}={value}').get_json()
+                self.assertEqual([doc['id'] for doc in data['documents']], expected)
+
+        # инициалов в metadata_terms нет: их проверяет like, а однофамилец и Кузнецова под фильтр не попадают
+        with self.db:
+            self.db.execute("update metadata set judge='Кузнецов И.И.' where document_id=2")
+            self.db.execute("delete from metadata_terms where kind like 'judge%' and document_id=2")
+            index_terms(self.db, [(2, 'Кузнецов И.И.', None)])
+            self.db.execute("update metadata set judge='Кузнецова А.В.' where document_id=3")
+            self.db.execute("delete from metadata_terms where kind like 'judge%' and document_id=3")
+            index_terms(self.db, [(3, 'Кузнецова А.В.', None)])
+        data = self.app.get('/documents/?judge=Кузнецов А.В.').get_json()
+        self.assertEqual([doc['id'] for doc in data['documents']], [1])
+        data = self.app.get('/documents/?judge=Кузнецов').get_json()
+        self.assertEqual([doc['id'] for doc in data['documents']], [1, 2, 3])
+
+    def test_facets_are_materialized(self):
+        filtered = self.app.get('/facets?judge=Кузнецов').get_json()
+        self.assertEqual(filtered['article'], [{'value': '158', 'count': 2}])
+        self.assertEqual(filtered['region'], [{'value': 'Кемеровская область', 'count': 2}])
+        self.assertEqual(self.app.get('/regions/').get_json(), ['Кемеровская область', 'Томская область'])
+
+        # без фильтров счетчики читаются из facet_counts и совпадают с group by по metadata
+        base = {name: None for name in app_module.FILTER_KEYS}
+        for facet in app_module.FACET_COLUMNS:
+            with self.subTest(facet=facet):
+                sql, args = app_module.facet_sql(self.db, facet, base, 100)
+                self.assertIn('facet_counts', sql)
+                with mock.patch.object(app_module, 'has_facets', return_value=False):
+                    grouped = self.db.execute(*app_module.facet_sql(self.db, facet, base, 100)).fetchall()
+                self.assertEqual(self.db.execute(sql, args).fetchall(), grouped)
+
+        # новый документ прибавляется к счетчикам без пересчета
+        row = (4, 'Томская область', '2017-01-20', 'Орлова Н.П.', '228.1, 158')
+        with self.db:
+            self.db.execute("insert into documents values (4, 'Приговор', 'https://sudact.ru/regular/doc/4/', '')")
+            self.db.execute('insert into metadata (document_id, date, region, judge, article) values (?, ?, ?, ?, ?)',
+                            (row[0], row[2], row[1], row[3], row[4]))
+            index_facets(self.db, [row])
+        app_module.RESPONSE_CACHE.clear()
+        facets = self.app.get('/facets').get_json()
+        self.assertEqual(facets['region'], [{'value': 'Кемеровская область', 'count': 2},
+                                            {'value': 'Томская область', 'count': 2}])
+        self.assertEqual(facets['article'][0], {'value': '158', 'count': 3})
+        self.assertIn({'value': '2017', 'count': 1}, facets['year'])
+        counts = self.db.execute('select * from facet_counts order by 1, 2').fetchall()
+        with self.db:
+            refresh_facets(self.db)
+        self.assertEqual(self.db.execute('select * from facet_counts order by 1, 2').fetchall(), counts)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import hseling_api_judgment  # noqa: F401
+from lib import ingest
+from lib.parse_cache import ParseCache
+from lib.schema import refresh_facets
+from lib.search_index import update_index
+from sudact_fixture import DOCUMENTS, create_database, document_html, fake_predict
+
+NEW_DOCUMENTS = [
+    dict(DOCUMENTS[1], number='1-12/2017', date='9 февраля 2017', iso_date='2017-02-09', accused='Белов Г.Г.'),
+    dict(DOCUMENTS[0], number='1-301/2017', date='14 апреля 2017', iso_date='2017-04-14', article='161',
+         accused='Морозов Е.Е.'),
+]
+
+
+class IngestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'sudact.sqlite')
+        create_database(self.db_path)
+        self.db = sqlite3.connect(self.db_path)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def write_jsonl(self, items):
+        path = os.path.join(self.tmp_dir.name, 'new.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+        return path
+
+    def facet_counts(self):
+        return self.db.execute('select * from facet_counts order by 1, 2').fetchall()
+
+    @mock.patch('lib.classifier.predict_parts', fake_predict)
+    def test_ingest_jsonl(self):
+        ingest.prepare(self.db)
+        update_index(self.db)
+        items = [{'html': document_html(doc), 'url': f'https://sudact.ru/regular/doc/new{i}/'}
+                 for i, doc in enumerate(NEW_DOCUMENTS)]
+        # уже загруженный документ (тот же html), повтор url и повтор внутри файла
+        items += [{'html': document_html(DOCUMENTS[0])},
+                  {'html': document_html(NEW_DOCUMENTS[0]) + ' ', 'url': 'https://sudact.ru/regular/doc/2/'},
+                  items[0]]
+        cache_path = os.path.join(self.tmp_dir.name, 'cache.sqlite')
+        stats = ingest.run(self.db_path, self.write_jsonl(items), chunk_size=2, workers=0, cache_path=cache_path,
+                           out=io.StringIO())
+        self.assertEqual((stats['read'], stats['inserted'], stats['duplicates']), (5, 2, 3))
+
+        header, url = self.db.execute('select header, url from documents where id=4').fetchone()
+        self.assertEqual(header, 'Приговор № 1-12/2017 от 9 февраля 2017 г. по делу № 1-12/2017')
+        self.assertEqual(url, 'https://sudact.ru/regular/doc/new0/')
+        row = self.db.execute('select date, region, judge, article, accused, witness from metadata '
+                              'where document_id=5').fetchone()
+        self.assertEqual(row[:5], ('2017-04-14', 'Кемеровская область', 'Кузнецов А.В.', '161 УК РФ', 'Морозов Е.Е.'))
+        self.assertIn('Свидетель', row[5])
+
+        # новые документы сразу в фильтрах, фасетах, поиске и кэше разборов
+        self.assertEqual(self.db.execute("select document_id from metadata_terms where kind='article' and term='161'"
+                                         ).fetchall(), [(5,)])
+        counts = self.facet_counts()
+        self.assertIn(('year', '2017', 2), counts)
+        with self.db:
+            refresh_facets(self.db)
+        self.assertEqual(self.facet_counts(), counts)
+        self.assertEqual(self.db.execute("select rowid from documents_fts where documents_fts match 'Белов'"
+                                         ).fetchall(), [(4,)])
+        self.assertEqual(ParseCache(cache_path).get(5)['db_id'], 5)
+
+        stats = ingest.run(self.db_path, self.write_jsonl(items), workers=0, out=io.StringIO())
+        self.assertEqual((stats['inserted'], stats['duplicates']), (0, 5))
+
+    @mock.patch('lib.classifier.predict_parts', fake_predict)
+    def test_ingest_directory(self):
+        source = os.path.join(self.tmp_dir.name, 'decisions')
+        os.makedirs(os.path.join(source, '2017'))
+        link = '<link rel="canonical" href="https://sudact.ru/regular/doc/abc/"/>'
+        with open(os.path.join(source, '2017', 'a.html'), 'w', encoding='utf-8') as f:
+            f.write(document_html(NEW_DOCUMENTS[0]).replace('<head>', '<head>' + link))
+        with open(os.path.join(source, 'b.htm'), 'w', encoding='utf-8') as f:
+            f.write('<html><body><p>нет ни шапки, ни разделителей</p></body></html>')
+        with open(os.path.join(source, 'notes.txt'), 'w', encoding='utf-8') as f:
+            f.write('не решение')
+
+        stats = ingest.run(self.db_path, source, workers=2, out=io.StringIO())
+        self.assertEqual((stats['read'], stats['inserted'], stats['failed']), (2, 1, 1))
+        self.assertEqual(self.db.execute('select url from documents where id=4').fetchone(),
+                         ('https://sudact.ru/regular/doc/abc/',))
+        self.assertEqual(self.db.execute('select count(*) from document_hashes').fetchone(), (len(DOCUMENTS) + 1,))
+
+    def test_duplicate_written_meanwhile(self):
+        ingest.prepare(self.db)
+        record = ingest.make_record({'html': document_html(NEW_DOCUMENTS[0])})
+        self.assertFalse(ingest.is_duplicate(self.db, record))
+        # пока документ разбирался, его записал другой процесс
+        other = sqlite3.connect(self.db_path)
+        ingest.write_documents(other, [record], {0: {'metadata': {}, 'parsed': {}}})
+        other.close()
+        written, duplicates = ingest.write_documents(self.db, [record], {0: {'metadata': {}, 'parsed': {}}})
+        self.assertEqual((written, duplicates), ([], 1))
+        self.assertEqual(self.db.execute('select count(*) from documents').fetchone(), (len(DOCUMENTS) + 1,))
+
+    def test_invalid_records(self):
+        with self.assertRaises(ValueError):
+            list(ingest.read_jsonl(['{"html": "<p>текст</p>"}', '{"url": "https://sudact.ru/"}'], 'new.jsonl'))
+        with self.assertRaises(ValueError):
+            list(ingest.read_jsonl(['not json']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+from collections import Counter
+from unittest import mock
+
+import hseling_api_judgment  # noqa: F401
+from lib.classifier import split_sentences
+from lib.document import ParsedDocument
+from lib import metadata_extractor
+from bs4 import BeautifulSoup
+from lib.metadata_extractor import (ALL_REGIONS, FIO1, FIO2, FIO_ABBR, REG_CAPS, find_accused, get_accused_name,
+                                    get_court, get_first, get_metadict, get_region, is_with_region, key2city,
+                                    preprocess_region, resolve_court, splitting_text)
+from sudact_fixture import DOCUMENTS, document_html
+
+
+class MetadictTestCase(unittest.TestCase):
+
+    def test_fixture_documents(self):
+        for doc in DOCUMENTS:
+            metadict = get_metadict(document_html(doc))
+            self.assertEqual(metadict['date'], doc['iso_date'])
+            self.assertEqual(metadict['number'], doc['number'])
+            self.assertEqual(metadict['court'], doc['court'])
+            self.assertEqual(metadict['region'], doc['region'])
+            self.assertEqual(metadict['judge'], doc['judge'])
+            self.assertEqual(metadict['accused'], [doc['accused']])
+
+    def test_shared_document(self):
+        for doc in DOCUMENTS:
+            html = document_html(doc)
+            expected = get_metadict(html), split_sentences(html)
+            for parser in ('html.parser', 'lxml'):
+                parsed = ParsedDocument(html, parser)
+                sentences = split_sentences(parsed)
+                self.assertEqual((get_metadict(parsed), sentences), expected)
+
+
+class NamesFallbackTestCase(unittest.TestCase):
+    """запасной поиск обвиняемых наташей: когда срабатывает, запоминание и выключатель"""
+
+    def setUp(self):
+        # обвиняемый в нижнем регистре: регулярные выражения его не находят
+        self.html = document_html(dict(DOCUMENTS[0], accused='сидорова семена семеновича'))
+        patcher = mock.patch.dict(metadata_extractor.NAMES_FALLBACK, enabled=True, budget=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fallback_is_counted_and_memoized(self):
+        stats = Counter()
+        self.assertEqual(get_accused_name(self.html, stats), ['С.С. Сидоров'])
+        self.assertEqual((stats['names_documents'], stats['names_fallback_documents'], stats['names_fallback_lines']),
+                         (1, 1, 1))
+        self.assertEqual(get_accused_name(document_html(DOCUMENTS[1]), stats), [DOCUMENTS[1]['accused']])
+        self.assertEqual((stats['names_documents'], stats['names_fallback_documents']), (2, 1))
+
+        hits = metadata_extractor.names_fallback_stats()['memo_hits']
+        self.assertEqual(get_accused_name(self.html), ['С.С. Сидоров'])
+        self.assertEqual(metadata_extractor.names_fallback_stats()['memo_hits'], hits + 1)
+
+    def test_disabled(self):
+        metadata_extractor.configure_names_fallback(enabled=False)
+        stats = Counter()
+        self.assertEqual(get_accused_name(self.html, stats), 'нет информации')
+        self.assertEqual((stats['names_fallback_lines'], stats['names_fallback_skipped']), (0, 1))
+        self.assertEqual(metadata_extractor.names_fallback_tag(), 'names-off')
+
+
+def legacy_get_region(raw_region):
+    """get_region до индексов: перебор списков"""
+    region = raw_region.strip()
+    if region in ALL_REGIONS:
+        return region
+    for reg in ALL_REGIONS:
+        if region.lower() == reg.lower():
+            return reg
+    for key in key2city:
+        if key in region.lower():
+            return key2city[key]
+    region = preprocess_region(region)
+    if region in ALL_REGIONS:
+        return region
+    return "Регион не определен"
+
+
+class RegionIndexTestCase(unittest.TestCase):
+
+    def test_get_region_matches_lookup_by_lists(self):
+        raw = ['Кемеровская область', ' кемеровская ОБЛАСТЬ ', 'Кемеровской области', 'Алтайского края',
+               'г. Санкт-Петербург', 'Республика Саха (Якутия)', 'Северная Осетия', 'город Москва', 'ХМАО - Югра',
+               'АС Томской области', 'Нарния', '']
+        raw += ALL_REGIONS + [region.upper() for region in ALL_REGIONS]
+        for region in raw:
+            self.assertEqual(get_region(region), legacy_get_region(region), region)
+        self.assertTrue(is_with_region('Томская ОБЛАСТЬ'))
+        self.assertFalse(is_with_region('г. Томск'))
+
+    def test_court_lookup(self):
+        html = '''<div class="b-justice wide">Не тот суд</div>
+        <div class="b-justice">Первый суд</div>
+        <div class="b-justice"><a href="/court/">Советский районный суд г. Томска - Уголовное</a></div>'''
+        self.assertEqual(get_court(BeautifulSoup(html, 'html.parser')), 'Советский районный суд г. Томска')
+        self.assertEqual(get_court(BeautifulSoup('<div>нет суда</div>', 'html.parser')), 'undefined')
+
+        resolve_court.cache_clear()
+        for doc in DOCUMENTS:
+            self.assertEqual(get_metadict(document_html(doc))['region'], doc['region'])
+        self.assertEqual(resolve_court.cache_info().currsize, 2)
+
+
+def legacy_splitting_text(header_lines):
+    """splitting_text до общего поиска имен: каждый шаблон заново на каждой проверке"""
+    text = "\n".join(header_lines)
+    lines = [line for line in text.split(",") if line.strip()]
+    if any(len(FIO1.findall(line) + FIO2.findall(line)) > 1 for line in lines):
+        lines = [line for line in text.split("\n") if line.strip()]
+    new_lines = []
+    for line in lines:
+        if len(FIO1.findall(line) + FIO2.findall(line)) > 2:
+            new_lines += line.split(",")
+        else:
+            new_lines.append(line)
+    return new_lines
+
+
+def legacy_find_accused(line):
+    return [x.title() for x in FIO1.findall(line)] + [x.title() for x in FIO2.findall(line)] \
+        + FIO_ABBR.findall(line) + REG_CAPS.findall(line)
+
+
+class NameHitsTestCase(unittest.TestCase):
+    """общий поиск имен дает то же, что отдельные findall по каждому шаблону"""
+
+    # пересекающиеся совпадения разных шаблонов, несколько имен в строке, ФИО-сокращения и капс
+    LINES = [
+        'в отношении А.Б. Иванов В.Г. и ПЕТРОВ ИВАН ИВАНОВИЧ, Сидоров ФИО12, Кузнецов АБ',
+        'подсудимых Волков Д.Д., Зайцев К.К., Орлова Н.П., защитника Смирнов Б.Б.',
+        'при секретаре Петровой Е.В.\nв отношении ФИО3 и Сидоров С. С,',
+        'без имен',
+    ]
+
+    def corpus(self):
+        headers = [get_first(document_html(doc)) for doc in DOCUMENTS]
+        return headers + [[line] for line in self.LINES] + [self.LINES]
+
+    def test_splitting_text(self):
+        for header in self.corpus():
+            with self.subTest(header=header[:1]):
+                self.assertEqual(splitting_text(header), legacy_splitting_text(header))
+
+    def test_find_accused(self):
+        for header in self.corpus():
+            for line in legacy_splitting_text(header):
+                self.assertEqual(find_accused(line), legacy_find_accused(line))
+
+
+if __name__ == '__main__':
+    unittest.main()
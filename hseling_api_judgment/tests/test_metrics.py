@@ -0,0 +1,64 @@
+import unittest
+from unittest import mock
+
+from lib import metrics
+from lib.metrics import Registry, profiling, server_timing, timed, timer
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(metrics, 'REGISTRY', Registry(buckets=(.1, 1.)))
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_timers_and_profile(self):
+        @timed('work')
+        def work():
+            return 42
+
+        with profiling() as profile:
+            self.assertEqual(work(), 42)
+            with timer('sql'):
+                pass
+        work()
+        self.assertEqual(set(profile), {'work', 'sql'})
+        self.assertEqual(self.registry.calls, {'work': 2, 'sql': 1})
+        self.assertTrue(server_timing(profile, total=.5).endswith('total;dur=500.00'))
+
+    def test_disabled(self):
+        with mock.patch.object(metrics, 'ENABLED', False):
+            with timer('soup'):
+                pass
+            metrics.increment('documents_parsed')
+            with profiling() as profile, timer('soup'):
+                pass
+        self.assertEqual(self.registry.calls, {})
+        self.assertEqual(self.registry.counters, {})
+        self.assertEqual(list(profile), ['soup'])
+
+    def test_render(self):
+        self.registry.observe('metadata.judge', .25)
+        self.registry.increment('documents_parsed', 3)
+        for elapsed in (.05, .5, 5.):
+            self.registry.observe_request('parse_doc', 200, elapsed)
+        text = self.registry.render({'db_pool': {'borrowed': 7, 'journal_mode': 'wal', 'ready': True}})
+        expected = [
+            'judgment_stage_seconds_sum{stage="metadata.judge"} 0.250000',
+            'judgment_stage_seconds_count{stage="metadata.judge"} 1',
+            'judgment_events_total{name="documents_parsed"} 3',
+            'judgment_request_seconds_bucket{endpoint="parse_doc",status="200",le="0.1"} 1',
+            'judgment_request_seconds_bucket{endpoint="parse_doc",status="200",le="1.0"} 2',
+            'judgment_request_seconds_bucket{endpoint="parse_doc",status="200",le="+Inf"} 3',
+            'judgment_request_seconds_count{endpoint="parse_doc",status="200"} 3',
+            'judgment_db_pool_borrowed 7',
+            'judgment_db_pool_ready 1',
+        ]
+        lines = text.splitlines()
+        for line in expected:
+            self.assertIn(line, lines)
+        self.assertNotIn('journal_mode', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
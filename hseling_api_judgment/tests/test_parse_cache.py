@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import hseling_api_judgment  # noqa: F401
+from lib import document
+from lib.parse_cache import ParseCache, pipeline_version
+
+
+class ParseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'cache.sqlite')
+        self.cache = ParseCache(self.db_path, maxsize=2)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_miss_then_hit(self):
+        self.assertIsNone(self.cache.get(1))
+        self.cache.put(1, {'db_id': 1, 'parsed': {'fabula': ['текст']}})
+        self.assertEqual(self.cache.get(1)['parsed']['fabula'], ['текст'])
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_lru_is_bounded_and_backed_by_disk(self):
+        self.cache.put_many([(i, {'db_id': i}) for i in range(5)])
+        self.assertEqual(self.cache.stats()['size'], 2)
+        self.assertEqual(self.cache.get(0), {'db_id': 0})
+        self.assertEqual(self.cache.stats()['disk_hits'], 1)
+
+        other_process = ParseCache(self.db_path)
+        self.assertEqual(other_process.get(3), {'db_id': 3})
+
+    def test_get_many(self):
+        self.cache.put_many([(i, {'db_id': i}) for i in range(4)])
+        self.cache.clear_memory()
+        self.cache.get(0)
+        self.assertEqual(self.cache.get_many([0, 1, 3, 7]), {0: {'db_id': 0}, 1: {'db_id': 1}, 3: {'db_id': 3}})
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['disk_hits'], stats['misses']), (1, 3, 1))
+
+    def test_version_invalidates(self):
+        self.cache.put(1, {'db_id': 1}, version='old')
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(self.cache.purge_stale(), 1)
+
+    def test_pipeline_version_tracks_files(self):
+        filename = os.path.join(self.tmp_dir.name, 'extractor.py')
+        with open(filename, 'w') as f:
+            f.write('A = 1\n')
+        version = pipeline_version([filename])
+        self.assertEqual(version, pipeline_version([filename]))
+        with open(filename, 'w') as f:
+            f.write('A = 22\n')
+        self.assertNotEqual(version, pipeline_version([filename]))
+
+    def test_pipeline_version_tracks_parser(self):
+        version = pipeline_version()
+        with mock.patch('lib.document.HTML_PARSER', 'lxml' if document.HTML_PARSER != 'lxml' else 'html.parser'):
+            self.assertNotEqual(version, pipeline_version())
+        self.assertEqual(version, pipeline_version())
+
+
+if __name__ == '__main__':
+    unittest.main()
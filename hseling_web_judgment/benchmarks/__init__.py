@@ -0,0 +1,6 @@
+"""
+замеры производительности веб-интерфейса
+
+запуск из каталога hseling_web_judgment, например:
+    python -m benchmarks.search_page
+"""
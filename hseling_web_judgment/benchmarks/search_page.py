@@ -0,0 +1,102 @@
+"""
+время отрисовки страницы /search против локальной заглушки API с заданной задержкой ответа
+
+сравниваются:
+- sequential -- как было: /regions/ и /documents/ по очереди, новое соединение на каждый запрос
+- pooled -- views.search: общая keep-alive сессия, запросы параллельно, регионы из кэша
+
+    python -m benchmarks.search_page --latency 20 --repeat 50
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DOCUMENT = {'id': 1, 'header': 'Приговор № 1-101/2015 от 11 июля 2015 г.', 'url': 'https://sudact.ru/',
+            'date': '2015-07-11', 'number': '1-101/2015', 'court': 'Ленинский районный суд г. Кемерово',
+            'region': 'Кемеровская область', 'judge': 'Кузнецов А.В.', 'article': '158', 'accused': 'Сидоров С.С.',
+            'fabula': 'фабула', 'witness': 'показания', 'prove': 'доказательства', 'meditation': 'размышления'}
+REGIONS = [f'Регион {i}' for i in range(85)]
+
+
+def start_stub(latency):
+    """заглушка API на свободном порту: /regions/ и /documents/, каждый ответ через latency секунд"""
+    documents = json.dumps({'page_num': 1, 'pages': 10, 'documents': [DOCUMENT] * 50}, ensure_ascii=False).encode()
+    regions = json.dumps(REGIONS, ensure_ascii=False).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # заголовки и тело уходят разными пакетами: без этого keep-alive упирается в задержку ACK
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = regions if self.path.startswith('/regions/') else documents
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), max(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=20, help='задержка ответа заглушки, мс')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    server = start_stub(args.latency / 1000)
+    os.environ['HSELING_API_ROOT'] = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web.settings')
+    os.environ.setdefault('DJANGO_SECRET_KEY', 'benchmark')
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    import django
+    django.setup()
+    import requests
+    from django.shortcuts import render
+    from django.test import RequestFactory
+    from web import api, views
+
+    request = RequestFactory().get('/search', {'region': 'Регион 1', 'judge': 'Кузнецов'})
+    root = os.environ['HSELING_API_ROOT']
+
+    def sequential():
+        regions = requests.get(f'{root}/regions/').json()
+        params = {'region': 'Регион 1', 'judge': 'Кузнецов', 'year': '%', 'article': '', 'page_num': 1}
+        data = requests.get(f'{root}/documents/', params=params).json()
+        return render(request, 'search.html', {'regions': regions, 'documents': data['documents'], 'pages': []})
+
+    print('mode\tmedian_ms\tmax_ms')
+    for name, fn in [('sequential', sequential), ('pooled', lambda: views.search(request))]:
+        api.clear_cache()
+        fn()  # прогрев: шаблоны, соединения, кэш регионов
+        median, worst = measure(fn, args.repeat)
+        print(f'{name}\t{median:.2f}\t{worst:.2f}')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+клиент API судебной практики для представлений
+
+- одна на процесс сессия requests: соединения с API переиспользуются (keep-alive)
+- у каждого запроса есть таймаут, зависший API не держит поток сервера бесконечно
+- независимые запросы страницы выполняются параллельно в пуле потоков
+- список регионов меняется только при загрузке новых решений, поэтому кэшируется на REGIONS_TTL секунд
+- разобранные документы хранятся вместе с ETag и перезапрашиваются условным GET (API отвечает 304)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HSELING_API_ROOT = os.environ['HSELING_API_ROOT']
+
+# (подключение, чтение) в секундах
+TIMEOUT = (float(os.environ.get('HSELING_API_CONNECT_TIMEOUT', 3)),
+           float(os.environ.get('HSELING_API_READ_TIMEOUT', 30)))
+POOL_SIZE = int(os.environ.get('HSELING_API_POOL_SIZE', 16))
+REGIONS_TTL = int(os.environ.get('REGIONS_TTL', 600))
+DOCUMENTS_CACHE_SIZE = int(os.environ.get('DOCUMENTS_CACHE_SIZE', 256))
+
+_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix='api')
+_regions = {'value': None, 'expires': 0.}
+_regions_lock = threading.Lock()
+_documents = OrderedDict()
+_documents_lock = threading.Lock()
+
+
+def make_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+SESSION = make_session()
+
+
+def get(path, **kwargs):
+    """GET к API; ошибки HTTP превращаются в исключения requests"""
+    kwargs.setdefault('timeout', TIMEOUT)
+    response = SESSION.get(HSELING_API_ROOT + path, **kwargs)
+    response.raise_for_status()
+    return response
+
+
+def post(path, **kwargs):
+    kwargs.setdefault('timeout', TIMEOUT)
+    response = SESSION.post(HSELING_API_ROOT + path, **kwargs)
+    response.raise_for_status()
+    return response
+
+
+def get_json(path, params=None):
+    return get(path, params=params).json()
+
+
+def submit(fn, *args, **kwargs):
+    """запускаем вызов в пуле потоков, результат -- future.result()"""
+    return _executor.submit(fn, *args, **kwargs)
+
+
+def get_regions():
+    """список регионов из кэша; по истечении TTL перезапрашивается одним потоком"""
+    if _regions['value'] is not None and _regions['expires'] > time.monotonic():
+        return _regions['value']
+    with _regions_lock:
+        if _regions['value'] is None or _regions['expires'] <= time.monotonic():
+            _regions['value'] = get_json('/regions/')
+            _regions['expires'] = time.monotonic() + REGIONS_TTL
+        return _regions['value']
+
+
+def get_json_conditional(path):
+    """GET с If-None-Match по сохраненному ETag: неизмененный ответ API не пересылает заново"""
+    with _documents_lock:
+        cached = _documents.get(path)
+    headers = {'If-None-Match': cached[0]} if cached else {}
+    response = get(path, headers=headers)
+    if response.status_code == 304 and cached:
+        data = cached[1]
+    else:
+        data = response.json()
+    etag = response.headers.get('ETag')
+    with _documents_lock:
+        if etag:
+            _documents[path] = (etag, data)
+            _documents.move_to_end(path)
+            while len(_documents) > DOCUMENTS_CACHE_SIZE:
+                _documents.popitem(last=False)
+    return data
+
+
+def clear_cache():
+    with _regions_lock:
+        _regions['value'], _regions['expires'] = None, 0.
+    with _documents_lock:
+        _documents.clear()
@@ -22,6 +22,7 @@ from . import views
 
 urlpatterns = [
     path('search', views.search, name='search'),
+    path('export', views.export, name='export'),
     path(r'doc<int:doc_id>', views.doc, name='doc'),
     path('', views.home, name='home'),
     path('home', views.home, name='home'),
@@ -1,11 +1,10 @@
 from urllib.parse import urlencode
 
 from django.http import HttpResponse, HttpRequest
-from django.shortcuts import render
-import requests
-import os
+from django.shortcuts import redirect, render
 
-HSELING_API_ROOT = os.environ['HSELING_API_ROOT']
+from . import api
+from .api import HSELING_API_ROOT
 
 
 def update_page_num(params: dict, page_num: int):
@@ -16,9 +15,6 @@ def update_page_num(params: dict, page_num: int):
 
 # @csrf_exempt
 def search(req: HttpRequest):
-    regions = requests.get(f'{HSELING_API_ROOT}/regions/').json()
-
-
     selected_region = req.GET.get('region') or '%'
     judge = req.GET.get('judge', '')
     article = req.GET.get('article', '')
@@ -33,7 +29,10 @@ def search(req: HttpRequest):
         'page_num': page_num
     }
 
-    data = requests.get(f'{HSELING_API_ROOT}/documents/', params=params).json()
+    # регионы (обычно из кэша) и документы запрашиваем одновременно
+    regions = api.submit(api.get_regions)
+    data = api.get_json('/documents/', params)
+    regions = regions.result()
     documents = data['documents']
 
     page_num = data['page_num']
@@ -45,15 +44,23 @@ def search(req: HttpRequest):
     if page_num > 4:
         pages = [pages[0], ('...', None)] + pages[page_num-3:]
 
-    download_link = f'{HSELING_API_ROOT}/documents/download?' + urlencode(params)
+    download_link = 'export?' + urlencode(params)
 
     return render(req, 'search.html', {'regions': regions, 'selected_region': selected_region, 'judge': judge,
                                        'year': year, 'article': article, 'documents': documents, 'pages': pages,
                                        'download_link': download_link})
 
 
+def export(req: HttpRequest):
+    # выгрузка строится на API в фоне; страница обновляется, пока файл не будет готов
+    job = api.post('/exports', data=req.GET.dict()).json()
+    if job['status'] == 'done':
+        return redirect(f"{HSELING_API_ROOT}{job['file_url']}")
+    return render(req, 'export.html', {'job': job})
+
+
 def doc(req: HttpRequest, doc_id: int):
-    data = requests.get(f'{HSELING_API_ROOT}/documents/{doc_id}').json()
+    data = api.get_json_conditional(f'/documents/{doc_id}')
     metadata_titles = [
         ["article", 'статья'],
         ["region", 'регион'],